@@ -0,0 +1,438 @@
+import asyncio
+import json
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+
+import aiohttp
+
+from main import CHAT_PATH, GenerationCancelled, OllamaChat, as_chat_reply, cacheable
+from utils.async_transport import AsyncHttpTransport, is_retryable
+from utils.scheduler import FairScheduler
+from utils.singleflight import AsyncSingleFlight, Detached
+
+
+class AsyncOllamaChat(OllamaChat):
+    """
+    asyncio counterpart of OllamaChat
+
+    Config loading, payloads, caching and history handling are inherited;
+    only the network I/O is asynchronous. Call ``check_server()`` once before
+    use, since the blocking startup probe is skipped.
+    """
+
+    def __init__(self, config_path: str = "config.toml"):
+        super().__init__(config_path)
+        self.async_transport = AsyncHttpTransport.from_config(self.config["api"])
+        self.inflight = AsyncSingleFlight()
+        # Optional limit on concurrent requests: a semaphore or FairScheduler.for_user()
+        self.limiter = None
+        # Loop that summary requests are handed back to; see _build_messages_async
+        self._summary_loop = None
+
+    def _apply_config(self):
+        super()._apply_config()
+        self.async_transport.configure(self.config["api"])
+
+    def _check_server(self):
+        # The probe is async; see check_server()
+        pass
+
+    def _is_backend_failure(self, error: Exception) -> bool:
+        return is_retryable(error) or super()._is_backend_failure(error)
+
+    def cancel(self):
+        """Stop the reply being generated; see ``OllamaChat.cancel``"""
+        self._cancelled.set()
+        for response in list(self._open_streams):
+            response.close()
+
+    async def check_server(self):
+        """Raise if no Ollama server can be reached, then keep probing in the background"""
+        if not await asyncio.to_thread(self.router.probe_all):
+            self.logger.error("Ollama server is not running. Please start it with 'ollama serve'")
+            raise aiohttp.ClientConnectionError("No Ollama server is reachable")
+        self.router.start_probes()
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Wait for a request slot; yields the time spent waiting"""
+        if self.limiter is None:
+            yield 0.0
+            return
+        start = time.perf_counter()
+        async with self.limiter:
+            yield time.perf_counter() - start
+
+    async def _build_messages_async(self, user_input: str) -> list:
+        # History eviction calls the summarizer synchronously, so run it in a
+        # worker thread that hands the summary request back to this loop
+        if self.history.strategy == "summarize":
+            self._summary_loop = asyncio.get_running_loop()
+            return await asyncio.to_thread(self._build_messages, user_input)
+        return self._build_messages(user_input)
+
+    def _summarize(self, summary: str, messages: list) -> str:
+        # Runs in the worker thread started by _build_messages_async
+        request = self._make_request(self._summary_request(summary, messages))
+        response = asyncio.run_coroutine_threadsafe(request, self._summary_loop).result()
+        return response["message"]["content"]
+
+    async def _semantic_lookup_async(self, messages: list) -> Optional[Dict[str, Any]]:
+        # Embedding is a blocking request, so keep it off the event loop
+        if self.semantic_cache is None:
+            return None
+        return await asyncio.to_thread(self._semantic_lookup, messages)
+
+    async def _make_request(self, messages: list, user_input: Optional[str] = None) -> Dict[str, Any]:
+        """Make a request to the Ollama API; ``user_input`` marks a conversation turn"""
+        start = time.perf_counter()
+        queue_wait = 0.0
+        try:
+            payload = self._build_payload(messages)
+            cache_key = self._cache_key(payload)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self._record_metrics(start, cached=True)
+                    return cached
+
+            request, path = self._upstream_request(payload, user_input)
+            flight = self._flight_key(payload)
+            if flight is None:
+                (result, retries, queue_wait), coalesced = await self._post(request, path), False
+            else:
+                owner = self._detached()
+                (result, retries, queue_wait), coalesced = await self.inflight.do(
+                    flight, lambda: owner._post(request, path), self._cancelled
+                )
+            if coalesced:
+                retries = 0
+            self._record_metrics(start, result, queue_wait=queue_wait, retries=retries,
+                                 coalesced=coalesced)
+            if cache_key is not None and not coalesced:
+                self.cache.put(cache_key, cacheable(result))
+            return result
+        except Detached as e:
+            # Cancelled while waiting on another conversation's request
+            self._record_metrics(start, queue_wait=queue_wait, cancelled=True)
+            raise GenerationCancelled() from e
+        except GenerationCancelled:
+            self._record_metrics(start, queue_wait=queue_wait, cancelled=True)
+            raise
+        except aiohttp.ClientError as e:
+            self._record_metrics(start, queue_wait=queue_wait, error=True)
+            self.logger.error(f"API request failed: {str(e)}")
+            raise
+
+    async def _post(self, payload: Dict[str, Any], path: str = CHAT_PATH) -> Tuple[Dict[str, Any], int, float]:
+        """
+        Send a request for a complete reply; returns the reply, retry count and queue wait
+
+        Streamed and assembled here so that ``cancel()`` can stop it, as in OllamaChat._post.
+        """
+        upstream = {}
+        parts = []
+        final = None
+        async for chunk in self._stream_chunks(dict(payload, stream=True), upstream, path):
+            parts.append(chunk.get("message", {}).get("content", ""))
+            if chunk.get("done"):
+                final = chunk
+        if final is None:
+            raise RuntimeError("Stream ended before the response was complete")
+        result = dict(final, message={"role": "assistant", "content": "".join(parts)})
+        return result, upstream["retries"], upstream["queue_wait"]
+
+    async def _stream_chunks(self, payload: Dict[str, Any], upstream: Dict[str, Any],
+                             path: str = CHAT_PATH) -> AsyncIterator[Dict[str, Any]]:
+        """Open a streaming request under a request slot and yield its decoded chunks"""
+        cancelled = self._cancelled
+        async with self._slot() as queue_wait:
+            upstream["queue_wait"] = queue_wait
+            if cancelled.is_set():
+                raise GenerationCancelled()
+            tried = []
+            while True:
+                response = None
+                try:
+                    with self.router.route(self._affinity(), exclude=tried) as backend:
+                        tried.append(backend)
+                        try:
+                            # Fail over to another backend straight away rather than retrying this one
+                            response = await self.async_transport.post(
+                                backend.url + path, json=payload, retry=not self.router.can_fail_over(tried)
+                            )
+                        except aiohttp.ClientError as e:
+                            self.logger.error(f"API request failed: {str(e)}")
+                            raise
+                        upstream["retries"] = response.retries
+                        self._open_streams.add(response)
+                        try:
+                            async with response:
+                                if cancelled.is_set():
+                                    raise GenerationCancelled()
+                                # Read to the end of the body so the connection can be reused
+                                async for line in response.content:
+                                    if not line.strip():
+                                        continue
+                                    chunk = as_chat_reply(json.loads(line))
+                                    if "error" in chunk:
+                                        raise RuntimeError(chunk["error"])
+                                    if chunk.get("done"):
+                                        self.residency.observe(backend.url, payload["model"], chunk)
+                                    yield chunk
+                                if cancelled.is_set():
+                                    raise GenerationCancelled()
+                        except Exception as e:
+                            if cancelled.is_set() and not isinstance(e, GenerationCancelled):
+                                raise GenerationCancelled() from e
+                            raise
+                        finally:
+                            self._open_streams.discard(response)
+                    return
+                except Exception as e:
+                    # Only a request that got no response at all can be sent elsewhere
+                    if response is not None or cancelled.is_set() or not self.router.failover(e, tried):
+                        raise
+                    self.logger.warning(f"Request to {tried[-1].url} failed: {str(e)}; trying another backend")
+
+    async def chat(self, user_input: str) -> str:
+        """
+        Send a message to the model and get a response
+
+        Args:
+            user_input (str): The user's input message
+
+        Returns:
+            str: The model's response
+
+        Raises:
+            GenerationCancelled: If ``cancel()`` was called before the reply was complete
+        """
+        start = time.perf_counter()
+        self._begin_turn()
+        messages = await self._build_messages_async(user_input)
+        semantic = await self._semantic_lookup_async(messages)
+        if semantic is not None and "response" in semantic:
+            self._record_metrics(start, cached=True)
+            self._record_turn(user_input, semantic["response"])
+            return semantic["response"]
+
+        try:
+            response = await self._make_request(messages, user_input)
+            assistant_message = response["message"]["content"]
+            self._record_turn(user_input, assistant_message)
+            self._finish_turn(response)
+            self._semantic_store(messages, semantic, assistant_message)
+            return assistant_message
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            self.logger.error(f"Chat failed: {str(e)}")
+            self._drop_context()
+            return f"An error occurred: {str(e)}"
+
+    async def chat_stream(self, user_input: str) -> AsyncIterator[str]:
+        """
+        Send a message to the model and yield the response as it is generated
+
+        As with ``OllamaChat.chat_stream`` the exchange is only added to the
+        history once the final ``done`` chunk arrives.
+
+        Args:
+            user_input (str): The user's input message
+
+        Yields:
+            str: Incremental pieces of the model's response
+
+        Raises:
+            GenerationCancelled: If ``cancel()`` was called; closing the
+                generator early also stops the generation
+        """
+        start = time.perf_counter()
+        turn = self._begin_turn()
+        messages = await self._build_messages_async(user_input)
+        payload = self._build_payload(messages, stream=True)
+
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_metrics(start, cached=True)
+                assistant_message = cached["message"]["content"]
+                yield assistant_message
+                self._record_turn(user_input, assistant_message)
+                return
+
+        semantic = await self._semantic_lookup_async(messages)
+        if semantic is not None and "response" in semantic:
+            self._record_metrics(start, cached=True)
+            yield semantic["response"]
+            self._record_turn(user_input, semantic["response"])
+            return
+
+        upstream = {}
+        request, path = self._upstream_request(payload, user_input)
+        flight = self._flight_key(payload)
+        if flight is None:
+            chunks, coalesced = self._stream_chunks(request, upstream, path), False
+        else:
+            owner = self._detached()
+            chunks, coalesced = self.inflight.stream(
+                flight, lambda: owner._stream_chunks(request, upstream, path), turn
+            )
+
+        parts = []
+        ttft = None
+        final = None
+        try:
+            async for chunk in chunks:
+                delta = chunk.get("message", {}).get("content", "")
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta)
+                    yield delta
+                if chunk.get("done"):
+                    final = chunk
+            # A coalesced stream may run to the end after this conversation was cancelled
+            if turn.is_set():
+                raise GenerationCancelled()
+            if final is None:
+                raise RuntimeError("Stream ended before the response was complete")
+        except Exception as e:
+            queue_wait = upstream.get("queue_wait", 0.0)
+            if turn.is_set():
+                self._record_metrics(start, ttft=ttft, queue_wait=queue_wait, cancelled=True)
+                self.logger.info("Reply cancelled; the partial turn was discarded")
+                if isinstance(e, GenerationCancelled):
+                    raise
+                raise GenerationCancelled() from e
+            self._record_metrics(start, ttft=ttft, queue_wait=queue_wait, error=True)
+            self._drop_context()
+            raise
+        except BaseException:
+            # The caller stopped reading, or the task was cancelled
+            self._record_metrics(start, ttft=ttft, queue_wait=upstream.get("queue_wait", 0.0),
+                                 cancelled=True)
+            raise
+        finally:
+            await chunks.aclose()
+
+        self._record_metrics(start, final, ttft=ttft, queue_wait=upstream.get("queue_wait", 0.0),
+                             retries=upstream.get("retries", 0), coalesced=coalesced)
+        assistant_message = "".join(parts)
+        self._record_turn(user_input, assistant_message)
+        self._finish_turn(final)
+        self._semantic_store(messages, semantic, assistant_message)
+        if cache_key is not None and not coalesced:
+            # Copy: coalesced waiters are still reading the shared final chunk
+            self.cache.put(cache_key, dict(cacheable(final), message={"role": "assistant",
+                                                                      "content": assistant_message}))
+
+    async def close(self):
+        await self.async_transport.close()
+
+    async def __aenter__(self) -> "AsyncOllamaChat":
+        await self.check_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class ChatSessionManager:
+    """
+    Run many independent conversations on one AsyncOllamaChat
+
+    Every session has its own history, while the connection pool, cache and
+    a global limit on in-flight requests to Ollama are shared. Requests over
+    the limit are queued fairly per user (by default, per session).
+    """
+
+    def __init__(self, client: AsyncOllamaChat, max_in_flight: Optional[int] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        if scheduler is None:
+            if max_in_flight is None:
+                # The limit is per backend; the router spreads the slots so none gets more
+                max_in_flight = client.config.api.max_in_flight * len(client.router.backends)
+            scheduler = FairScheduler(max_in_flight)
+        self.client = client
+        self.scheduler = scheduler
+        self.client.limiter = scheduler.for_user(None)
+        self.sessions: Dict[str, AsyncOllamaChat] = {}
+
+    def session(self, session_id: str, user: Optional[str] = None) -> AsyncOllamaChat:
+        """Return the conversation for ``session_id``, creating it if needed"""
+        conversation = self.sessions.get(session_id)
+        if conversation is None:
+            conversation = self.client.new_conversation()
+            conversation.limiter = self.scheduler.for_user(session_id if user is None else user)
+            self.sessions[session_id] = conversation
+        return conversation
+
+    async def chat(self, session_id: str, user_input: str) -> str:
+        return await self.session(session_id).chat(user_input)
+
+    def chat_stream(self, session_id: str, user_input: str) -> AsyncIterator[str]:
+        return self.session(session_id).chat_stream(user_input)
+
+    async def chat_many(self, prompts: Dict[str, str]) -> Dict[str, str]:
+        """
+        Send one message to each of several sessions concurrently
+
+        Args:
+            prompts (dict): Mapping of session id to user input
+
+        Returns:
+            dict: Mapping of session id to the model's response
+        """
+        session_ids = list(prompts)
+        responses = await asyncio.gather(
+            *(self.chat(session_id, prompts[session_id]) for session_id in session_ids)
+        )
+        return dict(zip(session_ids, responses))
+
+    def cancel(self, session_id: str) -> bool:
+        """Stop the reply being generated for a session; False if there is no such session"""
+        conversation = self.sessions.get(session_id)
+        if conversation is None:
+            return False
+        conversation.cancel()
+        return True
+
+    def close_session(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"sessions": len(self.sessions)}
+        stats.update(self.scheduler.stats())
+        stats.update(self.client.router.stats())
+        stats["residency"] = self.client.residency.stats()
+        return stats
+
+
+async def _repl():
+    async with AsyncOllamaChat() as client:
+        manager = ChatSessionManager(client)
+        print("Async chat initialized. Type 'quit' to exit.")
+        while True:
+            user_input = (await asyncio.to_thread(input, "\nYou: ")).strip()
+            if user_input.lower() == "quit":
+                break
+            if user_input:
+                print("\nAssistant: ", end="", flush=True)
+                async for token in manager.chat_stream("default", user_input):
+                    print(token, end="", flush=True)
+                print()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_repl())
+    except KeyboardInterrupt:
+        print("\nExiting chat...")
+    except Exception as e:
+        print(f"Failed to initialize chat: {str(e)}")
+        sys.exit(1)
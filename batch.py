@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, Set
+
+from main import OllamaChat
+
+logger = logging.getLogger(__name__)
+
+
+def iter_records(path: str, id_field: str) -> Iterator[Dict[str, Any]]:
+    """Yield JSON records from a JSONL file one line at a time"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid JSON on line {line_number}: {str(e)}")
+                continue
+            if id_field not in record:
+                record[id_field] = f"line-{line_number}"
+            yield record
+
+
+def completed_ids(path: str, id_field: str) -> Set[str]:
+    """Return the ids that already have a successful result in ``path``"""
+    done = set()
+    if not Path(path).exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if "error" not in result and id_field in result:
+                done.add(str(result[id_field]))
+    return done
+
+
+def extract_prompt(record: Dict[str, Any], prompt_field: str) -> Optional[str]:
+    """Find the prompt in a record, falling back to ``title`` and ``body``"""
+    if prompt_field in record:
+        return str(record[prompt_field])
+    parts = [str(record[key]) for key in ("title", "body") if record.get(key)]
+    return "\n\n".join(parts) if parts else None
+
+
+class BatchRunner:
+    """Run JSONL prompts through OllamaChat with bounded concurrency"""
+
+    def __init__(self, client: OllamaChat, output_path: str, concurrency: int = 4,
+                 id_field: str = "id", prompt_field: str = "prompt"):
+        self.client = client
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.id_field = id_field
+        self.prompt_field = prompt_field
+        self._write_lock = threading.Lock()
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _run_one(self, record: Dict[str, Any], out):
+        record_id = record[self.id_field]
+        result = {self.id_field: record_id}
+        prompt = extract_prompt(record, self.prompt_field)
+        start = time.perf_counter()
+        try:
+            if prompt is None:
+                raise ValueError(f"Record has no '{self.prompt_field}' field")
+            response = self.client.complete(prompt)
+            result.update({
+                "response": response["message"]["content"],
+                "prompt_tokens": response.get("prompt_eval_count"),
+                "completion_tokens": response.get("eval_count"),
+            })
+        except Exception as e:
+            result["error"] = str(e)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        with self._write_lock:
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in result:
+                self.failed += 1
+                logger.error(f"{record_id} failed: {result['error']}")
+            else:
+                self.succeeded += 1
+
+    def run(self, input_path: str) -> Dict[str, int]:
+        """
+        Process every pending record in ``input_path``
+
+        Records whose id already has a successful result in the output file
+        are skipped, so an interrupted run can simply be started again.
+
+        Returns:
+            dict: Counts of succeeded, failed and skipped records
+        """
+        done = completed_ids(self.output_path, self.id_field)
+        with open(self.output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for record in iter_records(input_path, self.id_field):
+                if str(record[self.id_field]) in done:
+                    self.skipped += 1
+                    continue
+                # Bound the number of queued records so the input is never fully materialized
+                if len(pending) >= self.concurrency * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(pool.submit(self._run_one, record, out))
+            wait(pending)
+
+        return {"succeeded": self.succeeded, "failed": self.failed, "skipped": self.skipped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through Ollama")
+    parser.add_argument("input", help="JSONL file with one prompt record per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--id-field", default="id", help="Record field holding the unique id")
+    parser.add_argument("--prompt-field", default="prompt", help="Record field holding the prompt")
+    parser.add_argument("--config", default="config.toml", help="Path to the config file")
+    args = parser.parse_args()
+
+    client = OllamaChat(args.config)
+    runner = BatchRunner(client, args.output, args.concurrency, args.id_field, args.prompt_field)
+    try:
+        counts = runner.run(args.input)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume.")
+        sys.exit(130)
+    print(f"Done: {counts['succeeded']} succeeded, {counts['failed']} failed, "
+          f"{counts['skipped']} already complete")
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+
+EMBED_DIMENSIONS = 64
+
+WORDS = ("the model streams a reply one token at a time so the client can "
+         "show progress while generation is still running").split()
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic bag-of-words vector, so identical wording gives identical embeddings"""
+    vector = [0.0] * EMBED_DIMENSIONS
+    for word in text.lower().split():
+        digest = hashlib.md5(word.strip(".,!?").encode("utf-8")).digest()
+        vector[digest[0] % EMBED_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected, not an error
+        pass
+
+
+class MockOllama:
+    """
+    Local stand-in for the Ollama HTTP API
+
+    Implements ``/``, ``/api/ps``, ``/api/chat``, ``/api/generate``
+    (streaming and non-streaming) and ``/api/embed``, with a configurable
+    token rate, first-token latency and failure injection. Responses carry
+    the same timing fields as Ollama. Models stay loaded for their
+    ``keep_alive`` like in Ollama, and loading one takes ``load_time``.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token_rate: float = 0.0,
+                 latency: float = 0.0, tokens: int = 32, failure_rate: float = 0.0,
+                 failure_status: int = 503, seed: Optional[int] = None,
+                 load_time: float = 0.0):
+        """
+        Args:
+            host (str): Interface to bind
+            port (int): Port to bind; 0 picks a free one
+            token_rate (float): Tokens per second; 0 means as fast as possible
+            latency (float): Seconds before the first token (simulated prompt eval)
+            tokens (int): Tokens per response
+            failure_rate (float): Probability that a request fails
+            failure_status (int): HTTP status used for injected failures
+            seed (int): Seed for the failure injection RNG
+            load_time (float): Seconds to load a model that is not resident
+        """
+        self.token_rate = token_rate
+        self.latency = latency
+        self.tokens = tokens
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.load_time = load_time
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fail_next = 0
+        self.requests = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.loads = 0
+        # Model name -> time.monotonic() at which it is unloaded
+        self.loaded: Dict[str, float] = {}
+
+        self.server = _QuietServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count: int):
+        """Make the next ``count`` API requests fail"""
+        with self._lock:
+            self._fail_next = count
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                fail = True
+            else:
+                fail = self._random.random() < self.failure_rate
+            self.failures += int(fail)
+            return fail
+
+    def _load(self, model: str, keep_alive: Any) -> float:
+        """Make ``model`` resident for ``keep_alive`` seconds; returns the load time"""
+        now = time.monotonic()
+        with self._lock:
+            load = 0.0 if self.loaded.get(model, 0) > now else self.load_time
+            self.loads += int(load > 0)
+            keep_alive = 300 if keep_alive is None else float(keep_alive)
+            self.loaded[model] = float("inf") if keep_alive < 0 else now + load + keep_alive
+        time.sleep(load)
+        return load
+
+    def _unload(self, model: str):
+        with self._lock:
+            self.loaded.pop(model, None)
+
+    def _timings(self, prompt_tokens: int, count: int, load: float = 0.0) -> Dict[str, Any]:
+        eval_seconds = count / self.token_rate if self.token_rate else 0.0
+        return {
+            "total_duration": int((load + self.latency + eval_seconds) * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": count,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Like Ollama's Go server; otherwise Nagle + delayed ACK adds ~40ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, body: Dict[str, Any]):
+                data = (json.dumps(body) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/ps":
+                    now = time.monotonic()
+                    with mock._lock:
+                        models = [{"name": name, "model": name} for name, expires in mock.loaded.items()
+                                  if expires > now]
+                    self._send_json(200, {"models": models})
+                    return
+                data = b"Ollama is running"
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/embed":
+                    inputs = request.get("input", "")
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self._send_json(200, {"model": request.get("model"),
+                                          "embeddings": [fake_embedding(text) for text in inputs]})
+                    return
+                if self.path not in ("/api/chat", "/api/generate"):
+                    self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+                    return
+                if mock._should_fail():
+                    self._send_json(mock.failure_status, {"error": "injected failure"})
+                    return
+
+                chat = self.path == "/api/chat"
+                model = request.get("model")
+                if not chat and not request.get("prompt") and request.get("keep_alive") == 0:
+                    mock._unload(model)
+                    self._send_json(200, {"model": model, "response": "", "done": True,
+                                          "done_reason": "unload"})
+                    return
+                load = mock._load(model, request.get("keep_alive"))
+                if not chat and not request.get("prompt"):
+                    # An empty generate request only loads the model
+                    self._send_json(200, {"model": model, "response": "", "done": True,
+                                          "done_reason": "load", "load_duration": int(load * 1e9)})
+                    return
+                if chat:
+                    prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+                else:
+                    prompt = request.get("prompt", "")
+                prompt_tokens = max(1, len(prompt) // 4)
+                # Like Ollama, stop early at options.num_predict
+                count = min(mock.tokens, (request.get("options") or {}).get("num_predict") or mock.tokens)
+                words = [WORDS[i % len(WORDS)] for i in range(count)]
+                tokens = [words[0]] + [f" {word}" for word in words[1:]]
+                final = {"model": request.get("model"), "done": True, "done_reason": "stop"}
+                final.update(mock._timings(prompt_tokens, count, load))
+                if not chat:
+                    # Token ids are fake, but the context grows like Ollama's does
+                    final["context"] = list(range(len(request.get("context") or []) + prompt_tokens
+                                                  + count))
+
+                def piece(text: str) -> Dict[str, Any]:
+                    if chat:
+                        return {"message": {"role": "assistant", "content": text}}
+                    return {"response": text}
+
+                time.sleep(mock.latency)
+                if not request.get("stream", True):
+                    if mock.token_rate:
+                        time.sleep(count / mock.token_rate)
+                    final.update(piece("".join(tokens)))
+                    self._send_json(200, final)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        chunk = {"model": request.get("model"), "done": False}
+                        chunk.update(piece(token))
+                        self._write_chunk(chunk)
+                        if mock.token_rate:
+                            time.sleep(1 / mock.token_rate)
+                    final.update(piece(""))
+                    self._write_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    with mock._lock:
+                        mock.cancelled += 1
+
+        return Handler
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-ollama",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockOllama":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-rate", type=float, default=30.0, help="Tokens per second (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of a 503")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to load a cold model")
+    args = parser.parse_args()
+
+    mock = MockOllama(args.host, args.port, args.token_rate, args.latency, args.tokens,
+                      args.failure_rate, load_time=args.load_time)
+    print(f"Mock Ollama listening on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any, List
+
+import toml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.mock_ollama import MockOllama  # noqa: E402
+
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def timed(func: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_client(mock: MockOllama, workdir: str, client_class=None, **overrides):
+    """
+    Build a chat client pointed at the mock server with caching and preloading disabled
+
+    ``client_class`` defaults to OllamaChat; ``overrides`` maps config
+    sections to the values to replace in them.
+    """
+    if client_class is None:
+        from main import OllamaChat as client_class
+
+    config = toml.load(ROOT / "config.toml")
+    config["model"]["base_url"] = mock.url
+    config["cache"]["enabled"] = False
+    config.setdefault("residency", {})["preload"] = False
+    config["logging"]["file"] = os.path.join(workdir, "bench.log")
+    config["logging"]["level"] = "ERROR"
+    config.pop("environment", None)
+    for section, values in overrides.items():
+        config.setdefault(section, {}).update(values)
+    path = os.path.join(workdir, f"config-{len(os.listdir(workdir))}.toml")
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return client_class(path)
+
+
+def bench_chat_overhead(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Client-side cost of one chat() turn against an instant server"""
+    with MockOllama(tokens=16) as mock:
+        client = make_client(mock, workdir)
+
+        def turn():
+            client.reset_conversation()
+            client.chat("How are you?")
+
+        timed(turn, 5)  # warm up the connection pool
+        return summarize(timed(turn, repeat))
+
+
+def bench_history_growth(workdir: str, repeat: int) -> Dict[str, Any]:
+    """chat() throughput as the conversation history grows"""
+    results = {}
+    with MockOllama(tokens=16) as mock:
+        client = make_client(mock, workdir, history={"context_tokens": 1_000_000})
+        for turns in (0, 50, 200, 1000):
+            client.reset_conversation()
+            for i in range(turns):
+                client.history.append({"role": "user", "content": f"Question {i} about the topic?"})
+                client.history.append({"role": "assistant", "content": "An answer " * 20})
+            samples = timed(lambda: client.chat("Next question"), repeat)
+            stats = summarize(samples)
+            stats["turns_per_s"] = len(samples) / sum(samples)
+            results[f"history_{turns}"] = stats
+    return results
+
+
+def bench_retries(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Latency of a request that succeeds after two injected 503s"""
+    with MockOllama(tokens=16) as mock:
+        client = make_client(mock, workdir, api={"retry_attempts": 3, "retry_delay": 0.01,
+                                                 "max_retry_delay": 0.05})
+
+        def turn():
+            mock.fail_next(2)
+            client.reset_conversation()
+            client.chat("Retry me")
+
+        stats = summarize(timed(turn, repeat))
+        stats["server_requests"] = mock.requests
+        stats["server_failures"] = mock.failures
+        return stats
+
+
+def bench_streaming_ttft(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Time to first token and total time through chat_stream()"""
+    with MockOllama(tokens=64, token_rate=500, latency=0.02) as mock:
+        client = make_client(mock, workdir)
+        ttfts = []
+        totals = []
+        for _ in range(repeat):
+            client.reset_conversation()
+            start = time.perf_counter()
+            stream = client.chat_stream("Stream please")
+            next(stream)
+            ttfts.append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+            totals.append(time.perf_counter() - start)
+        return {"ttft": summarize(ttfts), "total": summarize(totals),
+                "server_latency_ms": mock.latency * 1000}
+
+
+def bench_context_reuse(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Prompt tokens evaluated per turn with and without reusing the token context"""
+    results = {}
+    with MockOllama(tokens=16) as mock:
+        for reuse in (False, True):
+            client = make_client(mock, workdir, history={"reuse_context": reuse})
+            counts = []
+            samples = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                client.chat(f"Follow-up question {i} about the same topic?")
+                samples.append(time.perf_counter() - start)
+                counts.append(client.last_turn["prompt_eval_count"])
+            stats = summarize(samples)
+            stats["mean_prompt_eval_count"] = statistics.fmean(counts)
+            stats["last_prompt_eval_count"] = counts[-1]
+            results["reuse_context" if reuse else "full_history"] = stats
+    return results
+
+
+def bench_first_turn(workdir: str, repeat: int) -> Dict[str, Any]:
+    """First chat() turn of a new client with a cold model, with and without preloading"""
+    results = {}
+    with MockOllama(tokens=16, load_time=0.2) as mock:
+        for preload in (False, True):
+            samples = []
+            for _ in range(min(repeat, 5)):
+                mock.loaded.clear()
+                client = make_client(mock, workdir, residency={"preload": preload})
+                # Give the preload the head start a user typing their first message would
+                deadline = time.monotonic() + 5
+                while preload and not client.residency.is_hot(mock.url, client.config.model.name) \
+                        and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                start = time.perf_counter()
+                client.chat("Hello")
+                samples.append(time.perf_counter() - start)
+            results["preloaded" if preload else "cold"] = summarize(samples)
+        results["model_load_ms"] = mock.load_time * 1000
+    return results
+
+
+def bench_cancel(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Time from cancel() until the server stops generating a streamed reply"""
+    from main import GenerationCancelled
+
+    with MockOllama(tokens=10000, token_rate=1000) as mock:
+        client = make_client(mock, workdir)
+        samples = []
+        for _ in range(min(repeat, 20)):
+            stopped = mock.cancelled
+            stream = client.chat_stream("Write a very long story")
+            for _ in range(10):
+                next(stream)
+            start = time.perf_counter()
+            client.cancel()
+            try:
+                next(stream)
+            except GenerationCancelled:
+                pass
+            deadline = time.monotonic() + 5
+            while mock.cancelled == stopped and time.monotonic() < deadline:
+                time.sleep(0.0005)
+            samples.append(time.perf_counter() - start)
+        stats = summarize(samples)
+        stats["history_len"] = len(client.history)
+        stats["server_cancelled"] = mock.cancelled
+        return stats
+
+
+def bench_fanout(workdir: str, repeat: int) -> Dict[str, Any]:
+    """One turn to three models: one after another, fanned out, and first finished wins"""
+    from fanout import FanOut, ModelVariant
+
+    specs = ["llama2", "llama2:13b@num_predict=48", "mistral@num_predict=16"]
+    with MockOllama(tokens=64, token_rate=400, latency=0.02) as mock:
+        client = make_client(mock, workdir)
+        variants = [ModelVariant.parse(spec) for spec in specs]
+        conversations = [client.with_model(variant.model, variant.options) for variant in variants]
+
+        def sequential():
+            for conversation in conversations:
+                conversation.reset_conversation()
+                conversation.chat("Compare me")
+
+        results = {"sequential": summarize(timed(sequential, min(repeat, 10)))}
+        for first_wins in (False, True):
+            fanout = FanOut(client, variants, first_wins=first_wins)
+
+            def turn():
+                fanout.reset()
+                fanout.run("Compare me")
+
+            results["first_wins" if first_wins else "fanout"] = summarize(timed(turn, min(repeat, 10)))
+        results["server_cancelled"] = mock.cancelled
+    return results
+
+
+def _headless_ui():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.chdir(ROOT)
+    import pygame_ui
+    return pygame_ui
+
+
+SAMPLE_REPLY = (
+    "Here is an explanation with enough words to wrap across several lines of the "
+    "chat window, followed by an example.\n\n```python\n"
+    + "".join(f"value_{i} = compute({i})  # step {i}\n" for i in range(12))
+    + "```\n\nAfterwards the answer continues with another paragraph of prose. "
+) * 4
+
+
+def bench_bubble_render(workdir: str, repeat: int) -> Dict[str, Any]:
+    """Full MessageBubble layout and per-token streaming append cost"""
+    ui = _headless_ui()
+    ui.pygame.display.set_mode((ui.WINDOW_WIDTH, ui.WINDOW_HEIGHT))
+    full = summarize(timed(lambda: ui.MessageBubble(SAMPLE_REPLY, False, ui.WINDOW_WIDTH), repeat))
+
+    bubble = ui.MessageBubble("", False, ui.WINDOW_WIDTH)
+    appends = []
+    for i in range(0, len(SAMPLE_REPLY), 4):
+        start = time.perf_counter()
+        bubble.append(SAMPLE_REPLY[i:i + 4])
+        appends.append(time.perf_counter() - start)
+    quarter = len(appends) // 4
+    return {
+        "full_render": full,
+        "append_first_quarter": summarize(appends[:quarter]),
+        "append_last_quarter": summarize(appends[-quarter:]),
+    }
+
+
+def bench_ui_draw(workdir: str, repeat: int) -> Dict[str, Any]:
+    """ModernChatUI.draw frame time with a long conversation"""
+    ui = _headless_ui()
+    chat_ui = ui.ModernChatUI()
+    results = {}
+    for count in (10, 100, 500):
+        chat_ui.messages = [
+            ui.MessageBubble(SAMPLE_REPLY if i % 2 else "A short user question?", i % 2 == 0,
+                             ui.WINDOW_WIDTH)
+            for i in range(count)
+        ]
+        chat_ui.layout.reset(chat_ui.messages)
+        chat_ui.scroll_offset = max(0, chat_ui.get_total_height() - ui.CHAT_AREA_HEIGHT)
+        results[f"messages_{count}"] = summarize(timed(chat_ui.draw, repeat))
+    return results
+
+
+BENCHMARKS = {
+    "chat_overhead": bench_chat_overhead,
+    "history_growth": bench_history_growth,
+    "retries": bench_retries,
+    "streaming_ttft": bench_streaming_ttft,
+    "context_reuse": bench_context_reuse,
+    "first_turn": bench_first_turn,
+    "cancel": bench_cancel,
+    "fanout": bench_fanout,
+    "bubble_render": bench_bubble_render,
+    "ui_draw": bench_ui_draw,
+}
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return descriptions of timings that regressed beyond ``tolerance``"""
+    current = flatten(results)
+    regressions = []
+    for name, old in flatten(baseline).items():
+        # Only timings are compared; counts and throughput move the other way
+        if not name.endswith("_ms") or name not in current or old <= 0:
+            continue
+        new = current[name]
+        if new > old * (1 + tolerance):
+            regressions.append(f"{name}: {old:.3f}ms -> {new:.3f}ms (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat client and UI hot paths")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("-n", "--repeat", type=int, default=50, help="Samples per measurement")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {DEFAULT_BASELINE}")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            print(f"running {name}...", flush=True)
+            results[name] = BENCHMARKS[name](workdir, args.repeat)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        Path(DEFAULT_BASELINE).write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+        return
+
+    if Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, {k: v for k, v in baseline.items() if k in results},
+                              args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
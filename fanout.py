@@ -0,0 +1,506 @@
+import argparse
+import json
+import logging
+import shutil
+import sys
+import textwrap
+import threading
+import time
+from collections import deque
+from queue import Queue
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from batch import completed_ids, extract_prompt, iter_records
+from main import GenerationCancelled, OllamaChat
+from utils.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 1e9
+
+
+class ModelVariant:
+    """One model, optionally with its own Ollama options, taking part in a fan-out"""
+
+    def __init__(self, model: str, options: Optional[Dict[str, Any]] = None,
+                 label: Optional[str] = None):
+        self.model = model
+        self.options = dict(options or {})
+        if label is None:
+            overrides = ",".join(f"{name}={value}" for name, value in self.options.items())
+            label = f"{model}@{overrides}" if overrides else model
+        self.label = label
+
+    @classmethod
+    def parse(cls, spec: Any) -> "ModelVariant":
+        """
+        Build a variant from a command-line spec or a [fanout] config entry
+
+        Strings are ``model`` or ``model@option=value,...``, e.g.
+        ``llama2@temperature=0.2,num_ctx=4096``. Tables have a ``model`` and
+        optional ``options`` and ``label``.
+        """
+        if isinstance(spec, dict):
+            if not isinstance(spec.get("model"), str):
+                raise ValueError(f"Fan-out entry needs a 'model': {spec!r}")
+            return cls(spec["model"], spec.get("options"), spec.get("label"))
+        model, _, overrides = str(spec).partition("@")
+        if not model.strip():
+            raise ValueError(f"Fan-out entry needs a model name: {spec!r}")
+        options = {}
+        for item in filter(None, overrides.split(",")):
+            name, separator, value = item.partition("=")
+            if not separator or not name.strip():
+                raise ValueError(f"Bad option {item!r} in {spec!r}; expected name=value")
+            try:
+                options[name.strip()] = json.loads(value)
+            except json.JSONDecodeError:
+                options[name.strip()] = value.strip()
+        return cls(model.strip(), options, str(spec))
+
+
+class FanOutResult:
+    """How one variant did on one turn"""
+
+    def __init__(self, label: str, model: str):
+        self.label = label
+        self.model = model
+        self.parts: List[str] = []
+        self.status = "running"  # then "ok", "error" or "cancelled"
+        self.error: Optional[str] = None
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.eval_count: Optional[int] = None
+        self.tokens_per_s: Optional[float] = None
+        self.winner = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def describe(self) -> str:
+        """One-line summary for the column footers"""
+        if self.status == "cancelled":
+            return "[cancelled]"
+        if self.status == "error":
+            return f"[error: {self.error}]"
+        if self.status != "ok":
+            return ""
+        summary = f"ttft {self.ttft * 1000:.0f}ms" if self.ttft is not None else "ttft -"
+        if self.tokens_per_s is not None:
+            summary += f", {self.tokens_per_s:.1f} tok/s"
+        summary += f", {self.total:.2f}s"
+        return summary + (" (first)" if self.winner else "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "label": self.label,
+            "model": self.model,
+            "status": self.status,
+            "response": self.text,
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "total_ms": round(self.total * 1000, 1) if self.total is not None else None,
+            "eval_count": self.eval_count,
+            "tokens_per_s": round(self.tokens_per_s, 2) if self.tokens_per_s is not None else None,
+            "winner": self.winner,
+        }
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
+
+class FanOut:
+    """
+    Send every message to several models (or option sets) at once
+
+    Each variant has its own conversation from ``OllamaChat.with_model``
+    and streams in its own thread, so a turn takes as long as the slowest
+    model instead of the sum of all of them. Normally every conversation
+    keeps its own model's replies. With ``first_wins`` the first complete
+    reply is the answer: the others are cancelled, so Ollama stops
+    generating them, and the winning reply is recorded in every
+    conversation.
+    """
+
+    def __init__(self, client: OllamaChat, variants: Iterable[ModelVariant],
+                 first_wins: bool = False, window: int = 1000):
+        """
+        Args:
+            client (OllamaChat): Client whose config, connection pool and cache are shared
+            variants (iterable): Models or option sets to compare
+            first_wins (bool): Keep only the first finished reply of each turn
+            window (int): Turns kept per variant for the report percentiles
+        """
+        self.variants = list(variants)
+        if not self.variants:
+            raise ValueError("A fan-out needs at least one model")
+        seen = {}
+        for variant in self.variants:
+            # The report is keyed by label, so repeated variants are numbered
+            seen[variant.label] = seen.get(variant.label, 0) + 1
+            if seen[variant.label] > 1:
+                variant.label = f"{variant.label}#{seen[variant.label]}"
+        self.first_wins = first_wins
+        self.conversations = [client.with_model(variant.model, variant.options)
+                              for variant in self.variants]
+        self.last_results: List[FanOutResult] = []
+        self.turns = 0
+        self._samples = {variant.label: {series: deque(maxlen=window)
+                                         for series in ("ttft", "tokens_per_s", "total")}
+                         for variant in self.variants}
+        self._counts = {variant.label: {"ok": 0, "error": 0, "cancelled": 0, "wins": 0}
+                        for variant in self.variants}
+        self._stop: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        for model in dict.fromkeys(variant.model for variant in self.variants):
+            client.residency.ensure_loaded(model)
+
+    @property
+    def labels(self) -> List[str]:
+        return [variant.label for variant in self.variants]
+
+    def _finish(self, result: FanOutResult, status: str, error: Optional[str] = None) -> bool:
+        """Settle a result once; a turn already decided by first_wins is not changed"""
+        with self._lock:
+            if result.status != "running":
+                return False
+            result.status = status
+            result.error = error
+            return True
+
+    def _run_variant(self, index: int, user_input: str, result: FanOutResult,
+                     events: Queue, stop: threading.Event):
+        conversation = self.conversations[index]
+        conversation.last_turn = {}
+        start = time.perf_counter()
+        stream = conversation.chat_stream(user_input)
+        try:
+            for delta in stream:
+                if stop.is_set():
+                    # Closing the stream closes the connection, so Ollama stops generating
+                    stream.close()
+                    self._finish(result, "cancelled")
+                    return
+                if result.ttft is None:
+                    result.ttft = time.perf_counter() - start
+                result.parts.append(delta)
+                events.put((index, delta))
+            result.total = time.perf_counter() - start
+            turn = conversation.last_turn
+            result.eval_count = turn.get("eval_count")
+            if result.eval_count and turn.get("eval_duration"):
+                result.tokens_per_s = result.eval_count / (turn["eval_duration"] / NS_PER_SECOND)
+            elif result.ttft is not None and result.total > result.ttft:
+                # No server timings (e.g. a cache hit): count streamed chunks instead
+                result.tokens_per_s = len(result.parts) / (result.total - result.ttft)
+            self._finish(result, "ok")
+        except GenerationCancelled:
+            self._finish(result, "cancelled")
+        except Exception as e:
+            logger.error(f"{result.label} failed: {str(e)}")
+            self._finish(result, "error", str(e))
+        finally:
+            if result.total is None:
+                result.total = time.perf_counter() - start
+            events.put((index, None))
+
+    def stream(self, user_input: str) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        Send one message to every variant and yield the replies as they arrive
+
+        Yields ``(index, delta)`` pairs, ``index`` being the variant's
+        position. ``delta`` is None when that variant is done; its result is
+        then in ``last_results[index]``. With ``first_wins`` the stream ends
+        with the winner, and the replies still running are cancelled.
+        Closing the generator early cancels every reply.
+        """
+        events = Queue()
+        stop = self._stop = threading.Event()
+        results = self.last_results = [FanOutResult(variant.label, variant.model)
+                                       for variant in self.variants]
+        history_lengths = [len(conversation.history) for conversation in self.conversations]
+        for index, result in enumerate(results):
+            threading.Thread(target=self._run_variant, name=f"fanout-{index}", daemon=True,
+                             args=(index, user_input, result, events, stop)).start()
+
+        running = len(results)
+        winner = None
+        try:
+            while running and winner is None:
+                index, delta = events.get()
+                if delta is None:
+                    running -= 1
+                    if self.first_wins and results[index].status == "ok":
+                        winner = index
+                        results[index].winner = True
+                        self.cancel()
+                yield index, delta
+        finally:
+            if running and winner is None:
+                self.cancel()
+            for result in results:
+                self._finish(result, "cancelled")
+            self._record(results)
+
+        if winner is not None:
+            for index, conversation in enumerate(self.conversations):
+                # A runner-up that finished in the same instant has recorded its own reply
+                if index != winner and len(conversation.history) == history_lengths[index]:
+                    conversation.record_turn(user_input, results[winner].text)
+
+    def run(self, user_input: str) -> List[FanOutResult]:
+        """Send one message to every variant and wait for the turn to finish"""
+        for _ in self.stream(user_input):
+            pass
+        return self.last_results
+
+    def cancel(self):
+        """Stop every reply of the turn in progress; safe to call from any thread"""
+        if self._stop is not None:
+            self._stop.set()
+        for conversation in self.conversations:
+            conversation.cancel()
+
+    def reset(self):
+        """Clear the history of every conversation"""
+        for conversation in self.conversations:
+            conversation.reset_conversation()
+
+    def _record(self, results: List[FanOutResult]):
+        with self._lock:
+            self.turns += 1
+            for result in results:
+                counts = self._counts[result.label]
+                counts[result.status] += 1
+                counts["wins"] += int(result.winner)
+                if result.status != "ok":
+                    continue
+                samples = self._samples[result.label]
+                samples["total"].append(result.total)
+                if result.ttft is not None:
+                    samples["ttft"].append(result.ttft)
+                if result.tokens_per_s is not None:
+                    samples["tokens_per_s"].append(result.tokens_per_s)
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per-variant TTFT, tokens/s and latency over the turns so far, in variant order"""
+        rows = []
+        with self._lock:
+            for variant in self.variants:
+                row = {"label": variant.label, "model": variant.model,
+                       "options": variant.options, "turns": self.turns}
+                row.update(self._counts[variant.label])
+                for series, values in self._samples[variant.label].items():
+                    ordered = sorted(values)
+                    row[f"{series}_p50"] = percentile(ordered, 0.5)
+                    row[f"{series}_p95"] = percentile(ordered, 0.95)
+                rows.append(row)
+        return rows
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    """Render ``FanOut.report()`` as a table, one row per variant"""
+    width = max([len("model")] + [len(row["label"]) for row in rows])
+    lines = [f"{'model':<{width}}  {'ok':>4} {'err':>4} {'cxl':>4} {'wins':>4}  "
+             f"{'ttft p50':>9} {'ttft p95':>9}  {'tok/s p50':>9}  {'total p50':>9} {'total p95':>9}"]
+    for row in rows:
+        lines.append(
+            f"{row['label']:<{width}}  {row['ok']:>4} {row['error']:>4} {row['cancelled']:>4} "
+            f"{row['wins']:>4}  {row['ttft_p50'] * 1000:>7.0f}ms {row['ttft_p95'] * 1000:>7.0f}ms  "
+            f"{row['tokens_per_s_p50']:>9.1f}  {row['total_p50']:>8.2f}s {row['total_p95']:>8.2f}s"
+        )
+    return "\n".join(lines)
+
+
+class SideBySide:
+    """
+    Print the replies of one fan-out turn in terminal columns as they stream
+
+    On a terminal the columns are redrawn in place, at most every
+    ``refresh`` seconds and only as many rows as fit on screen; the full
+    replies are printed by ``close()``. Otherwise only ``close()`` prints.
+    """
+
+    GAP = " | "
+
+    def __init__(self, labels: List[str], out=None, refresh: float = 0.05):
+        self.labels = labels
+        self.out = out or sys.stdout
+        self.refresh = refresh
+        self.live = self.out.isatty()
+        size = shutil.get_terminal_size()
+        self.width = max(16, (size.columns - len(self.GAP) * (len(labels) - 1)) // len(labels))
+        self.max_rows = max(5, size.lines - 2)
+        self.texts = ["" for _ in labels]
+        self.status = ["" for _ in labels]
+        self._drawn = 0
+        self._last_draw = 0.0
+
+    def update(self, index: int, delta: str):
+        self.texts[index] += delta
+        self._maybe_draw()
+
+    def finish(self, index: int, result: FanOutResult):
+        self.status[index] = result.describe()
+        self._maybe_draw(force=True)
+
+    def _rows(self) -> List[str]:
+        columns = []
+        for label, text, status in zip(self.labels, self.texts, self.status):
+            lines = [label[:self.width], "-" * min(self.width, len(label))]
+            for paragraph in text.split("\n"):
+                lines.extend(textwrap.wrap(paragraph, self.width) or [""])
+            if status:
+                lines.append(status[:self.width])
+            columns.append(lines)
+        height = max(len(lines) for lines in columns)
+        return [self.GAP.join((lines[row] if row < len(lines) else "").ljust(self.width)
+                              for lines in columns).rstrip()
+                for row in range(height)]
+
+    def _draw(self, rows: List[str]):
+        if self._drawn:
+            # Back to the top of the previous drawing, and clear it
+            self.out.write(f"\x1b[{self._drawn}F\x1b[J")
+        self.out.write("\n".join(rows) + "\n")
+        self.out.flush()
+        self._drawn = len(rows)
+
+    def _maybe_draw(self, force: bool = False):
+        if not self.live:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_draw < self.refresh:
+            return
+        self._last_draw = now
+        # Rows that scrolled off screen can no longer be redrawn
+        self._draw(self._rows()[-self.max_rows:])
+
+    def close(self, results: Optional[List[FanOutResult]] = None):
+        """Print the final replies, with the outcome of every variant"""
+        for index, result in enumerate(results or []):
+            self.status[index] = result.describe()
+        self._draw(self._rows())
+
+
+def run_turn(fanout: FanOut, user_input: str):
+    """Run one turn, streaming the replies side by side; Ctrl-C stops them"""
+    view = SideBySide(fanout.labels)
+    stream = fanout.stream(user_input)
+    try:
+        for index, delta in stream:
+            if delta is None:
+                view.finish(index, fanout.last_results[index])
+            else:
+                view.update(index, delta)
+    except KeyboardInterrupt:
+        stream.close()
+        view.close(fanout.last_results)
+        print("[stopped]")
+        return
+    view.close(fanout.last_results)
+
+
+def run_file(fanout: FanOut, input_path: str, output_path: str, id_field: str = "id",
+             prompt_field: str = "prompt") -> Dict[str, int]:
+    """
+    Send every prompt in a JSONL file to all variants, one record at a time
+
+    Each record starts from an empty history. Results are appended to
+    ``output_path`` with every variant's reply and timings; records that
+    already have a result are skipped, so an interrupted run can be resumed.
+
+    Returns:
+        dict: Counts of succeeded, failed and skipped records
+    """
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    done = completed_ids(output_path, id_field)
+    with open(output_path, "a", encoding="utf-8") as out:
+        for record in iter_records(input_path, id_field):
+            if str(record[id_field]) in done:
+                counts["skipped"] += 1
+                continue
+            result = {id_field: record[id_field]}
+            prompt = extract_prompt(record, prompt_field)
+            if prompt is None:
+                result["error"] = f"Record has no '{prompt_field}' field"
+            else:
+                fanout.reset()
+                replies = fanout.run(prompt)
+                result["results"] = [reply.to_dict() for reply in replies]
+                if all(reply.status != "ok" for reply in replies):
+                    result["error"] = "every model failed"
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["failed" if "error" in result else "succeeded"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Send the same conversation to several models at once and compare them")
+    parser.add_argument("-m", "--model", action="append", metavar="SPEC",
+                        help="Model to include, optionally with options: llama2@temperature=0.2 "
+                             "(repeatable; default: [fanout].models)")
+    parser.add_argument("--first-wins", action="store_true", default=None,
+                        help="Keep the first finished reply and cancel the others")
+    parser.add_argument("--prompt", help="Send this one message, print the replies and exit")
+    parser.add_argument("--input", help="JSONL file of prompts to run through every model")
+    parser.add_argument("-o", "--output", default="fanout.jsonl",
+                        help="JSONL file to append --input results to")
+    parser.add_argument("--id-field", default="id", help="Record field holding the unique id")
+    parser.add_argument("--prompt-field", default="prompt", help="Record field holding the prompt")
+    parser.add_argument("--report", help="Also write the comparison report to this JSON file")
+    parser.add_argument("--config", default="config.toml", help="Path to the config file")
+    args = parser.parse_args()
+
+    client = OllamaChat(args.config)
+    fanout_config = client.config.get("fanout", {})
+    try:
+        variants = [ModelVariant.parse(spec) for spec in args.model or fanout_config.get("models", [])]
+        first_wins = args.first_wins if args.first_wins is not None else fanout_config.get("first_wins", False)
+        fanout = FanOut(client, variants, first_wins=first_wins)
+    except ValueError as e:
+        parser.error(f"{str(e)} (pass --model or set [fanout].models)")
+
+    try:
+        if args.input:
+            counts = run_file(fanout, args.input, args.output,
+                              args.id_field, args.prompt_field)
+            print(f"Done: {counts['succeeded']} succeeded, {counts['failed']} failed, "
+                  f"{counts['skipped']} already complete")
+        elif args.prompt:
+            run_turn(fanout, args.prompt)
+        else:
+            print(f"Comparing {', '.join(fanout.labels)}"
+                  f"{' (first finished wins)' if first_wins else ''}. "
+                  "Type 'quit' to exit, 'reset' to clear history or '/report' for the comparison.")
+            while True:
+                try:
+                    user_input = input("\nYou: ").strip()
+                except (KeyboardInterrupt, EOFError):
+                    print()
+                    break
+                if user_input.lower() == "quit":
+                    break
+                elif user_input.lower() == "reset":
+                    fanout.reset()
+                    print("Conversation history cleared.")
+                elif user_input.lower() == "/report":
+                    print(format_report(fanout.report()))
+                elif user_input:
+                    print()
+                    run_turn(fanout, user_input)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume." if args.input else "")
+
+    if fanout.turns:
+        print(f"\n{format_report(fanout.report())}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"first_wins": first_wins, "turns": fanout.turns, "variants": fanout.report()},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import Dict, Any, Optional
+
+from aiohttp import web
+
+from async_chat import AsyncOllamaChat, ChatSessionManager
+from main import GenerationCancelled
+from utils.scheduler import FairScheduler, QueueFull
+
+logger = logging.getLogger(__name__)
+
+
+class ChatGateway:
+    """
+    HTTP front end that serves chat sessions to many users
+
+    Endpoints:
+        POST   /v1/chat                  {"session", "message", "stream"}
+        POST   /v1/sessions/{session}/cancel
+        DELETE /v1/sessions/{session}
+        GET    /v1/stats
+        GET    /metrics                  Prometheus text
+        GET    /health
+
+    Users are identified by a request header (``X-User`` by default) and
+    fall back to the client address. Sessions are private to their user.
+    Requests to Ollama go through a FairScheduler; when its queue is full
+    the gateway answers 429 with a Retry-After header. A cancelled reply
+    ends with ``{"cancelled": true, "done": true}`` and is not added to
+    the session's history.
+    """
+
+    def __init__(self, client: AsyncOllamaChat, scheduler: FairScheduler,
+                 user_header: str = "X-User", max_sessions: int = 1000):
+        self.client = client
+        self.scheduler = scheduler
+        self.manager = ChatSessionManager(client, scheduler=scheduler)
+        self.user_header = user_header
+        self.max_sessions = max_sessions
+        self._busy = set()
+
+        client.metrics.add_gauge("queue_depth", lambda: scheduler.queue_depth)
+        client.metrics.add_gauge("in_flight", lambda: scheduler.in_flight)
+        client.metrics.add_gauge("rejected_total", lambda: scheduler.rejected, kind="counter")
+        client.metrics.add_gauge("sessions", lambda: len(self.manager.sessions))
+
+    @classmethod
+    def from_config(cls, client: AsyncOllamaChat) -> "ChatGateway":
+        gateway_config = client.config.get("gateway", {})
+        # max_in_flight is per backend; the router keeps each backend within it
+        scheduler = FairScheduler(
+            max_in_flight=client.config.api.max_in_flight * len(client.router.backends),
+            max_queue=gateway_config.get("max_queue", 64),
+            max_queue_per_user=gateway_config.get("max_queue_per_user", 8),
+        )
+        return cls(client, scheduler,
+                   user_header=gateway_config.get("user_header", "X-User"),
+                   max_sessions=gateway_config.get("max_sessions", 1000))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat", self.handle_chat)
+        app.router.add_post("/v1/sessions/{session}/cancel", self.handle_cancel)
+        app.router.add_delete("/v1/sessions/{session}", self.handle_delete)
+        app.router.add_get("/v1/stats", self.handle_stats)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/health", self.handle_health)
+        return app
+
+    def _user(self, request: web.Request) -> str:
+        return request.headers.get(self.user_header) or request.remote or "anonymous"
+
+    def _conversation(self, key: str, user: str) -> AsyncOllamaChat:
+        sessions = self.manager.sessions
+        conversation = sessions.pop(key, None)
+        if conversation is not None:
+            # Re-insert so dict order tracks recency of use
+            sessions[key] = conversation
+            return conversation
+        # Forget the least recently used idle sessions to bound memory
+        for stale in list(sessions):
+            if len(sessions) < self.max_sessions:
+                break
+            if stale not in self._busy:
+                self.manager.close_session(stale)
+        return self.manager.session(key, user)
+
+    @staticmethod
+    def _cancelled() -> web.Response:
+        return web.json_response({"cancelled": True, "done": True})
+
+    @staticmethod
+    def _error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> web.Response:
+        return web.json_response({"error": message}, status=status, headers=headers)
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._error(400, "Request body must be JSON")
+        message = body.get("message") if isinstance(body, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            return self._error(400, "'message' must be a non-empty string")
+
+        user = self._user(request)
+        key = f"{user}/{body.get('session', 'default')}"
+        if key in self._busy:
+            return self._error(409, "A reply for this session is still being generated")
+        try:
+            self.scheduler.check(user)
+        except QueueFull as e:
+            return self._error(429, str(e), {"Retry-After": str(e.retry_after)})
+
+        self._busy.add(key)
+        try:
+            stream = self._conversation(key, user).chat_stream(message)
+            if body.get("stream", True):
+                return await self._stream(request, stream)
+            return await self._collect(stream)
+        finally:
+            self._busy.discard(key)
+
+    async def _first(self, stream) -> Any:
+        """Wait for the first piece, turning refusals and failures into error responses"""
+        try:
+            return await stream.__anext__()
+        except (ConnectionResetError, asyncio.CancelledError):
+            # The client went away before the first token; stop the generation
+            await stream.aclose()
+            raise
+        except StopAsyncIteration:
+            return ""
+        except GenerationCancelled:
+            return self._cancelled()
+        except QueueFull as e:
+            return self._error(429, str(e), {"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            logger.error(f"Chat request failed: {str(e)}")
+            return self._error(502, f"Model request failed: {str(e)}")
+
+    async def _collect(self, stream) -> web.Response:
+        first = await self._first(stream)
+        if isinstance(first, web.Response):
+            return first
+        parts = [first]
+        try:
+            async for delta in stream:
+                parts.append(delta)
+        except GenerationCancelled:
+            return self._cancelled()
+        except Exception as e:
+            logger.error(f"Chat request failed: {str(e)}")
+            return self._error(502, f"Model request failed: {str(e)}")
+        return web.json_response({"message": {"role": "assistant", "content": "".join(parts)},
+                                  "done": True})
+
+    async def _stream(self, request: web.Request, stream) -> web.StreamResponse:
+        # Headers go out with the first token, so refusals can still be a 429
+        first = await self._first(stream)
+        if isinstance(first, web.Response):
+            return first
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def send(chunk: Dict[str, Any]):
+            await response.write((json.dumps(chunk) + "\n").encode("utf-8"))
+
+        try:
+            await send({"message": {"role": "assistant", "content": first}, "done": False})
+            async for delta in stream:
+                await send({"message": {"role": "assistant", "content": delta}, "done": False})
+            await send({"done": True})
+        except GenerationCancelled:
+            await send({"cancelled": True, "done": True})
+        except (ConnectionResetError, asyncio.CancelledError):
+            await stream.aclose()
+            raise
+        except Exception as e:
+            logger.error(f"Chat stream failed: {str(e)}")
+            await send({"error": str(e)})
+        await response.write_eof()
+        return response
+
+    async def handle_cancel(self, request: web.Request) -> web.Response:
+        key = f"{self._user(request)}/{request.match_info['session']}"
+        if key not in self._busy:
+            return self._error(409, "No reply for this session is being generated")
+        self.manager.cancel(key)
+        return web.json_response({"cancelled": key})
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        key = f"{self._user(request)}/{request.match_info['session']}"
+        if key in self._busy:
+            return self._error(409, "A reply for this session is still being generated")
+        self.manager.close_session(key)
+        return web.json_response({"deleted": key})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.manager.stats())
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.client.metrics.to_prometheus(),
+                            content_type="text/plain", headers={"X-Prometheus-Format": "0.0.4"})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **self.scheduler.stats()})
+
+
+async def serve(config_path: str, host: Optional[str], port: Optional[int]):
+    async with AsyncOllamaChat(config_path) as client:
+        gateway = ChatGateway.from_config(client)
+        gateway_config = client.config.get("gateway", {})
+        host = host or gateway_config.get("host", "127.0.0.1")
+        port = port or gateway_config.get("port", 8080)
+
+        runner = web.AppRunner(gateway.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Chat gateway listening on http://{host}:{port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve chat sessions to many users over HTTP")
+    parser.add_argument("--host", help="Interface to bind (default: [gateway].host)")
+    parser.add_argument("--port", type=int, help="Port to bind (default: [gateway].port)")
+    parser.add_argument("--config", default="config.toml", help="Path to config file")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.config, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Failed to start gateway: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
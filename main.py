@@ -1,34 +1,420 @@
-from utils.config import load_config
+import time
+# Taken before the other imports so --profile-startup can report their cost
+_STARTED = time.perf_counter()
+
+from utils.config import get_config, apply_environment
+from utils.transport import abort, get_transport, is_retryable
+from utils.router import BackendRouter
+from utils.residency import ResidencyManager
+from utils.cache import ResponseCache, make_cache_key
+from utils.history import ConversationHistory, estimate_tokens
+from utils.metrics import MetricsRegistry, RequestMetrics, format_summary
+from utils.singleflight import Detached, SingleFlight, flight_key
+from utils.startup import profiler
 import requests
+import argparse
+import copy
+import importlib
 import json
 import logging
 import sys
-from typing import Dict, Any
-from requests.exceptions import ConnectionError
+import threading
+import uuid
+from typing import Dict, Any, Iterator, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Imported on first use: numpy and sqlite3 are only needed when enabled
+    from utils.semantic_cache import SemanticCache
+    from utils.session_store import SessionStore
+
+_IMPORTED = time.perf_counter()
+
+CHAT_PATH = "/api/chat"
+GENERATE_PATH = "/api/generate"
+EMBED_PATH = "/api/embed"
+
+def as_chat_reply(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Give an /api/generate reply or chunk the shape of an /api/chat one, in place"""
+    if "response" in chunk:
+        chunk["message"] = {"role": "assistant", "content": chunk.pop("response")}
+    return chunk
+
+def cacheable(reply: Dict[str, Any]) -> Dict[str, Any]:
+    """A reply without its token context, which is large and tied to one conversation"""
+    return {key: value for key, value in reply.items() if key != "context"}
+
+class GenerationCancelled(Exception):
+    """The reply was stopped with ``cancel()``; the turn was discarded"""
 
 class OllamaChat:
-    def __init__(self, config_path: str = "config.toml"):
+    def __init__(self, config_path: str = "config.toml", wait_for_server: bool = True):
+        """
+        Args:
+            config_path (str): Path to the config file
+            wait_for_server (bool): Probe the server before returning and exit if it is
+                unreachable; when False the probe runs in the background instead
+        """
         # Load configuration
-        self.config = load_config(config_path)
+        with profiler.phase("load config"):
+            self.config = get_config(config_path)
+        self._config_version = self.config.version
+        
+        # Model and option overrides of this conversation, see with_model()
+        self.model_override: Optional[str] = None
+        self.option_overrides: Dict[str, Any] = {}
+        self._options = self.config.model.options
         
         # Setup logging
         self._setup_logging()
         
-        # Setup base URL
-        self.base_url = f"{self.config['model']['base_url']}/api/chat"
+        # Shared keep-alive connection pool
+        self.transport = get_transport(self.config["api"])
+        
+        # Ollama hosts to spread requests over
+        self.router = self._setup_router()
+        self.conversation_id = uuid.uuid4().hex
         
         # Test server connection
+        self.server_checked = threading.Event()
+        if wait_for_server:
+            with profiler.phase("server probe"):
+                self._check_server()
+            self.server_checked.set()
+        else:
+            threading.Thread(target=self._check_server_background, name="server-probe",
+                             daemon=True).start()
+        
+        # Persistent response cache
+        with profiler.phase("response cache"):
+            self.cache = self._setup_cache()
+        
+        # Identical concurrent requests share one upstream call
+        self.inflight = SingleFlight()
+        
+        # Per-request performance telemetry
+        self.metrics = self._setup_metrics()
+        
+        # Keeps models loaded while in use; preloads them in the background
+        self.residency = self._setup_residency()
+        
+        # Optional cache that also answers paraphrased prompts
+        with profiler.phase("semantic cache"):
+            self.semantic_cache = self._setup_semantic_cache()
+        
+        # Initialize conversation history
+        self.history = self._new_history()
+        self._drop_context()
+        self.context_turns = {"reused": 0, "new": 0}
+        self.last_turn: Dict[str, Any] = {}
+        
+        # Persistent session, attached on demand
+        self.session = None
+        self._session_store = None
+        
+        # Cancellation of the turn in progress, see cancel()
+        self._cancelled = threading.Event()
+        self._open_streams = set()
+        
+    def _setup_router(self) -> BackendRouter:
+        """Create the backend router from [routing], defaulting to model.base_url alone"""
+        routing_config = self.config.get("routing", {})
+        return BackendRouter(
+            routing_config.get("backends") or [self.config["model"]["base_url"]],
+            probe=self._probe,
+            is_failure=self._is_backend_failure,
+            probe_interval=routing_config.get("probe_interval", 10),
+            eject_after=routing_config.get("eject_after", 3),
+            slow_start=routing_config.get("slow_start", 30),
+            sticky_sessions=routing_config.get("sticky_sessions", True),
+            max_outstanding=self.config.api.max_in_flight
+        )
+
+    def _probe(self, url: str) -> bool:
+        """Health check for one backend"""
         try:
-            requests.get(self.config['model']['base_url'])
-        except ConnectionError:
+            # A short timeout, so one hung host does not hold up the whole probe round
+            self.transport.get(url, retry=False,
+                               timeout=self.config.get("routing", {}).get("probe_timeout", 2))
+            return True
+        except requests.exceptions.RequestException as e:
+            self.logger.debug(f"Health probe of {url} failed: {str(e)}")
+            return False
+
+    def _is_backend_failure(self, error: Exception) -> bool:
+        """Whether a request error says something about the backend's health"""
+        return is_retryable(error)
+
+    def _check_server(self):
+        """Exit early if no Ollama server can be reached, then keep probing in the background"""
+        if not self.router.probe_all():
             self.logger.error("Ollama server is not running. Please start it with 'ollama serve'")
             sys.exit(1)
+        self.router.start_probes()
+
+    def _check_server_background(self):
+        """``_check_server`` for interactive startup: warn instead of exiting"""
+        began = time.perf_counter()
+        try:
+            if not self.router.probe_all():
+                self.logger.error("Ollama server is not running. Please start it with 'ollama serve'")
+                print("\nWarning: the Ollama server is not reachable. Start it with 'ollama serve'.",
+                      file=sys.stderr, flush=True)
+            # Keep probing either way, so a server started later is picked up
+            self.router.start_probes()
+        finally:
+            profiler.record("server probe (background)", began)
+            self.server_checked.set()
+
+    def _refresh_config(self):
+        """
+        Pick up edits to the config file before starting a request
+        
+        Requests already in flight keep the payload, timeouts and history
+        window they started with; only the next request sees the change.
+        """
+        self.config.refresh()
+        if self._config_version != self.config.version:
+            self._config_version = self.config.version
+            self._apply_config()
+
+    def _apply_config(self):
+        """Bring this conversation in line with reloaded config sections"""
+        self.transport = get_transport(self.config["api"])
+        self.history.max_tokens = self.config.history.context_tokens
+        self.history.strategy = self.config.history.strategy
+        self.router.max_outstanding = self.config.api.max_in_flight
+        self._options = self._merged_options()
+        self.residency.ensure_loaded(self.model_name)
+        cache_config = self.config.cache
+        if self.cache is None or not cache_config.enabled:
+            self.cache = self._setup_cache()
+        else:
+            self.cache.resize(cache_config.max_size)
+            self.cache.cache_sampled = cache_config.cache_sampled
+
+    def _affinity(self) -> str:
+        """Routing key that keeps this conversation on one backend"""
+        return self.session or self.conversation_id
+
+    def _setup_cache(self) -> Optional[ResponseCache]:
+        """Create the response cache if it is enabled in the config"""
+        cache_config = self.config.cache
+        if not cache_config.enabled:
+            return None
+        return ResponseCache(
+            directory=cache_config.directory,
+            max_size=cache_config.max_size,
+            cache_sampled=cache_config.cache_sampled
+        )
+
+    def _setup_residency(self) -> ResidencyManager:
+        """Create the model residency manager from [residency] and start preloading"""
+        residency_config = self.config.get("residency", {})
+        residency = ResidencyManager(
+            send=self._send_keep_alive,
+            backends=lambda: [b.url for b in self.router.backends if b.healthy],
+            models=[self.config.model.name] + residency_config.get("models", []),
+            keep_alive=residency_config.get("keep_alive"),
+            idle_unload=residency_config.get("idle_unload", 0),
+            cold_threshold=residency_config.get("cold_threshold", 0.5),
+            check_interval=residency_config.get("check_interval", 30)
+        )
+        self.metrics.add_gauge("models_loaded", residency.hot_count)
+        self.metrics.add_gauge("cold_starts_total", lambda: residency.cold_starts, kind="counter")
+        residency.start(preload=residency_config.get("preload", True))
+        return residency
+
+    def _send_keep_alive(self, url: str, model: str, keep_alive: Optional[float]) -> Dict[str, Any]:
+        """Empty generate request: loads the model, or unloads it when keep_alive is 0"""
+        payload = {"model": model, "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return self.transport.post(url + GENERATE_PATH, json=payload).json()
+
+    def _setup_semantic_cache(self) -> Optional["SemanticCache"]:
+        """Create the semantic cache if it is enabled in the config"""
+        semantic_config = self.config.get("semantic_cache", {})
+        if not semantic_config.get("enabled", False):
+            return None
+        from utils.semantic_cache import SemanticCache, HashingEmbedder
+        embedder = semantic_config.get("embedder", "ollama")
+        if embedder == "ollama":
+            embed = self._embed
+            embedder = f"ollama:{semantic_config.get('embed_model', 'nomic-embed-text')}"
+        elif embedder == "hashing":
+            embed = HashingEmbedder()
+        else:
+            # "package.module:factory" returning a callable text -> vector
+            module, _, factory = embedder.partition(":")
+            embed = getattr(importlib.import_module(module), factory)()
+        cache = SemanticCache(
+            embed,
+            directory=self.config.cache.directory,
+            capacity=semantic_config.get("capacity", 10000),
+            threshold=semantic_config.get("threshold", 0.92),
+            embed_id=embedder
+        )
+        self.metrics.add_gauge("semantic_cache_hits_total", lambda: cache.hits, kind="counter")
+        self.metrics.add_gauge("semantic_cache_misses_total", lambda: cache.misses, kind="counter")
+        self.metrics.add_gauge("semantic_cache_similarity_p50", lambda: cache.stats()["similarity_p50"])
+        return cache
+
+    def _embed(self, text: str) -> list:
+        """Embed text with the configured Ollama embedding model"""
+        payload = {
+            "model": self.config["semantic_cache"].get("embed_model", "nomic-embed-text"),
+            "input": text
+        }
+        with self.router.route() as backend:
+            response = self.transport.post(backend.url + EMBED_PATH, json=payload)
+            return response.json()["embeddings"][0]
+
+    def _semantic_lookup(self, messages: list) -> Optional[Dict[str, Any]]:
+        """
+        Look the new user message up in the semantic cache
+        
+        Returns:
+            dict: The lookup result plus its ``scope``, or None if the cache is
+            disabled or the prompt could not be embedded
+        """
+        if self.semantic_cache is None:
+            return None
+        payload = self._build_payload(messages[:-1])
+        scope = self.semantic_cache.scope_id(
+            make_cache_key(payload["model"], payload["options"], payload["messages"])
+        )
+        try:
+            result = self.semantic_cache.lookup(messages[-1]["content"], scope)
         except Exception as e:
-            self.logger.error(f"Error initializing chat: {str(e)}")
-            sys.exit(1)
+            self.logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            return None
+        result["scope"] = scope
+        if "response" in result:
+            self.logger.debug(f"Semantic cache hit (similarity {result['similarity']:.3f}) "
+                              f"for '{result['prompt']}'")
+        return result
+
+    def _semantic_store(self, messages: list, lookup: Optional[Dict[str, Any]], assistant_message: str):
+        if lookup is None:
+            return
+        try:
+            self.semantic_cache.put(messages[-1]["content"], lookup["scope"], assistant_message,
+                                    vector=lookup["vector"])
+        except OSError as e:
+            self.logger.warning(f"Could not store semantic cache entry: {str(e)}")
+
+    def _setup_metrics(self) -> MetricsRegistry:
+        """Create the metrics registry and start any configured exporters"""
+        metrics_config = self.config.get("metrics", {})
+        metrics = MetricsRegistry(window=metrics_config.get("window", 1000))
+        if metrics_config.get("prometheus_file"):
+            metrics.start_file_export(metrics_config["prometheus_file"],
+                                      metrics_config.get("export_interval", 15))
+        if metrics_config.get("prometheus_port"):
+            metrics.serve(metrics_config.get("prometheus_host", "127.0.0.1"),
+                          metrics_config["prometheus_port"])
+        return metrics
+
+    def _record_metrics(self, start: float, response: Optional[Dict[str, Any]] = None,
+                        ttft: Optional[float] = None, queue_wait: float = 0.0,
+                        retries: int = 0, cached: bool = False, error: bool = False,
+                        coalesced: bool = False, cancelled: bool = False):
+        """Add one request's measurements to the metrics registry"""
+        self.metrics.record(RequestMetrics(
+            model=self.model_name,
+            wall_time=time.perf_counter() - start,
+            ttft=ttft,
+            queue_wait=queue_wait,
+            retries=retries,
+            cached=cached,
+            coalesced=coalesced,
+            cancelled=cancelled,
+            error=error,
+            response=response
+        ))
+
+    def _new_history(self) -> ConversationHistory:
+        """Create an empty history using the [history] settings"""
+        return ConversationHistory(
+            max_tokens=self.config.history.context_tokens,
+            strategy=self.config.history.strategy,
+            summarizer=self._summarize
+        )
+
+    def new_conversation(self) -> "OllamaChat":
+        """
+        Start an independent conversation on the same client
         
-        # Initialize conversation history
-        self.history = []
+        The returned chat shares this one's config, connection pool and cache
+        but has its own, empty history.
+        """
+        conversation = copy.copy(self)
+        conversation.history = conversation._new_history()
+        conversation._drop_context()
+        conversation.context_turns = {"reused": 0, "new": 0}
+        conversation.last_turn = {}
+        conversation._cancelled = threading.Event()
+        conversation._open_streams = set()
+        conversation.session = None
+        conversation.conversation_id = uuid.uuid4().hex
+        return conversation
+
+    def with_model(self, model: Optional[str] = None,
+                   options: Optional[Dict[str, Any]] = None) -> "OllamaChat":
+        """
+        Start an independent conversation that uses another model or options
+        
+        Like ``new_conversation``, but requests go to ``model`` (default: the
+        configured one) with ``options`` laid over the [model] options.
+        Config reloads still apply to everything not overridden.
+        
+        Args:
+            model (str): Ollama model name, e.g. "llama2:7b-chat-q4_0"
+            options (dict): Ollama options such as ``temperature`` or ``num_ctx``
+        """
+        conversation = self.new_conversation()
+        conversation.model_override = model
+        conversation.option_overrides = dict(options or {})
+        conversation._options = conversation._merged_options()
+        return conversation
+
+    @property
+    def model_name(self) -> str:
+        """The model this conversation talks to"""
+        return self.model_override or self.config.model.name
+
+    def _merged_options(self) -> Dict[str, Any]:
+        """Request options: the [model] ones, with this conversation's overrides on top"""
+        if not self.option_overrides:
+            return self.config.model.options
+        return dict(self.config.model.options, **self.option_overrides)
+
+    @property
+    def session_store(self) -> "SessionStore":
+        """The session database from the [sessions] config, opened on first use"""
+        if self._session_store is None:
+            from utils.session_store import SessionStore
+
+            sessions_config = self.config.get("sessions", {})
+            self._session_store = SessionStore(sessions_config.get("database", "sessions.db"))
+        return self._session_store
+
+    def attach_session(self, name: str):
+        """
+        Continue a stored session, or start a new one with this name
+        
+        Only the most recent messages that fit the history token budget are
+        loaded; every new turn is appended to the store in the background.
+        
+        Args:
+            name (str): Session name
+        """
+        self.history.clear()
+        self._drop_context()
+        for message in self.session_store.load_recent(name, self.history.max_tokens):
+            self.history.append(message)
+        self.session = name
+        self.logger.info(f"Attached to session '{name}' with {len(self.history)} recent messages")
         
     def _setup_logging(self):
         """Configure logging based on config settings"""
@@ -39,37 +425,303 @@ class OllamaChat:
         )
         self.logger = logging.getLogger(__name__)
         
-    def _make_request(self, messages: list) -> Dict[str, Any]:
-        """Make a request to the Ollama API"""
+    def _build_payload(self, messages: list, stream: bool = False) -> Dict[str, Any]:
+        """Build the /api/chat request body for the given messages"""
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            # Prebuilt when the config is (re)loaded rather than per request
+            "options": self._options
+        }
+        if self.residency.keep_alive is not None:
+            payload["keep_alive"] = self.residency.keep_alive
+        return payload
+
+    def _cache_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Return the response cache key for a payload, or None to bypass the cache"""
+        if self.cache is None or not self.cache.accepts(payload["options"]):
+            return None
+        return make_cache_key(payload["model"], payload["options"], payload["messages"])
+
+    def _flight_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Return the key for coalescing identical in-flight requests, or None to send alone"""
+        if not self.config.api.coalesce_requests:
+            return None
+        return flight_key(payload)
+
+    def _build_messages(self, user_input: str) -> list:
+        """Prepend the system prompt and history to the new user message"""
+        self._refresh_config()
+        return self.history.window(
+            {"role": "system", "content": self.config.system_prompt},
+            {"role": "user", "content": user_input},
+            # A turn that reuses the token context never sends the summary
+            summarize=not self._reuses_context(user_input)
+        )
+
+    def _drop_context(self):
+        """Forget the token context; the next turn resends the history to start a new one"""
+        self._context: Optional[list] = None
+        self._context_state: Optional[tuple] = None
+        self._turn_context: Optional[str] = None
+
+    def _context_key(self) -> tuple:
+        """What the token context depends on; any change invalidates it"""
+        return (self.model_name, self.config.system_prompt, len(self.history))
+
+    def _reuses_context(self, user_input: str) -> bool:
+        """Whether this turn can send only the new message along with the previous token context"""
+        return (self.config.history.reuse_context and self._context is not None
+                and self._context_state == self._context_key()
+                and len(self._context) + estimate_tokens(user_input) <= self.history.max_tokens)
+
+    def _upstream_request(self, payload: Dict[str, Any], user_input: Optional[str]) -> Tuple[Dict[str, Any], str]:
+        """
+        Choose the request actually sent for a chat payload
+        
+        With [history].reuse_context a conversation turn goes to /api/generate.
+        While the token context returned by the previous turn is still valid,
+        only the new message is sent along with it, so Ollama does not
+        re-evaluate the history. After a model or system prompt change, a
+        reset or a restart, or once the context outgrows the history token
+        budget, the recent history is sent as one prompt instead, which
+        starts a new context. That prompt only fills half the budget, so the
+        turns after it can reuse the context again.
+        
+        Args:
+            payload (dict): The /api/chat request body for this turn
+            user_input (str): The new message, or None for requests outside the conversation
+            
+        Returns:
+            tuple: Request body and API path
+        """
+        self._turn_context = None
+        if user_input is None or not self.config.history.reuse_context:
+            return payload, CHAT_PATH
+        request = {key: value for key, value in payload.items() if key != "messages"}
+        if self._reuses_context(user_input):
+            # The system prompt is already part of the context
+            request.update(prompt=user_input, context=self._context)
+            self._turn_context = "reused"
+        else:
+            earlier = payload["messages"][1:-1]
+            tokens = sum(estimate_tokens(m["content"]) for m in earlier)
+            start = 0
+            while start < len(earlier) and tokens > self.history.max_tokens // 2:
+                tokens -= estimate_tokens(earlier[start]["content"])
+                start += 1
+            # Never open with a reply to a question that was dropped
+            while start < len(earlier) and earlier[start]["role"] == "assistant":
+                start += 1
+            earlier = earlier[start:]
+            transcript = "".join(f"{m['role'].capitalize()}: {m['content']}\n\n" for m in earlier)
+            request.update(system=self.config.system_prompt,
+                           prompt=f"{transcript}User: {user_input}" if transcript else user_input)
+            self._turn_context = "new"
+        return request, GENERATE_PATH
+
+    def _finish_turn(self, reply: Dict[str, Any]):
+        """Keep the token context from a completed turn and note its prompt size"""
+        if self._turn_context is not None and reply.get("context"):
+            self._context = reply["context"]
+            self._context_state = self._context_key()
+            self.context_turns[self._turn_context] += 1
+        else:
+            self._context = self._context_state = None
+        self.last_turn = {
+            "prompt_eval_count": reply.get("prompt_eval_count"),
+            "eval_count": reply.get("eval_count"),
+            "eval_duration": reply.get("eval_duration"),
+            "context": self._turn_context or "off",
+        }
+        self.logger.debug(f"Turn prompt_eval_count={self.last_turn['prompt_eval_count']} "
+                          f"(context {self.last_turn['context']})")
+
+    def _summary_request(self, summary: str, messages: list) -> list:
+        """Build the prompt that folds evicted messages into the running summary"""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        if summary:
+            transcript = f"Existing summary: {summary}\n\n{transcript}"
+        return [
+            {"role": "system", "content": "Summarize the conversation below in a few sentences. "
+                                          "Keep names, facts and decisions; omit pleasantries."},
+            {"role": "user", "content": transcript}
+        ]
+
+    def _summarize(self, summary: str, messages: list) -> str:
+        """Fold evicted history messages into the running conversation summary"""
+        response = self._make_request(self._summary_request(summary, messages))
+        return response["message"]["content"]
+
+    def _record_turn(self, user_input: str, assistant_message: str):
+        """Commit a completed exchange to the conversation history"""
+        messages = (
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_message},
+        )
+        for message in messages:
+            self.history.append(message)
+            if self.session is not None:
+                self.session_store.append(self.session, message)
+
+    def record_turn(self, user_input: str, assistant_message: str):
+        """Add an exchange answered elsewhere, e.g. by another model, to the history"""
+        self._record_turn(user_input, assistant_message)
+
+    def cancel(self):
+        """
+        Stop the reply being generated for this conversation
+        
+        Safe to call from any thread. The streaming connection is shut down,
+        so Ollama stops generating, and the pending ``chat``, ``chat_stream``
+        or ``complete`` call raises GenerationCancelled without adding the
+        turn to the history. A reply whose first chunk has not arrived yet
+        (the model is still loading or reading the prompt) is cut off as soon
+        as it does.
+        """
+        self._cancelled.set()
+        for response in list(self._open_streams):
+            abort(response)
+
+    def _begin_turn(self) -> threading.Event:
+        """Fresh cancellation flag for a new turn, so an earlier cancel() does not leak into it"""
+        self._cancelled = threading.Event()
+        return self._cancelled
+
+    def _detached(self) -> "OllamaChat":
+        """
+        Copy that runs a request other conversations may share
+
+        It has its own cancellation, so that ``cancel()`` on this conversation
+        only takes it out of the shared request instead of stopping it.
+        """
+        owner = copy.copy(self)
+        owner._cancelled = threading.Event()
+        owner._open_streams = set()
+        return owner
+
+    def _make_request(self, messages: list, user_input: Optional[str] = None) -> Dict[str, Any]:
+        """Make a request to the Ollama API; ``user_input`` marks a conversation turn"""
+        start = time.perf_counter()
         try:
-            payload = {
-                "model": self.config["model"]["name"],
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": self.config["model"]["temperature"],
-                    "top_p": self.config["model"]["top_p"],
-                    "num_predict": self.config["model"]["max_tokens"],
-                }
-            }
+            payload = self._build_payload(messages)
+            cache_key = self._cache_key(payload)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.logger.debug(f"Response cache hit for {cache_key}")
+                    self._record_metrics(start, cached=True)
+                    return cached
             
-            for attempt in range(self.config["api"]["retry_attempts"]):
-                try:
-                    response = requests.post(
-                        self.base_url,
-                        json=payload,
-                        timeout=self.config["api"]["request_timeout"]
-                    )
-                    response.raise_for_status()
-                    return response.json()
-                except requests.exceptions.RequestException as e:
-                    if attempt == self.config["api"]["retry_attempts"] - 1:
-                        raise
-                    self.logger.warning(f"Request attempt {attempt + 1} failed: {str(e)}")
-                    
+            request, path = self._upstream_request(payload, user_input)
+            flight = self._flight_key(payload)
+            if flight is None:
+                (result, retries), coalesced = self._post(request, path), False
+            else:
+                owner = self._detached()
+                (result, retries), coalesced = self.inflight.do(flight, lambda: owner._post(request, path),
+                                                                self._cancelled, owner.cancel)
+            self._record_metrics(start, result, retries=0 if coalesced else retries,
+                                 coalesced=coalesced)
+            if cache_key is not None and not coalesced:
+                self.cache.put(cache_key, cacheable(result))
+            return result
+        except Detached as e:
+            # Cancelled while waiting on another conversation's request
+            self._record_metrics(start, cancelled=True)
+            raise GenerationCancelled() from e
+        except GenerationCancelled:
+            self._record_metrics(start, cancelled=True)
+            raise
         except requests.exceptions.RequestException as e:
+            self._record_metrics(start, error=True)
             self.logger.error(f"API request failed: {str(e)}")
             raise
+
+    def _post(self, payload: Dict[str, Any], path: str = CHAT_PATH) -> Tuple[Dict[str, Any], int]:
+        """
+        Send a request for a complete reply; returns the reply and the retry count
+        
+        The reply is streamed from Ollama and assembled here, so that
+        ``cancel()`` can close the connection while it is being generated.
+        """
+        upstream = {}
+        parts = []
+        final = None
+        for chunk in self._stream_chunks(dict(payload, stream=True), upstream, path):
+            parts.append(chunk.get("message", {}).get("content", ""))
+            if chunk.get("done"):
+                final = chunk
+        if final is None:
+            raise RuntimeError("Stream ended before the response was complete")
+        return dict(final, message={"role": "assistant", "content": "".join(parts)}), upstream["retries"]
+
+    def _open_stream(self, url: str, payload: Dict[str, Any], retry: bool = True) -> requests.Response:
+        """
+        Open a streaming request to the Ollama API
+
+        Retries only happen while establishing the response; once the server
+        has started answering, failures are surfaced to the caller because the
+        partial output may already have been consumed.
+        """
+        try:
+            return self.transport.post(url, json=payload, stream=True, retry=retry)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"API request failed: {str(e)}")
+            raise
+
+    def _iter_chunks(self, response: requests.Response) -> Iterator[Dict[str, Any]]:
+        """Decode the NDJSON body of a streaming response as it arrives"""
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"])
+            yield as_chat_reply(chunk)
+
+    def _stream_chunks(self, payload: Dict[str, Any], upstream: Dict[str, Any],
+                       path: str = CHAT_PATH) -> Iterator[Dict[str, Any]]:
+        """Open a streaming request and yield its chunks; stores the retry count in ``upstream``"""
+        cancelled = self._cancelled
+        if cancelled.is_set():
+            raise GenerationCancelled()
+        tried = []
+        while True:
+            response = None
+            try:
+                with self.router.route(self._affinity(), exclude=tried) as backend:
+                    tried.append(backend)
+                    # Fail over to another backend straight away rather than retrying this one
+                    response = self._open_stream(backend.url + path, payload,
+                                                 retry=not self.router.can_fail_over(tried))
+                    upstream["retries"] = response.retries
+                    self._open_streams.add(response)
+                    try:
+                        # cancel() may have come while the request was being sent
+                        if cancelled.is_set():
+                            raise GenerationCancelled()
+                        for chunk in self._iter_chunks(response):
+                            if chunk.get("done"):
+                                self.residency.observe(backend.url, payload["model"], chunk)
+                            yield chunk
+                        if cancelled.is_set():
+                            raise GenerationCancelled()
+                    except Exception as e:
+                        # The aborted connection surfaces as a read error; that is not the backend's fault
+                        if cancelled.is_set() and not isinstance(e, GenerationCancelled):
+                            raise GenerationCancelled() from e
+                        raise
+                    finally:
+                        self._open_streams.discard(response)
+                        response.close()
+                return
+            except Exception as e:
+                # Only a request that got no response at all can be sent elsewhere
+                if response is not None or cancelled.is_set() or not self.router.failover(e, tried):
+                    raise
+                self.logger.warning(f"Request to {tried[-1].url} failed: {str(e)}; trying another backend")
             
     def chat(self, user_input: str) -> str:
         """
@@ -80,61 +732,279 @@ class OllamaChat:
             
         Returns:
             str: The model's response
+        
+        Raises:
+            GenerationCancelled: If ``cancel()`` was called before the reply was complete
         """
-        # Prepare messages including history
-        messages = [{"role": "system", "content": self.config["system"]["prompt"]}]
-        messages.extend(self.history)
-        messages.append({"role": "user", "content": user_input})
+        start = time.perf_counter()
+        self._begin_turn()
+        messages = self._build_messages(user_input)
+        semantic = self._semantic_lookup(messages)
+        if semantic is not None and "response" in semantic:
+            self._record_metrics(start, cached=True)
+            self._record_turn(user_input, semantic["response"])
+            return semantic["response"]
         
         try:
             # Get response from model
-            response = self._make_request(messages)
+            response = self._make_request(messages, user_input)
             
             # Extract assistant's message
             assistant_message = response["message"]["content"]
             
             # Update conversation history
-            self.history.append({"role": "user", "content": user_input})
-            self.history.append({"role": "assistant", "content": assistant_message})
+            self._record_turn(user_input, assistant_message)
+            self._finish_turn(response)
+            self._semantic_store(messages, semantic, assistant_message)
             
             return assistant_message
             
+        except GenerationCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"Chat failed: {str(e)}")
+            # In case the server rejected the context itself
+            self._drop_context()
             return f"An error occurred: {str(e)}"
+
+    def complete(self, user_input: str) -> Dict[str, Any]:
+        """
+        Send a single message without touching the conversation history
+        
+        Args:
+            user_input (str): The user's input message
+            
+        Returns:
+            dict: The raw API response, including Ollama's timing and token counts
+        """
+        self._begin_turn()
+        self._refresh_config()
+        messages = [
+            {"role": "system", "content": self.config.system_prompt},
+            {"role": "user", "content": user_input}
+        ]
+        return self._make_request(messages)
+
+    def chat_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Send a message to the model and yield the response as it is generated
+        
+        The exchange is only added to the history once the final ``done``
+        chunk arrives, so an interrupted stream leaves the history untouched.
+        
+        Args:
+            user_input (str): The user's input message
+            
+        Yields:
+            str: Incremental pieces of the model's response
+            
+        Raises:
+            GenerationCancelled: If ``cancel()`` was called; closing the
+                generator early also stops the generation
+        """
+        start = time.perf_counter()
+        turn = self._begin_turn()
+        messages = self._build_messages(user_input)
+        payload = self._build_payload(messages, stream=True)
+        
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_metrics(start, cached=True)
+                assistant_message = cached["message"]["content"]
+                yield assistant_message
+                self._record_turn(user_input, assistant_message)
+                return
+        
+        semantic = self._semantic_lookup(messages)
+        if semantic is not None and "response" in semantic:
+            self._record_metrics(start, cached=True)
+            yield semantic["response"]
+            self._record_turn(user_input, semantic["response"])
+            return
+        
+        upstream = {}
+        request, path = self._upstream_request(payload, user_input)
+        flight = self._flight_key(payload)
+        if flight is None:
+            chunks, coalesced = self._stream_chunks(request, upstream, path), False
+        else:
+            owner = self._detached()
+            chunks, coalesced = self.inflight.stream(
+                flight, lambda: owner._stream_chunks(request, upstream, path), turn, owner.cancel
+            )
+        parts = []
+        ttft = None
+        final = None
+        
+        try:
+            # Read to the end of the body even after ``done`` so the
+            # keep-alive connection goes back to the pool instead of being closed
+            for chunk in chunks:
+                delta = chunk.get("message", {}).get("content", "")
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta)
+                    yield delta
+                if chunk.get("done"):
+                    final = chunk
+            # A coalesced stream may run to the end after this conversation was cancelled
+            if turn.is_set():
+                raise GenerationCancelled()
+            if final is None:
+                raise RuntimeError("Stream ended before the response was complete")
+        except Exception as e:
+            if turn.is_set():
+                self._record_metrics(start, ttft=ttft, cancelled=True)
+                self.logger.info("Reply cancelled; the partial turn was discarded")
+                if isinstance(e, GenerationCancelled):
+                    raise
+                raise GenerationCancelled() from e
+            self._record_metrics(start, ttft=ttft, error=True)
+            self.logger.error(f"Chat stream failed: {str(e)}")
+            self._drop_context()
+            raise
+        except BaseException:
+            # The caller stopped reading (closed the generator) or was interrupted
+            self._record_metrics(start, ttft=ttft, cancelled=True)
+            raise
+        finally:
+            chunks.close()
+        
+        self._record_metrics(start, final, ttft=ttft, retries=upstream.get("retries", 0),
+                             coalesced=coalesced)
+        assistant_message = "".join(parts)
+        self._record_turn(user_input, assistant_message)
+        self._finish_turn(final)
+        self._semantic_store(messages, semantic, assistant_message)
+        if cache_key is not None and not coalesced:
+            # Copy: coalesced waiters are still reading the shared final chunk
+            self.cache.put(cache_key, dict(cacheable(final), message={"role": "assistant",
+                                                                      "content": assistant_message}))
             
     def reset_conversation(self):
         """Clear the conversation history"""
-        self.history = []
+        self.history.clear()
+        self._drop_context()
         self.logger.info("Conversation history reset")
 
+def print_stats(chat_client: OllamaChat):
+    """Print request latency percentiles, cache and history statistics"""
+    print(f"\n{format_summary(chat_client.metrics.summary())}")
+    if chat_client.cache is not None:
+        cache = chat_client.cache.stats()
+        print(f"cache: hit_rate={cache['hit_rate']:.0%} entries={cache['entries']} "
+              f"size={cache['size_bytes'] / 1024:.0f}KB")
+    for backend in chat_client.router.stats()["backends"]:
+        state = "up" if backend["healthy"] else "ejected"
+        print(f"backend {backend['url']}: {state}, {backend['outstanding']} outstanding, "
+              f"{backend['requests']} requests, {backend['errors']} errors")
+    if chat_client.semantic_cache is not None:
+        semantic = chat_client.semantic_cache.stats()
+        print(f"semantic cache: hit_rate={semantic['hit_rate']:.0%} entries={semantic['entries']}/"
+              f"{semantic['capacity']} similarity p50={semantic['similarity_p50']:.3f} "
+              f"p95={semantic['similarity_p95']:.3f} (threshold {semantic['threshold']})")
+    residency = chat_client.residency.stats()
+    print(f"models: {residency['cold_starts']} cold starts, {residency['preloads']} preloaded, "
+          f"{residency['unloads']} unloaded, load time p50={residency['load_p50']:.2f}s "
+          f"p95={residency['load_p95']:.2f}s")
+    for model in residency["models"]:
+        idle = f", idle {model['idle_seconds']:.0f}s" if model["idle_seconds"] is not None else ""
+        print(f"  {model['model']} on {model['url']}: {'hot' if model['hot'] else 'cold'}{idle}")
+    if chat_client.last_turn:
+        turn = chat_client.last_turn
+        print(f"last turn: prompt_eval_count={turn['prompt_eval_count']} eval_count={turn['eval_count']} "
+              f"(context {turn['context']}; {chat_client.context_turns['reused']} turns reused it, "
+              f"{chat_client.context_turns['new']} started a new one)")
+    history = chat_client.history.stats()
+    print(f"history: {history['messages']} messages, {history['window_messages']} in window, "
+          f"{history['last_saved_tokens']} tokens trimmed from the last request")
+
+def print_sessions(chat_client: OllamaChat):
+    """List stored sessions, most recently used first"""
+    sessions = chat_client.session_store.list_sessions()
+    if not sessions:
+        print("No stored sessions.")
+    for session in sessions:
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(session["updated"]))
+        marker = "*" if session["name"] == chat_client.session else " "
+        print(f"{marker} {session['name']:<24} {session['messages']:>6} messages, last used {updated}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Chat with an Ollama model in the terminal")
+    parser.add_argument("--session", help="Resume or start a named, persistent session")
+    parser.add_argument("--list-sessions", action="store_true", help="List stored sessions and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print an import and initialization timing breakdown")
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        profiler.enabled = True
+        profiler.started = _STARTED
+        profiler.record("imports (main.py)", _STARTED, _IMPORTED)
+    
     try:
-        # Initialize the chat client
-        chat_client = OllamaChat()
+        # Initialize the chat client; the server probe runs while the prompt is up
+        with profiler.phase("client init"):
+            chat_client = OllamaChat(wait_for_server=False)
+            apply_environment(chat_client.config)
         
-        print("Chat initialized. Type 'quit' to exit or 'reset' to clear history.")
+        if args.list_sessions:
+            print_sessions(chat_client)
+            return
+        if args.session:
+            chat_client.attach_session(args.session)
+            print(f"Session '{args.session}': {len(chat_client.history)} recent messages loaded.")
         
-        while True:
-            try:
-                user_input = input("\nYou: ").strip()
+        print("Chat initialized. Type 'quit' to exit, 'reset' to clear history, "
+              "'/sessions' to list sessions or '/stats' for performance stats.")
+        profiler.mark("prompt ready")
+        if args.profile_startup:
+            # Only the report waits for the probe; the timings above are already taken
+            chat_client.server_checked.wait(timeout=30)
+            profiler.print_report()
+        
+        try:
+            while True:
+                try:
+                    user_input = input("\nYou: ").strip()
                 
-                if user_input.lower() == 'quit':
+                    if user_input.lower() == 'quit':
+                        break
+                    elif user_input.lower() == 'reset':
+                        chat_client.reset_conversation()
+                        print("Conversation history cleared.")
+                        continue
+                    elif user_input.lower() == '/stats':
+                        print_stats(chat_client)
+                        continue
+                    elif user_input.lower() == '/sessions':
+                        print_sessions(chat_client)
+                        continue
+
+                    if user_input:
+                        print("\nAssistant: ", end="", flush=True)
+                        stream = chat_client.chat_stream(user_input)
+                        try:
+                            for token in stream:
+                                print(token, end="", flush=True)
+                            print()
+                        except KeyboardInterrupt:
+                            # Ctrl-C stops the reply (and Ollama's generation); again at the prompt quits
+                            stream.close()
+                            print("\n[stopped]")
+                except (KeyboardInterrupt, EOFError):
+                    print("\nExiting chat...")
                     break
-                elif user_input.lower() == 'reset':
-                    chat_client.reset_conversation()
-                    print("Conversation history cleared.")
+                except Exception as e:
+                    print(f"\nError: {str(e)}")
                     continue
-                
-                if user_input:
-                    response = chat_client.chat(user_input)
-                    print(f"\nAssistant: {response}")
-            except KeyboardInterrupt:
-                print("\nExiting chat...")
-                break
-            except Exception as e:
-                print(f"\nError: {str(e)}")
-                continue
+        finally:
+            if chat_client.session:
+                # Turns still queued for the writer thread would be lost at exit
+                chat_client.session_store.close()
                 
     except Exception as e:
         print(f"Failed to initialize chat: {str(e)}")
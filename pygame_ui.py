@@ -1,20 +1,26 @@
+import time
+# Taken before the other imports so --profile-startup can report their cost
+_STARTED = time.perf_counter()
+
 import pygame
 import sys
-import toml
 import threading
-from queue import Queue
-from langchain_ollama import OllamaLLM
-from langchain.callbacks.base import BaseCallbackHandler
-import textwrap
-import re
-from pathlib import Path
+import logging
+from queue import Queue, Empty
+import argparse
+from bisect import bisect_right
+from utils.config import get_config
+from utils.text_layout import get_metrics, wrap_text, wrap_code
+from utils.render_cache import get_font, surface_cache
+from utils.startup import profiler
+
+_IMPORTED = time.perf_counter()
 
-# Load config
-config = toml.load("config.toml")
+logger = logging.getLogger(__name__)
 
-# Initialize Pygame
-pygame.init()
-pygame.font.init()
+# Finer than DEBUG, for per-token diagnostics on the streaming hot path
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
 
 # Constants
 WINDOW_WIDTH = 1200
@@ -24,11 +30,21 @@ INPUT_HEIGHT = 60
 PADDING = 20
 MAX_LINE_LENGTH = 80
 FONT_SIZE = 16
+CODE_LINE_HEIGHT = 20  # pixels per line of a code block
 SCROLL_SPEED = 30
 MESSAGE_SPACING = 20
 BUBBLE_RADIUS = 15
 LOADING_DOTS_INTERVAL = 500  # milliseconds between dots
 MAX_LOADING_DOTS = 3
+CURSOR_BLINK_INTERVAL = 500  # milliseconds per cursor blink phase
+STOP_BUTTON_WIDTH = 80
+COLUMN_GAP = 16  # pixels between the replies of compared models
+COLUMN_LABEL_HEIGHT = 26
+SURFACE_CACHE_MB = 32  # memory cap for cached rendered text lines
+TEXT_FONT = ('Arial', FONT_SIZE)
+CODE_FONT = ('Courier New', FONT_SIZE)
+
+surface_cache.max_bytes = SURFACE_CACHE_MB * 1024 * 1024
 
 # Colors
 THEME = {
@@ -47,64 +63,116 @@ THEME = {
     'scrollbar_hover': (180, 180, 180),
     'loading_color': (150, 150, 150),
     'loading_bubble': (245, 245, 245),
+    'stop_button': (220, 53, 69),
+    'stop_text': (255, 255, 255),
+    'column_label': (90, 90, 90),
 }
 
-class StreamHandler(BaseCallbackHandler):
-    """Handler for streaming LLM responses"""
+class StreamHandler:
+    """Handler for streaming LLM responses
+    
+    Only the new token is put on the queue; the UI thread coalesces pending
+    deltas once per frame. Each reply gets its own handler; once cancelled
+    it queues nothing more, so a stopped reply cannot leak into the next.
+    """
     def __init__(self, response_queue):
         self.response_queue = response_queue
-        self.current_response = ""
+        self._chunks = []
+        self.is_complete = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+        logger.debug("StreamHandler initialized")
+
+    @property
+    def current_response(self):
+        return "".join(self._chunks)
+
+    def reset(self):
+        self._chunks = []
         self.is_complete = False
-        print("DEBUG: StreamHandler initialized")
 
     def on_llm_start(self, *args, **kwargs):
         """Called when LLM starts processing"""
-        print("DEBUG: LLM processing started")
-        self.current_response = ""
-        self.is_complete = False
+        logger.debug("LLM processing started")
+        self.reset()
+
+    def cancel(self):
+        """Stop queueing; after this returns nothing more from this reply reaches the queue"""
+        with self._lock:
+            self.cancelled = True
+            self.is_complete = True
 
-    def on_llm_new_token(self, token: str, **kwargs):
-        """Called when LLM produces a new token"""
-        if token is None:
-            print("DEBUG: Received None token")
+    def _put(self, item):
+        with self._lock:
+            if not self.cancelled:
+                self.response_queue.put(item)
+
+    def on_llm_new_token(self, token: str, column=None, **kwargs):
+        """Called when LLM produces a new token; ``column`` is the model's index when comparing"""
+        if not token or self.is_complete:
             return
-            
-        print(f"DEBUG: New token received: '{token}'")
-        if not self.is_complete:
-            self.current_response += token
-            print(f"DEBUG: Current response length: {len(self.current_response)}")
-            if self.current_response.strip():
-                print(f"DEBUG: Sending streaming response: '{self.current_response}'")
-                self.response_queue.put(("streaming", self.current_response))
+        if column is not None:
+            self._put(("column_delta", (column, token)))
+            return
+        with self._lock:
+            if self.cancelled:
+                return
+            self._chunks.append(token)
+            self.response_queue.put(("delta", token))
+        if logger.isEnabledFor(TRACE):
+            logger.log(TRACE, f"New token received: {token!r}")
 
     def on_llm_end(self, *args, **kwargs):
         """Called when LLM response is complete"""
-        print("DEBUG: LLM response complete")
+        logger.debug("LLM response complete")
+        with self._lock:
+            if self.cancelled:
+                return
+            self.is_complete = True
+            response = self.current_response
+            if response.strip():
+                self.response_queue.put(("complete", response))
+            else:
+                logger.debug("No response to send at completion")
+
+    def on_columns_start(self, labels):
+        """Called when a comparison starts, with the column labels"""
+        self._put(("columns", list(labels)))
+
+    def on_column_end(self, column, footer):
+        """Called when one compared model is done"""
+        self._put(("column_end", (column, footer)))
+
+    def on_columns_end(self, footers):
+        """Called when every compared model is done (or was cancelled)"""
+        self._put(("columns_complete", list(footers)))
         self.is_complete = True
-        if self.current_response.strip():
-            print(f"DEBUG: Sending final response: '{self.current_response}'")
-            self.response_queue.put(("complete", self.current_response))
-        else:
-            print("DEBUG: No response to send at completion")
 
     def on_llm_error(self, error: Exception, **kwargs):
         """Called if LLM encounters an error"""
-        print(f"DEBUG: LLM error occurred: {str(error)}")
-        self.is_complete = True
-        error_msg = f"Error: {str(error)}"
-        print(f"DEBUG: Sending error message: '{error_msg}'")
-        self.response_queue.put(("error", error_msg))
+        logger.error(f"LLM error occurred: {str(error)}")
+        with self._lock:
+            if self.cancelled:
+                return
+            self.is_complete = True
+            self.response_queue.put(("error", f"Error: {str(error)}"))
 
 class ModernTextBox:
     def __init__(self, x, y, width, height):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = ""
         self.active = False
-        self.font = pygame.font.SysFont('Arial', 16)
+        self.font = get_font(*TEXT_FONT)
         self.cursor_visible = True
-        self.cursor_timer = 0
         self.padding = 10
 
+    def update_cursor(self):
+        """Advance the cursor blink; return True if the box needs repainting"""
+        visible = pygame.time.get_ticks() // CURSOR_BLINK_INTERVAL % 2 == 0
+        changed = visible != self.cursor_visible
+        self.cursor_visible = visible
+        return changed and self.active
+
     def draw(self, surface):
         # Draw background
         pygame.draw.rect(surface, THEME['input_bg'], self.rect, border_radius=10)
@@ -122,8 +190,7 @@ class ModernTextBox:
             surface.blit(text_surf, text_rect)
 
         # Draw cursor
-        self.cursor_timer += 1
-        if self.active and self.cursor_timer // 30 % 2 == 0:
+        if self.active and self.cursor_visible:
             text_width = self.font.size(self.text)[0]
             cursor_x = self.rect.left + self.padding + text_width
             pygame.draw.line(
@@ -134,88 +201,193 @@ class ModernTextBox:
                 2
             )
 
+def split_blocks(text):
+    """
+    Split message text into paragraphs and fenced code blocks
+    
+    Returns a list of (kind, start, end) tuples. Every block but the last is
+    final: its text can no longer change when more text is appended.
+    """
+    blocks = []
+    pos = 0
+    while pos < len(text):
+        fence = text.find('```', pos)
+        prose_end = len(text) if fence == -1 else fence
+        while pos < prose_end:
+            paragraph_end = text.find('\n\n', pos, prose_end)
+            if paragraph_end == -1:
+                blocks.append(('text', pos, prose_end))
+                pos = prose_end
+            else:
+                blocks.append(('text', pos, paragraph_end))
+                pos = paragraph_end + 2
+        if fence == -1:
+            break
+        close = text.find('```', fence + 3)
+        end = len(text) if close == -1 else close + 3
+        blocks.append(('code', fence, end))
+        pos = end
+    return blocks
+
 class MessageBubble:
     def __init__(self, text, is_user, width):
         self.text = text
         self.is_user = is_user
         self.width = width - 100  # Padding for bubbles
-        self.font = pygame.font.SysFont('Arial', 16)
-        self.code_font = pygame.font.SysFont('Courier New', 16)
-        self.rendered_surfaces = None
+        self.metrics = get_metrics(get_font(*TEXT_FONT), TEXT_FONT)
+        self.code_metrics = get_metrics(get_font(*CODE_FONT), CODE_FONT)
+        self.text_height = get_font(*TEXT_FONT).get_height()
         self.height = 0
         self.render()
 
+    def set_width(self, width):
+        """Re-lay out the message for a new window width"""
+        self.width = width - 100
+        self.render()
+
     def render(self):
-        surfaces = []
-        y_offset = 0
-        
-        # Split into regular text and code blocks
-        parts = re.split(r'(```.*?```)', self.text, flags=re.DOTALL)
+        """Lay out the whole message from scratch"""
+        self._done_blocks = []
+        self._done_height = 0
+        self._tail_start = 0
+        self._layout_tail()
+
+    def append(self, text):
+        """Append streamed text, re-laying out only the block still being written"""
+        if not text:
+            return
+        self.text += text
+        self._layout_tail()
+
+    def _layout_tail(self):
+        # Blocks before the last one are final, so their lines are kept for good
+        blocks = split_blocks(self.text[self._tail_start:])
+        base = self._tail_start
+        for kind, start, end in blocks[:-1]:
+            block = self._layout_block(kind, self.text[base + start:base + end])
+            self._done_blocks.append(block)
+            self._done_height += self._block_height(block)
         
-        for part in parts:
-            if part.startswith('```') and part.endswith('```'):
-                # Handle code block
-                code_lines = part.strip('`').split('\n')[1:-1]  # Remove first and last lines
-                code_surface = pygame.Surface((self.width - 20, len(code_lines) * 20))
-                code_surface.fill(THEME['code_bg'])
-                
-                for i, line in enumerate(code_lines):
-                    code_text = self.code_font.render(line, True, THEME['code_text'])
-                    code_surface.blit(code_text, (10, i * 20))
-                
-                surfaces.append(('code', code_surface))
-                y_offset += code_surface.get_height() + 10
-            else:
-                # Handle regular text
-                words = part.split()
-                lines = []
-                current_line = []
-                
-                for word in words:
-                    current_line.append(word)
-                    text_width = self.font.size(' '.join(current_line))[0]
-                    if text_width > self.width - 40:
-                        lines.append(' '.join(current_line[:-1]))
-                        current_line = [word]
-                
-                if current_line:
-                    lines.append(' '.join(current_line))
-                
-                for line in lines:
-                    text_surface = self.font.render(line, True, 
-                        THEME['user_text'] if self.is_user else THEME['assistant_text'])
-                    surfaces.append(('text', text_surface))
-                    y_offset += text_surface.get_height() + 5
+        self._tail_blocks = []
+        if blocks:
+            kind, start, end = blocks[-1]
+            self._tail_start = base + start
+            self._tail_blocks = [self._layout_block(kind, self.text[base + start:base + end])]
+        self.height = self._done_height + sum(self._block_height(block) for block in self._tail_blocks)
+
+    def _layout_block(self, kind, text):
+        # Only the wrapped lines are kept; draw() fetches their surfaces from surface_cache
+        if kind == 'code':
+            return kind, self._layout_code(text)
+        return kind, wrap_text(text, self.metrics, self.width - 40, MAX_LINE_LENGTH).lines
 
-        self.rendered_surfaces = surfaces
-        self.height = y_offset
+    def _layout_code(self, part):
+        code_lines = part.strip('`').split('\n')[1:]  # Drop the language line
+        if part.endswith('```') and len(part) > 3:
+            code_lines = code_lines[:-1]  # Drop the line holding the closing fence
+        if not code_lines:
+            return []
+        return wrap_code('\n'.join(code_lines), self.code_metrics, self.width - 40).lines
+
+    def _block_height(self, block):
+        kind, lines = block
+        if kind == 'code':
+            return len(lines) * CODE_LINE_HEIGHT + 10
+        return len(lines) * (self.text_height + 5)
 
     def draw(self, surface, x, y):
         current_y = y
-        bubble_color = THEME['user_bubble'] if self.is_user else THEME['assistant_bubble']
-        
-        for type_, text_surface in self.rendered_surfaces:
-            if type_ == 'code':
-                pygame.draw.rect(surface, THEME['code_bg'],
-                    (x - 5, current_y - 5, text_surface.get_width() + 10, text_surface.get_height() + 10),
-                    border_radius=5)
-                surface.blit(text_surface, (x, current_y))
-                current_y += text_surface.get_height() + 10
+        for kind, lines in self._done_blocks + self._tail_blocks:
+            if kind == 'code':
+                self._draw_code(surface, lines, x, current_y)
             else:
-                text_rect = text_surface.get_rect()
-                text_rect.topleft = (x, current_y)
-                
-                # Draw bubble background
-                bubble_rect = text_rect.inflate(20, 10)
-                if self.is_user:
-                    bubble_rect.right = surface.get_width() - 20
-                pygame.draw.rect(surface, bubble_color, bubble_rect, border_radius=10)
-                
-                # Draw text
-                if self.is_user:
-                    text_rect.right = surface.get_width() - 30
-                surface.blit(text_surface, text_rect)
-                current_y += text_rect.height + 5
+                self._draw_text(surface, lines, x, current_y)
+            current_y += self._block_height((kind, lines))
+
+    def _draw_code(self, surface, lines, x, y):
+        height = len(lines) * CODE_LINE_HEIGHT
+        pygame.draw.rect(surface, THEME['code_bg'], (x - 5, y - 5, self.width - 10, height + 10),
+                         border_radius=5)
+        clip = surface.get_clip()
+        surface.set_clip(pygame.Rect(x, y, self.width - 20, height).clip(clip))
+        for i, line in enumerate(lines):
+            line_y = y + i * CODE_LINE_HEIGHT
+            if clip.top - CODE_LINE_HEIGHT < line_y < clip.bottom:
+                surface.blit(surface_cache.render(CODE_FONT, line, THEME['code_text']), (x + 10, line_y))
+        surface.set_clip(clip)
+
+    def _draw_text(self, surface, lines, x, y):
+        clip = surface.get_clip()
+        bubble_color = THEME['user_bubble'] if self.is_user else THEME['assistant_bubble']
+        text_color = THEME['user_text'] if self.is_user else THEME['assistant_text']
+        for i, line in enumerate(lines):
+            line_y = y + i * (self.text_height + 5)
+            # Lines scrolled out of view are never rendered
+            if not clip.top - self.text_height - 10 < line_y < clip.bottom + 5:
+                continue
+            text_surface = surface_cache.render(TEXT_FONT, line, text_color)
+            text_rect = text_surface.get_rect()
+            text_rect.topleft = (x, line_y)
+            
+            # Draw bubble background
+            bubble_rect = text_rect.inflate(20, 10)
+            if self.is_user:
+                bubble_rect.right = surface.get_width() - 20
+            pygame.draw.rect(surface, bubble_color, bubble_rect, border_radius=10)
+            
+            # Draw text
+            if self.is_user:
+                text_rect.right = surface.get_width() - 30
+            surface.blit(text_surface, text_rect)
+
+class ColumnBubble:
+    """The replies of several models to one message, side by side"""
+    def __init__(self, count, width):
+        self.is_user = False
+        self.labels = ["" for _ in range(count)]
+        self.footers = ["" for _ in range(count)]
+        self.columns = []
+        self.set_width(width)
+
+    def set_width(self, width):
+        count = len(self.labels)
+        self.column_width = (width - 2 * PADDING - COLUMN_GAP * (count - 1)) // count
+        # MessageBubble keeps 100px of padding and wraps text 40px inside that
+        texts = [column.text for column in self.columns] or ["" for _ in range(count)]
+        self.columns = [MessageBubble(text, False, self.column_width + 120) for text in texts]
+        self._measure()
+
+    @property
+    def text(self):
+        return "\n\n".join(column.text for column in self.columns)
+
+    def append(self, column, text):
+        self.columns[column].append(text)
+        self._measure()
+
+    def set_footer(self, column, footer):
+        self.footers[column] = footer
+        self._measure()
+
+    def _measure(self):
+        footer = COLUMN_LABEL_HEIGHT if any(self.footers) else 0
+        self.height = COLUMN_LABEL_HEIGHT + max(column.height for column in self.columns) + footer
+
+    def _draw_label(self, surface, text, x, y):
+        label = surface_cache.render(TEXT_FONT, text, THEME['column_label'])
+        # Clip long labels to their column
+        surface.blit(label, (x, y), pygame.Rect(0, 0, self.column_width, label.get_height()))
+
+    def draw(self, surface, x, y):
+        for index, column in enumerate(self.columns):
+            column_x = x + index * (self.column_width + COLUMN_GAP)
+            if self.labels[index]:
+                self._draw_label(surface, self.labels[index], column_x, y)
+            # Bubbles overhang their text by 10px on the left
+            column.draw(surface, column_x + 10, y + COLUMN_LABEL_HEIGHT)
+            if self.footers[index]:
+                self._draw_label(surface, self.footers[index], column_x,
+                                 y + COLUMN_LABEL_HEIGHT + column.height)
 
 class LoadingBubble:
     def __init__(self, width):
@@ -223,7 +395,15 @@ class LoadingBubble:
         self.height = 40
         self.dots_count = 0
         self.last_update = pygame.time.get_ticks()
-        self.font = pygame.font.SysFont('Arial', 16)
+
+    def update(self):
+        """Advance the dots animation; return True if it changed"""
+        current_time = pygame.time.get_ticks()
+        if current_time - self.last_update < LOADING_DOTS_INTERVAL:
+            return False
+        self.dots_count = (self.dots_count + 1) % (MAX_LOADING_DOTS + 1)
+        self.last_update = current_time
+        return True
 
     def render(self, surface, x, y):
         # Draw bubble background
@@ -231,20 +411,71 @@ class LoadingBubble:
         pygame.draw.rect(surface, THEME['loading_bubble'], bubble_rect, border_radius=10)
         
         # Draw loading dots
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_update >= LOADING_DOTS_INTERVAL:
-            self.dots_count = (self.dots_count + 1) % (MAX_LOADING_DOTS + 1)
-            self.last_update = current_time
-        
         dots = "." * self.dots_count
-        text_surface = self.font.render(f"Thinking{dots}", True, THEME['loading_color'])
+        text_surface = surface_cache.render(TEXT_FONT, f"Thinking{dots}", THEME['loading_color'])
         text_rect = text_surface.get_rect(center=bubble_rect.center)
         surface.blit(text_surface, text_rect)
         
         return self.height
 
+class MessageLayout:
+    """Cumulative message heights, so scrolling and culling need no full pass"""
+    def __init__(self, spacing):
+        self.spacing = spacing
+        self._heights = []
+        self._ends = []  # _ends[i]: offset just past message i and its spacing
+
+    def reset(self, messages):
+        """Measure ``messages`` from scratch, e.g. after the list was replaced"""
+        self._heights = []
+        self._ends = []
+        for message in messages:
+            self._push(message.height)
+
+    def _push(self, height):
+        start = self._ends[-1] if self._ends else 0
+        self._heights.append(height)
+        self._ends.append(start + height + self.spacing)
+
+    def sync(self, messages):
+        """Catch up with appended messages and a changed last message"""
+        if len(messages) < len(self._heights):
+            self.reset(messages)
+            return
+        for message in messages[len(self._heights):]:
+            self._push(message.height)
+        if messages and self._heights[-1] != messages[-1].height:
+            # Only the streaming bubble changes height, so patch the tail
+            delta = messages[-1].height - self._heights[-1]
+            self._heights[-1] += delta
+            self._ends[-1] += delta
+
+    def top(self, index):
+        return self._ends[index - 1] if index else 0
+
+    @property
+    def content_height(self):
+        return self._ends[-1] if self._ends else 0
+
+    def visible_range(self, start, end):
+        """Return (first, last) indexes of messages overlapping [start, end)"""
+        first = bisect_right(self._ends, start)
+        last = first
+        while last < len(self._ends) and self.top(last) < end:
+            last += 1
+        return first, last
+
 class ModernChatUI:
-    def __init__(self):
+    def __init__(self, config_path="config.toml", session=None, compare=None, first_wins=False):
+        """
+        Args:
+            config_path (str): Path to the config file
+            session (str): Persistent session to resume
+            compare (list): Model specs (see fanout.ModelVariant.parse) to send
+                every message to at once, shown in side-by-side columns
+            first_wins (bool): When comparing, stop the others once one model is done
+        """
+        pygame.init()
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption("Chat with Lamma2")
         
@@ -256,101 +487,211 @@ class ModernChatUI:
         )
         
         self.messages = []
+        self.layout = MessageLayout(MESSAGE_SPACING)
         self.scroll_offset = 0
+        self.needs_redraw = True
         self.response_queue = Queue()
         self.stream_handler = StreamHandler(self.response_queue)
         
-        print("DEBUG: Initializing LLM with model:", config['model']['name'])
-        # Initialize OllamaLLM with proper streaming configuration
-        self.llm = OllamaLLM(
-            model=config['model']['name'],
-            callbacks=[self.stream_handler],
-            temperature=0.7,
-            base_url="http://localhost:11434",
-            system="You are a helpful AI assistant focused on providing clear, accurate, and detailed responses."
-        )
+        # The chat client is built in the background by start_client()
+        self.config_path = config_path
+        self.session = session
+        self.chat_client = None
+        self.client_error = None
+        self.client_ready = threading.Event()
+        self.compare = list(compare or [])
+        self.first_wins = first_wins
+        self.fanout = None
+        
         self.is_generating = False
         self.loading_bubble = LoadingBubble(WINDOW_WIDTH)
         self.current_response = ""
+        box = self.input_box.rect
+        self.stop_button = pygame.Rect(box.right - STOP_BUTTON_WIDTH - 10, box.top + 10,
+                                       STOP_BUTTON_WIDTH, box.height - 20)
+
+    def start_client(self):
+        """Create the chat client off the UI thread so the window is usable at once"""
+        def init_client():
+            try:
+                with profiler.phase("import chat client"):
+                    from main import OllamaChat
+                with profiler.phase("client init"):
+                    chat_client = OllamaChat(self.config_path, wait_for_server=False)
+                if self.session:
+                    chat_client.attach_session(self.session)
+                    self.response_queue.put(("history", list(chat_client.history)))
+                if self.compare:
+                    from fanout import FanOut, ModelVariant
+                    self.fanout = FanOut(chat_client, [ModelVariant.parse(spec) for spec in self.compare],
+                                         first_wins=self.first_wins)
+                self.chat_client = chat_client
+            except Exception as e:
+                logger.exception("Failed to initialize the chat client")
+                self.client_error = e
+            finally:
+                self.client_ready.set()
+
+        threading.Thread(target=init_client, name="client-init", daemon=True).start()
 
     def handle_llm_response(self):
-        def run_llm(text):
+        def run_llm(text, handler):
             try:
-                print(f"DEBUG: Starting LLM response for text: '{text}'")
-                # Reset the stream handler's state
-                self.stream_handler.current_response = ""
-                self.stream_handler.is_complete = False
+                logger.debug(f"Starting LLM response for text: '{text}'")
+                # Messages sent while the client is still starting wait here
+                self.client_ready.wait()
+                if self.chat_client is None:
+                    raise RuntimeError(f"Chat client unavailable: {self.client_error}")
+                if handler.cancelled:
+                    return
                 
-                print("DEBUG: Making LLM call...")
-                try:
-                    # Get the last user message
-                    if not self.messages:
-                        print("DEBUG: No messages found")
+                if self.fanout is not None:
+                    self._run_fanout(text, handler)
+                    return
+                
+                handler.on_llm_start()
+                stream = self.chat_client.chat_stream(text)
+                for token in stream:
+                    if handler.cancelled:
+                        # Closing the stream closes the connection, so Ollama stops generating
+                        stream.close()
                         return
-                        
-                    user_text = text
-                    print(f"DEBUG: Using user text: '{user_text}'")
-                    
-                    # Create a chat message
-                    prompt = f"Human: {user_text}\nAssistant: "
-                    print(f"DEBUG: Using prompt: '{prompt}'")
-                    
-                    # Make the LLM call with the formatted prompt
-                    print("DEBUG: Calling LLM invoke...")
-                    response = self.llm.invoke(user_text)
-                    print(f"DEBUG: Raw LLM response received: '{response}'")
-                    
-                    # If streaming didn't work, send the complete response
-                    if not self.stream_handler.is_complete and response:
-                        print(f"DEBUG: Streaming didn't work, sending complete response: '{response}'")
-                        self.response_queue.put(("complete", str(response)))
-                    
-                except Exception as llm_error:
-                    print(f"DEBUG: LLM invocation error: {str(llm_error)}")
-                    self.response_queue.put(("error", f"Error: {str(llm_error)}"))
-                    raise llm_error
-                    
+                    handler.on_llm_new_token(token)
+                handler.on_llm_end()
             except Exception as e:
-                print(f"DEBUG: Error in LLM call: {str(e)}")
-                self.response_queue.put(("error", f"Error: {str(e)}"))
+                if handler.cancelled:
+                    # GenerationCancelled, from the client's cancel()
+                    logger.debug("LLM call cancelled")
+                    return
+                logger.debug(f"Error in LLM call: {str(e)}")
+                handler.on_llm_error(e)
             finally:
-                print("DEBUG: LLM call completed")
-                self.is_generating = False
+                logger.debug("LLM call completed")
+                # A reply that was stopped must not clear the flag of the one that replaced it
+                if handler is self.stream_handler:
+                    self.is_generating = False
 
         # Get the last user message
-        if not self.messages or not self.messages[-2].is_user:  # Check second to last message
-            print("DEBUG: No valid user message found")
+        if len(self.messages) < 2 or not self.messages[-2].is_user:  # Check second to last message
+            logger.debug("No valid user message found")
             return
 
         user_text = self.messages[-2].text  # Get the text from the last user message
         if not user_text:
-            print("DEBUG: Empty user text")
+            logger.debug("Empty user text")
             return
 
-        print(f"DEBUG: Starting new thread for LLM response with text: '{user_text}'")
+        logger.debug(f"Starting new thread for LLM response with text: '{user_text}'")
         self.is_generating = True
-        thread = threading.Thread(target=run_llm, args=(user_text,))
+        self.stream_handler = StreamHandler(self.response_queue)
+        thread = threading.Thread(target=run_llm, args=(user_text, self.stream_handler))
         thread.daemon = True
         thread.start()
-        print("DEBUG: Thread started")
+        logger.debug("Thread started")
+
+    def _run_fanout(self, text, handler):
+        """Stream every compared model's reply into its column"""
+        handler.on_columns_start(self.fanout.labels)
+        stream = self.fanout.stream(text)
+        for index, delta in stream:
+            if handler.cancelled:
+                # Cancels every reply still running
+                stream.close()
+                return
+            if delta is None:
+                handler.on_column_end(index, self.fanout.last_results[index].describe())
+            else:
+                handler.on_llm_new_token(delta, column=index)
+        handler.on_columns_end([result.describe() for result in self.fanout.last_results])
+
+    def cancel_generation(self, restore_input=True):
+        """
+        Stop the reply being generated and take the unanswered turn back off the screen
+        
+        The chat client closes its connection to Ollama, which stops the
+        generation, and leaves its history as it was before the turn.
+        
+        Args:
+            restore_input (bool): Put the unanswered message back in the input box
+        """
+        if not self.is_generating:
+            return
+        logger.debug("Cancelling the reply in progress")
+        self.stream_handler.cancel()
+        if self.fanout is not None:
+            self.fanout.cancel()
+        elif self.chat_client is not None:
+            self.chat_client.cancel()
+        
+        if self.messages and isinstance(self.messages[-1], ColumnBubble):
+            # Models that already finished keep this turn in their history, so keep it on screen
+            self.process_responses()
+            columns = self.messages[-1]
+            if any(columns.footers):
+                for index, footer in enumerate(columns.footers):
+                    if not footer:
+                        columns.set_footer(index, "[cancelled]")
+                self.is_generating = False
+                return
+        
+        # Drop what the stopped reply queued before the handler was cancelled
+        pending = []
+        while True:
+            try:
+                item = self.response_queue.get_nowait()
+            except Empty:
+                break
+            if item[0] == "history":
+                pending.append(item)
+        for item in pending:
+            self.response_queue.put(item)
+        
+        if self.messages and not self.messages[-1].is_user:
+            self.messages.pop()
+        if self.messages and self.messages[-1].is_user:
+            user_text = self.messages.pop().text
+            if restore_input and not self.input_box.text:
+                self.input_box.text = user_text
+        self.is_generating = False
+        self.scroll_offset = max(0, self.get_total_height() - CHAT_AREA_HEIGHT)
+
+    def close(self):
+        """Write out the session's queued turns before the process exits"""
+        if self.chat_client is not None and self.chat_client.session:
+            self.chat_client.session_store.close()
 
     def run(self):
+        self.start_client()
         clock = pygame.time.Clock()
+        drawn_generating = self.is_generating
+        first_frame = True
         
         while True:
             for event in pygame.event.get():
+                self.needs_redraw = True
                 if event.type == pygame.QUIT:
+                    logger.info(f"Surface cache: {surface_cache.stats()}")
                     pygame.quit()
                     sys.exit()
                 
                 if event.type == pygame.MOUSEBUTTONDOWN:
+                    if self.is_generating and self.stop_button.collidepoint(event.pos):
+                        self.cancel_generation()
+                        continue
                     self.input_box.active = self.input_box.rect.collidepoint(event.pos)
                 
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    self.cancel_generation()
+                    continue
+                
                 if event.type == pygame.KEYDOWN and self.input_box.active:
                     if event.key == pygame.K_RETURN:
                         user_text = self.input_box.text.strip()
-                        if user_text and not self.is_generating:  # Check for non-empty text
-                            print(f"\nDEBUG: Processing user input: '{user_text}'")  # Added quotes to see whitespace
+                        if user_text and self.is_generating:
+                            # A new message preempts the reply still being generated
+                            self.cancel_generation(restore_input=False)
+                        if user_text:  # Check for non-empty text
+                            logger.debug(f"Processing user input: '{user_text}'")  # Added quotes to see whitespace
                             # Add user message
                             self.messages.append(MessageBubble(user_text, True, WINDOW_WIDTH))
                             
@@ -359,8 +700,11 @@ class ModernChatUI:
                             self.current_response = ""
                             
                             # Add initial assistant message bubble
-                            print("DEBUG: Adding initial assistant message bubble")
-                            self.messages.append(MessageBubble("", False, WINDOW_WIDTH))
+                            logger.debug("Adding initial assistant message bubble")
+                            if self.compare:
+                                self.messages.append(ColumnBubble(len(self.compare), WINDOW_WIDTH))
+                            else:
+                                self.messages.append(MessageBubble("", False, WINDOW_WIDTH))
                             
                             # Start LLM response
                             self.handle_llm_response()
@@ -373,51 +717,145 @@ class ModernChatUI:
                     else:
                         self.input_box.text += event.unicode
 
-            # Check for new tokens
+            # Apply everything the LLM thread produced since the last frame
             try:
-                while not self.response_queue.empty():
-                    msg_type, content = self.response_queue.get_nowait()
-                    print(f"DEBUG: Processing queue message: {msg_type}, content length: {len(content)}")
-                    
-                    if msg_type == "streaming":
-                        # Update the last message (which should be the assistant's message)
-                        if self.messages and not self.messages[-1].is_user:
-                            print("DEBUG: Updating assistant message with new content")
-                            self.messages[-1] = MessageBubble(content, False, WINDOW_WIDTH)
-                            # Auto-scroll while receiving response
-                            self.scroll_offset = max(0, self.get_total_height() - CHAT_AREA_HEIGHT)
-                    
-                    elif msg_type == "complete":
-                        print("DEBUG: Completing message")
-                        self.is_generating = False
-                        # Update the final message
-                        if self.messages and not self.messages[-1].is_user:
-                            self.messages[-1] = MessageBubble(content, False, WINDOW_WIDTH)
-                    
-                    elif msg_type == "error":
-                        print(f"DEBUG: Handling error message: {content}")
-                        self.is_generating = False
-                        # Replace the last message with the error message
-                        if self.messages and not self.messages[-1].is_user:
-                            self.messages[-1] = MessageBubble(content, False, WINDOW_WIDTH)
-            
+                if self.process_responses():
+                    self.needs_redraw = True
             except Exception as e:
-                print(f"DEBUG: Error in message processing: {str(e)}")
+                logger.exception(f"Error in message processing: {str(e)}")
 
-            self.draw()
+            # Only repaint when something on screen actually changed
+            if self.input_box.update_cursor():
+                self.needs_redraw = True
+            if self.is_generating and self.loading_bubble.update():
+                self.needs_redraw = True
+            if self.is_generating != drawn_generating:
+                self.needs_redraw = True
+            
+            if self.needs_redraw:
+                drawn_generating = self.is_generating
+                self.draw()
+                self.needs_redraw = False
+                if first_frame:
+                    first_frame = False
+                    profiler.mark("first frame")
+                    if profiler.enabled:
+                        # Include client start-up if it finishes soon after
+                        threading.Thread(target=self._report_startup, daemon=True).start()
             clock.tick(60)
 
+    def process_responses(self):
+        """Drain the response queue, coalescing token deltas into one bubble update
+        
+        Returns True if any message was processed.
+        """
+        deltas = []
+        column_deltas = {}
+        processed = False
+        while True:
+            try:
+                msg_type, content = self.response_queue.get_nowait()
+            except Empty:
+                break
+            
+            processed = True
+            if msg_type == "history":
+                # Messages sent while the client was starting follow the restored ones
+                restored = [MessageBubble(message["content"], message["role"] == "user", WINDOW_WIDTH)
+                            for message in content if message["role"] in ("user", "assistant")]
+                self.messages = restored + self.messages
+                self.layout.reset(self.messages)
+                self.scroll_offset = max(0, self.get_total_height() - CHAT_AREA_HEIGHT)
+                continue
+            if msg_type == "delta":
+                deltas.append(content)
+                continue
+            if msg_type == "column_delta":
+                column_deltas.setdefault(content[0], []).append(content[1])
+                continue
+            
+            # Flush tokens that arrived before the terminal message
+            self.append_to_assistant_message("".join(deltas))
+            deltas = []
+            self.append_to_columns(column_deltas)
+            column_deltas = {}
+            
+            columns = self.messages[-1] if self.messages and isinstance(self.messages[-1], ColumnBubble) else None
+            if msg_type == "columns":
+                if columns is not None:
+                    columns.labels = content
+            
+            elif msg_type == "column_end":
+                if columns is not None:
+                    columns.set_footer(*content)
+            
+            elif msg_type == "columns_complete":
+                self.is_generating = False
+                if columns is not None:
+                    for index, footer in enumerate(content):
+                        columns.set_footer(index, footer)
+            
+            elif msg_type == "complete":
+                logger.debug("Completing message")
+                self.is_generating = False
+                if self.messages and not self.messages[-1].is_user:
+                    self.update_assistant_message(content)
+            
+            elif msg_type == "error":
+                logger.debug(f"Handling error message: {content}")
+                self.is_generating = False
+                # Replace the last message with the error message
+                if self.messages and not self.messages[-1].is_user:
+                    self.messages[-1] = MessageBubble(content, False, WINDOW_WIDTH)
+        
+        self.append_to_assistant_message("".join(deltas))
+        self.append_to_columns(column_deltas)
+        return processed
+
+    def _report_startup(self):
+        self.client_ready.wait(timeout=30)
+        profiler.print_report()
+
+    def append_to_assistant_message(self, text):
+        """Append streamed text to the last (assistant) bubble and keep it in view"""
+        if not text or not self.messages or self.messages[-1].is_user:
+            return
+        self.messages[-1].append(text)
+        # Auto-scroll while receiving response
+        self.scroll_offset = max(0, self.get_total_height() - CHAT_AREA_HEIGHT)
+
+    def append_to_columns(self, column_deltas):
+        """Append streamed text to the columns of the last (comparison) bubble"""
+        if not column_deltas or not self.messages or not isinstance(self.messages[-1], ColumnBubble):
+            return
+        for index, parts in column_deltas.items():
+            self.messages[-1].append(index, "".join(parts))
+        self.scroll_offset = max(0, self.get_total_height() - CHAT_AREA_HEIGHT)
+
+    def update_assistant_message(self, content):
+        """Bring the last (assistant) bubble up to date with the full response so far"""
+        bubble = self.messages[-1]
+        if content.startswith(bubble.text):
+            bubble.append(content[len(bubble.text):])
+        else:
+            self.messages[-1] = MessageBubble(content, False, WINDOW_WIDTH)
+
     def get_total_height(self):
-        return sum(msg.height for msg in self.messages) + MESSAGE_SPACING * (len(self.messages) + 1)
+        self.layout.sync(self.messages)
+        return self.layout.content_height + MESSAGE_SPACING
 
     def draw(self):
         self.screen.fill(THEME['background'])
         
-        # Draw messages
-        y = PADDING - self.scroll_offset
-        for message in self.messages:
-            message.draw(self.screen, PADDING, y)
-            y += message.height + MESSAGE_SPACING
+        # Draw only the messages that overlap the window
+        self.layout.sync(self.messages)
+        origin = PADDING - self.scroll_offset
+        # Bubble backgrounds overhang their layout box slightly, hence the margin
+        first, last = self.layout.visible_range(self.scroll_offset - PADDING - MESSAGE_SPACING,
+                                                self.scroll_offset - PADDING + WINDOW_HEIGHT + MESSAGE_SPACING)
+        for index in range(first, last):
+            self.messages[index].draw(self.screen, PADDING, origin + self.layout.top(index))
+        y = origin + self.layout.content_height
         
         # Draw loading animation if generating
         if self.is_generating:
@@ -426,9 +864,52 @@ class ModernChatUI:
         
         # Draw input box
         self.input_box.draw(self.screen)
+        if self.is_generating:
+            self.draw_stop_button()
         
         pygame.display.flip()
 
+    def draw_stop_button(self):
+        pygame.draw.rect(self.screen, THEME['stop_button'], self.stop_button, border_radius=8)
+        label = surface_cache.render(TEXT_FONT, "Stop", THEME['stop_text'])
+        self.screen.blit(label, label.get_rect(center=self.stop_button.center))
+
 if __name__ == "__main__":
-    chat_ui = ModernChatUI()
-    chat_ui.run() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat with an Ollama model in a pygame window")
+    parser.add_argument("--session", help="Resume or start a named, persistent session")
+    parser.add_argument("--config", default="config.toml", help="Path to config file")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print a timing breakdown of startup once the first frame is drawn")
+    parser.add_argument("--compare", action="store_true",
+                        help="Send every message to the [fanout] models and show the replies in columns")
+    parser.add_argument("-m", "--model", action="append", metavar="SPEC",
+                        help="Model to compare, optionally with options: llama2@temperature=0.2 "
+                             "(repeatable; implies --compare)")
+    parser.add_argument("--first-wins", action="store_true", default=None,
+                        help="When comparing, stop the other models once one has finished")
+    args = parser.parse_args()
+    if args.session and (args.compare or args.model):
+        parser.error("--session cannot be combined with comparing models")
+    if args.profile_startup:
+        profiler.started = _STARTED
+        profiler.enabled = True
+        profiler.record("imports (pygame_ui.py)", _STARTED, _IMPORTED)
+    with profiler.phase("load config"):
+        # Parsed once; the chat client started later shares this instance
+        config = get_config(args.config)
+    logging.basicConfig(
+        level=config['logging']['level'],
+        filename=config['logging']['file'],
+        format=config['logging']['format']
+    )
+    fanout_config = config.get("fanout", {})
+    compare = args.model or (fanout_config.get("models", []) if args.compare else [])
+    first_wins = args.first_wins if args.first_wins is not None else fanout_config.get("first_wins", False)
+    with profiler.phase("window init"):
+        chat_ui = ModernChatUI(config_path=args.config, session=args.session,
+                               compare=compare, first_wins=first_wins)
+    try:
+        chat_ui.run()
+    finally:
+        # However the window loop ends, flush the session's pending writes
+        chat_ui.close()
@@ -0,0 +1,109 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from async_chat import AsyncOllamaChat  # noqa: E402
+from main import GenerationCancelled  # noqa: E402
+from benchmarks.mock_ollama import MockOllama  # noqa: E402
+from benchmarks.run_benchmarks import make_client  # noqa: E402
+
+
+def test_summarize_strategy_keeps_evicted_turns(tmp_path):
+    with MockOllama(tokens=40) as mock:
+        client = make_client(mock, str(tmp_path), AsyncOllamaChat,
+                             history={"context_tokens": 200, "strategy": "summarize"})
+
+        async def converse():
+            try:
+                for i in range(6):
+                    await client.chat(f"Tell me something about topic number {i}, please.")
+            finally:
+                await client.close()
+
+        asyncio.run(converse())
+
+    assert client.history.summary
+    assert client.history.window_start > 0
+
+
+async def _read(stream) -> str:
+    return "".join([piece async for piece in stream])
+
+
+def test_cancelling_a_coalesced_conversation_leaves_the_other_alone(tmp_path):
+    with MockOllama(tokens=40, token_rate=100) as mock:
+        client = make_client(mock, str(tmp_path), AsyncOllamaChat, model={"temperature": 0})
+        first, second = client.new_conversation(), client.new_conversation()
+
+        async def converse():
+            try:
+                leader = asyncio.create_task(_read(first.chat_stream("Hello")))
+                await asyncio.sleep(0.05)
+                follower = asyncio.create_task(_read(second.chat_stream("Hello")))
+                await asyncio.sleep(0.1)
+                second.cancel()
+                return await asyncio.gather(leader, follower, return_exceptions=True)
+            finally:
+                await client.close()
+
+        reply, cancelled = asyncio.run(converse())
+
+    assert client.inflight.coalesced == 1
+    assert isinstance(reply, str) and reply
+    assert isinstance(cancelled, GenerationCancelled)
+    assert len(first.history) == 2
+    assert len(second.history) == 0
+
+
+def test_cancelling_the_leader_keeps_the_shared_request_going(tmp_path):
+    with MockOllama(tokens=40, token_rate=100) as mock:
+        client = make_client(mock, str(tmp_path), AsyncOllamaChat, model={"temperature": 0})
+        first, second = client.new_conversation(), client.new_conversation()
+
+        async def converse():
+            try:
+                leader = asyncio.create_task(_read(first.chat_stream("Hello")))
+                await asyncio.sleep(0.05)
+                follower = asyncio.create_task(_read(second.chat_stream("Hello")))
+                await asyncio.sleep(0.1)
+                first.cancel()
+                return await asyncio.gather(leader, follower, return_exceptions=True)
+            finally:
+                await client.close()
+
+        cancelled, reply = asyncio.run(converse())
+        stopped = mock.cancelled
+
+    assert isinstance(cancelled, GenerationCancelled)
+    assert isinstance(reply, str) and len(reply.split()) == 40
+    assert len(first.history) == 0
+    assert len(second.history) == 2
+    assert stopped == 0
+
+
+def test_shared_request_stops_when_every_conversation_is_cancelled(tmp_path):
+    with MockOllama(tokens=200, token_rate=100) as mock:
+        client = make_client(mock, str(tmp_path), AsyncOllamaChat, model={"temperature": 0})
+        conversations = [client.new_conversation() for _ in range(2)]
+
+        async def converse():
+            try:
+                tasks = [asyncio.create_task(_read(conversation.chat_stream("Hello")))
+                         for conversation in conversations]
+                await asyncio.sleep(0.1)
+                for conversation in conversations:
+                    conversation.cancel()
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                await asyncio.sleep(0.1)
+                return results
+            finally:
+                await client.close()
+
+        results = asyncio.run(converse())
+        stopped = mock.cancelled
+
+    assert all(isinstance(result, GenerationCancelled) for result in results)
+    assert stopped == 1
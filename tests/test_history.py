@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.mock_ollama import MockOllama  # noqa: E402
+from benchmarks.run_benchmarks import make_client  # noqa: E402
+
+
+def test_reused_context_turns_defer_summarization(tmp_path):
+    with MockOllama(tokens=20) as mock:
+        client = make_client(mock, str(tmp_path), history={
+            "context_tokens": 300, "strategy": "summarize", "reuse_context": True})
+        summarize, summarized = client.history.summarizer, []
+
+        def counting(summary, messages):
+            summarized.append(len(messages))
+            return summarize(summary, messages)
+
+        client.history.summarizer = counting
+        reused = []
+        for i in range(10):
+            client.chat(f"Message number {i} with some padding words to take up space")
+            reused.append(client.last_turn.get("context") == "reused")
+            if reused[-1]:
+                assert not summarized
+
+    assert client.history.window_start > 0
+    assert not all(reused[1:])
+    assert summarized == [client.history.window_start]
+    assert client.history.summary
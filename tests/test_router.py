@@ -0,0 +1,32 @@
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.mock_ollama import MockOllama  # noqa: E402
+from benchmarks.run_benchmarks import make_client  # noqa: E402
+from utils.router import BackendRouter  # noqa: E402
+
+
+def test_sticky_conversation_spills_over_when_its_backend_is_full():
+    router = BackendRouter(["http://a", "http://b"], probe=lambda url: True, max_outstanding=2)
+    with ExitStack() as stack:
+        picked = [stack.enter_context(router.route("conversation")).url for _ in range(4)]
+        outstanding = [backend.outstanding for backend in router.backends]
+
+    assert sorted(picked) == ["http://a", "http://a", "http://b", "http://b"]
+    assert outstanding == [2, 2]
+
+
+def test_request_fails_over_to_another_backend(tmp_path):
+    with MockOllama() as down, MockOllama() as up:
+        client = make_client(down, str(tmp_path),
+                             routing={"backends": [down.url, up.url], "eject_after": 10})
+        down.fail_next(100)
+        replies = [client.new_conversation().chat("Hello") for _ in range(4)]
+
+    assert all(not reply.startswith("An error occurred") for reply in replies)
+    assert client.router.backends[0].errors >= 1
+    assert client.router.backends[1].requests == 4
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+from utils.transport import RETRYABLE_STATUS, backoff_delay
+
+
+def is_retryable(error: Exception) -> bool:
+    """Async counterpart of ``utils.transport.is_retryable``"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+class AsyncHttpTransport:
+    """aiohttp session with a bounded keep-alive pool and the same retry policy as HttpTransport"""
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0, retry_attempts: int = 3,
+                 retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.logger = logging.getLogger(__name__)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_config(cls, api_config: Dict[str, Any]) -> "AsyncHttpTransport":
+        return cls(
+            pool_size=api_config.get("pool_size", 10),
+            connect_timeout=api_config.get("connect_timeout", 5),
+            read_timeout=api_config.get("request_timeout", 60),
+            retry_attempts=api_config.get("retry_attempts", 3),
+            retry_delay=api_config.get("retry_delay", 1),
+            max_retry_delay=api_config.get("max_retry_delay", 30),
+        )
+
+    def configure(self, api_config: Dict[str, Any]):
+        """Apply new timeout and retry settings; the pool size is fixed at creation"""
+        self.timeout = aiohttp.ClientTimeout(connect=api_config.get("connect_timeout", 5),
+                                             sock_read=api_config.get("request_timeout", 60))
+        self.retry_attempts = max(1, api_config.get("retry_attempts", 3))
+        self.retry_delay = api_config.get("retry_delay", 1)
+        self.max_retry_delay = api_config.get("max_retry_delay", 30)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the loop that actually uses it
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method: str, url: str, json: Optional[Dict[str, Any]] = None,
+                      retry: bool = True) -> aiohttp.ClientResponse:
+        """
+        Send a request, retrying transient failures with backoff
+
+        The returned response has not been read; the caller must release it.
+        """
+        attempts = self.retry_attempts if retry else 1
+        for attempt in range(attempts):
+            try:
+                response = await self.session.request(method, url, json=json, timeout=self.timeout)
+                try:
+                    response.raise_for_status()
+                except aiohttp.ClientResponseError:
+                    response.release()
+                    raise
+                response.retries = attempt
+                return response
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == attempts - 1 or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, self.retry_delay, self.max_retry_delay)
+                self.logger.warning(
+                    f"Request attempt {attempt + 1} failed: {str(e)}; retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> aiohttp.ClientResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, json: Optional[Dict[str, Any]] = None,
+                   **kwargs) -> aiohttp.ClientResponse:
+        return await self.request("POST", url, json=json, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+
+def make_cache_key(model: str, options: Dict[str, Any], messages: list) -> str:
+    """
+    Build a stable key for a chat request
+
+    Args:
+        model (str): Model name
+        options (dict): Sampling options sent to Ollama
+        messages (list): Full message list including the system prompt
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    canonical = json.dumps(
+        {"model": model, "options": options, "messages": messages},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Persistent LRU cache of Ollama chat responses, one JSON file per entry"""
+
+    def __init__(self, directory: str = ".cache", max_size: float = 1024,
+                 cache_sampled: bool = False):
+        """
+        Args:
+            directory (str): Cache root; entries go in its ``responses`` folder
+            max_size (float): Size limit in MB
+            cache_sampled (bool): Also cache requests with temperature > 0
+        """
+        self.directory = Path(directory) / "responses"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_size * 1024 * 1024)
+        self.cache_sampled = cache_sampled
+        self.logger = logging.getLogger(__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from file modification times"""
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def resize(self, max_size: float):
+        """Change the size limit (MB), evicting entries if it shrank"""
+        with self._lock:
+            self.max_bytes = int(max_size * 1024 * 1024)
+            self._evict()
+
+    def accepts(self, options: Dict[str, Any]) -> bool:
+        """Return True if responses for these options may be cached"""
+        if self.cache_sampled or options.get("temperature", 0) <= 0:
+            return True
+        with self._lock:
+            self.bypassed += 1
+        return False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for ``key`` or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+                self._size -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a response, evicting least recently used entries as needed"""
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            path = self._path(key)
+            tmp = path.with_suffix(".tmp")
+            try:
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                self.logger.warning(f"Could not write cache entry {key}: {str(e)}")
+                return
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    self._path(key).unlink()
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+            }
@@ -1,11 +1,30 @@
 import toml
 import os
+import logging
+import threading
+import time
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Set, Tuple
+
+# Sections whose edits take effect without a restart; see OllamaChat._refresh_config
+RELOADABLE_SECTIONS = {"model", "system", "api", "cache", "history"}
+
+_shared_configs: Dict[str, "Config"] = {}
+_shared_lock = threading.Lock()
+
+
+class ConfigError(Exception):
+    """The config file is missing a setting or has one of the wrong type"""
+
 
 def load_config(config_path: str = "config.toml") -> Dict[str, Any]:
     """
-    Load configuration from TOML file and set environment variables
+    Load configuration from TOML file
+    
+    Loading has no side effects; see ``apply_environment`` for the
+    [environment] section. Most callers want ``get_config``, which parses
+    and validates the file once and reloads it when it changes.
     
     Args:
         config_path (str): Path to the config file
@@ -15,23 +34,224 @@ def load_config(config_path: str = "config.toml") -> Dict[str, Any]:
     """
     try:
         # Load the config file
-        config = toml.load(Path(config_path))
-        
-        # Set environment variables from config
-        if 'environment' in config:
-            for key, value in config['environment'].items():
-                os.environ[key] = str(value)
-        
-        return config
+        return toml.load(Path(config_path))
     except Exception as e:
         raise Exception(f"Error loading config: {str(e)}")
 
+def _setting(section: Dict[str, Any], name: str, kind: type, default: Any = None,
+             minimum: float = None) -> Any:
+    """Read one setting, checking its type and lower bound"""
+    value = section.get(name, default)
+    if value is None:
+        raise ConfigError(f"Missing setting '{name}'")
+    # TOML has no separate int syntax for floats like 1, so accept ints there
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if not isinstance(value, kind) or (kind is not bool and isinstance(value, bool)):
+        raise ConfigError(f"Setting '{name}' must be {kind.__name__}, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise ConfigError(f"Setting '{name}' must be at least {minimum}, got {value!r}")
+    return value
+
+class ModelSettings:
+    """Validated [model] section"""
+
+    def __init__(self, section: Dict[str, Any]):
+        self.name = _setting(section, "name", str)
+        self.base_url = _setting(section, "base_url", str)
+        self.temperature = _setting(section, "temperature", float, 0.7, minimum=0)
+        self.top_p = _setting(section, "top_p", float, 0.95, minimum=0)
+        self.max_tokens = _setting(section, "max_tokens", int, 2000, minimum=1)
+        self.repeat_penalty = _setting(section, "repeat_penalty", float, 1.1, minimum=0)
+        # Built once per load and shared by every request payload; treat as read-only
+        self.options = {
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "num_predict": self.max_tokens,
+            "repeat_penalty": self.repeat_penalty,
+        }
+
+class ApiSettings:
+    """Validated [api] section"""
+
+    def __init__(self, section: Dict[str, Any]):
+        self.request_timeout = _setting(section, "request_timeout", float, 60.0, minimum=0)
+        self.connect_timeout = _setting(section, "connect_timeout", float, 5.0, minimum=0)
+        self.retry_attempts = _setting(section, "retry_attempts", int, 3, minimum=1)
+        self.retry_delay = _setting(section, "retry_delay", float, 1.0, minimum=0)
+        self.max_retry_delay = _setting(section, "max_retry_delay", float, 30.0, minimum=0)
+        self.pool_size = _setting(section, "pool_size", int, 10, minimum=1)
+        self.max_in_flight = _setting(section, "max_in_flight", int, 4, minimum=1)
+        self.coalesce_requests = _setting(section, "coalesce_requests", bool, True)
+
+class CacheSettings:
+    """Validated [cache] section"""
+
+    def __init__(self, section: Dict[str, Any]):
+        self.enabled = _setting(section, "enabled", bool, False)
+        self.directory = _setting(section, "directory", str, ".cache")
+        self.max_size = _setting(section, "max_size", float, 1024.0, minimum=0)
+        self.cache_sampled = _setting(section, "cache_sampled", bool, False)
+
+class HistorySettings:
+    """Validated [history] section"""
+
+    def __init__(self, section: Dict[str, Any]):
+        self.context_tokens = _setting(section, "context_tokens", int, 2048, minimum=1)
+        self.strategy = _setting(section, "strategy", str, "drop")
+        if self.strategy not in ("drop", "summarize"):
+            raise ConfigError(f"Setting 'strategy' must be \"drop\" or \"summarize\", got {self.strategy!r}")
+        self.reuse_context = _setting(section, "reuse_context", bool, False)
+
+class Config(Mapping):
+    """
+    Parsed and validated config, reloaded when the file changes
+
+    Sections are available both as raw dicts (``config["routing"]``) and,
+    for the settings read on every request, as typed attributes
+    (``config.model.options``). ``refresh()`` re-reads the file when its
+    mtime has changed, checking at most every ``check_interval`` seconds.
+    A file that no longer validates is logged and ignored. Only the
+    sections in RELOADABLE_SECTIONS are swapped in; edits to the others
+    need a restart. ``version`` increases with every applied reload so
+    users can tell when to rebuild what they derived from the config.
+    """
+
+    def __init__(self, path: str = "config.toml", check_interval: float = 1.0):
+        """
+        Args:
+            path (str): Path to the config file
+            check_interval (float): Minimum seconds between mtime checks
+        """
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self.version = 0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._checked_at = time.monotonic()
+        self._apply(self._load())
+
+    def _stat(self) -> float:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def _load(self) -> Dict[str, Any]:
+        """Parse and validate the file as a whole, so a bad edit never half-applies"""
+        data = load_config(self.path)
+        for name in ("model", "system", "logging"):
+            if not isinstance(data.get(name), dict):
+                raise ConfigError(f"{self.path}: missing [{name}] section")
+        try:
+            _setting(data["system"], "prompt", str)
+            for name in ("level", "file", "format"):
+                _setting(data["logging"], name, str)
+            self._typed(data)
+        except ConfigError as e:
+            raise ConfigError(f"{self.path}: {str(e)}")
+        return data
+
+    @staticmethod
+    def _typed(data: Dict[str, Any]) -> Tuple[ModelSettings, ApiSettings, CacheSettings, HistorySettings]:
+        return (ModelSettings(data["model"]), ApiSettings(data.get("api", {})),
+                CacheSettings(data.get("cache", {})), HistorySettings(data.get("history", {})))
+
+    def _apply(self, data: Dict[str, Any]):
+        self.model, self.api, self.cache, self.history = self._typed(data)
+        self.system_prompt = data["system"]["prompt"]
+        self._data = data
+
+    def refresh(self) -> Set[str]:
+        """
+        Reload the file if it changed on disk
+
+        Returns:
+            set: Names of the sections that were reloaded
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return set()
+        with self._lock:
+            self._checked_at = now
+            mtime = self._stat()
+            if mtime == self._mtime:
+                return set()
+            self._mtime = mtime
+            previous = self._data
+            try:
+                data = self._load()
+            except Exception as e:
+                self.logger.error(f"Keeping the previous config: {str(e)}")
+                return set()
+
+            changed = {name for name in set(previous) | set(data)
+                       if previous.get(name) != data.get(name)}
+            restart = changed - RELOADABLE_SECTIONS
+            if restart:
+                self.logger.warning(f"Config sections {sorted(restart)} changed; restart to apply them")
+            reloaded = changed & RELOADABLE_SECTIONS
+            if not reloaded:
+                return set()
+            # Sections that need a restart keep their loaded values
+            merged = dict(previous)
+            merged.update({name: data[name] for name in reloaded if name in data})
+            self._apply(merged)
+            self.version += 1
+            self.logger.info(f"Reloaded config sections {sorted(reloaded)}")
+            return reloaded
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+def get_config(config_path: str = "config.toml") -> Config:
+    """
+    Return the process-wide Config for a file, parsing it on first use
+
+    Both front ends and every client share one instance per file, so the
+    file is parsed and validated once and reloads are seen everywhere.
+    """
+    key = str(Path(config_path).resolve())
+    with _shared_lock:
+        config = _shared_configs.get(key)
+        if config is None:
+            config = Config(config_path)
+            _shared_configs[key] = config
+    config.refresh()
+    return config
+
+def apply_environment(config: Dict[str, Any]):
+    """
+    Export the [environment] section as environment variables
+    
+    Only happens when the section sets ``enabled = true``, and variables that
+    are already set in the environment are left alone, so e.g. remote
+    tracing is never switched on behind the user's back.
+    
+    Args:
+        config (dict): Configuration dictionary
+    """
+    environment = dict(config.get('environment', {}))
+    if not environment.pop('enabled', False):
+        return
+    logger = logging.getLogger(__name__)
+    for key, value in environment.items():
+        if key in os.environ:
+            continue
+        os.environ[key] = str(value)
+        logger.info(f"Set {key} from the [environment] config section")
+
 def get_model_config() -> Dict[str, Any]:
     """Get model-specific configuration"""
-    config = load_config()
-    return config.get('model', {})
+    return get_config().get('model', {})
 
 def get_api_config() -> Dict[str, Any]:
     """Get API-specific configuration"""
-    config = load_config()
-    return config.get('api', {}) 
\ No newline at end of file
+    return get_config().get('api', {})
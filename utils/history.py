@@ -0,0 +1,167 @@
+import logging
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+# Rough per-message framing cost of the chat template (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Summarizer = Callable[[str, List[Dict[str, str]]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for Llama-style tokenizers
+
+    English text averages roughly four characters per token; this errs on
+    the high side so the budget is not exceeded in practice.
+    """
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationHistory:
+    """
+    Conversation transcript with a token-budgeted context window
+
+    The full transcript is kept, but only a suffix of it is sent to the
+    model. When the budget is exceeded the oldest exchanges leave the window
+    and are either dropped or folded into a running summary. The system
+    prompt and the most recent exchange are always kept.
+    """
+
+    def __init__(self, max_tokens: int = 2048, strategy: str = "drop",
+                 summarizer: Optional[Summarizer] = None):
+        """
+        Args:
+            max_tokens (int): Token budget for the prompt sent to the model
+            strategy (str): ``"drop"`` or ``"summarize"`` for evicted turns
+            summarizer (callable): ``(summary, messages) -> summary`` used by
+                the ``"summarize"`` strategy
+        """
+        if strategy not in ("drop", "summarize"):
+            raise ValueError(f"Unknown history strategy: {strategy}")
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.summarizer = summarizer
+        self.logger = logging.getLogger(__name__)
+
+        self._messages: List[Dict[str, str]] = []
+        self._tokens: List[int] = []
+        self._start = 0
+        self._total_tokens = 0
+        self._window_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+        # Evicted messages waiting for a request that sends the summary
+        self._unsummarized: List[Dict[str, str]] = []
+
+        self.last_saved = 0
+        self.total_saved = 0
+        self.requests = 0
+        self.evicted = 0
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, message: Dict[str, str]):
+        """Add a message to the transcript"""
+        tokens = estimate_tokens(message["content"])
+        self._messages.append(message)
+        self._tokens.append(tokens)
+        self._total_tokens += tokens
+        self._window_tokens += tokens
+
+    def clear(self):
+        """Forget the transcript and any summary"""
+        self._messages.clear()
+        self._tokens.clear()
+        self._start = 0
+        self._total_tokens = 0
+        self._window_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+        self._unsummarized.clear()
+
+    @property
+    def window_start(self) -> int:
+        """Index of the oldest message still inside the context window"""
+        return self._start
+
+    def _summary_message(self) -> Optional[Dict[str, str]]:
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+    def _evict(self, fixed_tokens: int, summarize: bool):
+        """Slide the window forward until it fits alongside ``fixed_tokens``"""
+        # Keep the latest completed exchange regardless of the budget
+        keep_from = max(self._start, len(self._messages) - 2)
+        evicted = []
+        while (self._start < keep_from and
+               fixed_tokens + self._summary_tokens + self._window_tokens > self.max_tokens):
+            # Evict whole exchanges so the window never starts with an assistant turn
+            step = min(2, keep_from - self._start)
+            for _ in range(step):
+                evicted.append(self._messages[self._start])
+                self._window_tokens -= self._tokens[self._start]
+                self._start += 1
+        if evicted:
+            self.evicted += len(evicted)
+            if self.strategy == "summarize" and self.summarizer is not None:
+                self._unsummarized.extend(evicted)
+        if not summarize or not self._unsummarized:
+            return
+
+        try:
+            self.summary = self.summarizer(self.summary, self._unsummarized).strip()
+            self._summary_tokens = estimate_tokens(self.summary) if self.summary else 0
+        except Exception as e:
+            self.logger.warning(f"Summarizing history failed, dropping turns: {str(e)}")
+        self._unsummarized = []
+
+    def window(self, system_message: Dict[str, str], user_message: Dict[str, str],
+               summarize: bool = True) -> List[Dict[str, str]]:
+        """
+        Build the message list for the next request
+
+        Args:
+            system_message (dict): The system prompt message
+            user_message (dict): The new user message
+            summarize (bool): Fold evicted turns into the summary now; pass
+                False when the request will not send the summary, and they are
+                folded in by the next call that does
+
+        Returns:
+            list: Messages that fit within the token budget
+        """
+        fixed_tokens = estimate_tokens(system_message["content"]) + estimate_tokens(user_message["content"])
+        self._evict(fixed_tokens, summarize)
+
+        messages = [system_message]
+        summary = self._summary_message()
+        if summary is not None:
+            messages.append(summary)
+        messages.extend(self._messages[self._start:])
+        messages.append(user_message)
+
+        self.requests += 1
+        self.last_saved = self._total_tokens - self._window_tokens - self._summary_tokens
+        self.last_saved = max(0, self.last_saved)
+        self.total_saved += self.last_saved
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": len(self._messages),
+            "window_messages": len(self._messages) - self._start,
+            "transcript_tokens": self._total_tokens,
+            "window_tokens": self._window_tokens + self._summary_tokens,
+            "evicted_messages": self.evicted,
+            "last_saved_tokens": self.last_saved,
+            "total_saved_tokens": self.total_saved,
+            "avg_saved_tokens": self.total_saved / self.requests if self.requests else 0.0,
+        }
@@ -0,0 +1,233 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, List, Optional
+
+# Ollama reports durations in nanoseconds
+NS_PER_SECOND = 1e9
+
+OLLAMA_TIMING_FIELDS = (
+    "total_duration", "load_duration", "prompt_eval_count",
+    "prompt_eval_duration", "eval_count", "eval_duration",
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RequestMetrics:
+    """Client- and server-side measurements for one request"""
+
+    __slots__ = ("model", "wall_time", "ttft", "queue_wait", "retries", "cached",
+                 "coalesced", "cancelled", "error") + OLLAMA_TIMING_FIELDS
+
+    def __init__(self, model: str, wall_time: float, ttft: Optional[float] = None,
+                 queue_wait: float = 0.0, retries: int = 0, cached: bool = False,
+                 error: bool = False, response: Optional[Dict[str, Any]] = None,
+                 coalesced: bool = False, cancelled: bool = False):
+        self.model = model
+        self.wall_time = wall_time
+        self.ttft = ttft if ttft is not None else wall_time
+        self.queue_wait = queue_wait
+        self.retries = retries
+        self.cached = cached
+        self.coalesced = coalesced
+        self.cancelled = cancelled
+        self.error = error
+        response = response or {}
+        for field in OLLAMA_TIMING_FIELDS:
+            setattr(self, field, response.get(field))
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if not self.eval_count or not self.eval_duration:
+            return None
+        return self.eval_count / (self.eval_duration / NS_PER_SECOND)
+
+    @property
+    def prompt_tokens_per_second(self) -> Optional[float]:
+        if not self.prompt_eval_count or not self.prompt_eval_duration:
+            return None
+        return self.prompt_eval_count / (self.prompt_eval_duration / NS_PER_SECOND)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    """Rolling window of request metrics with percentile summaries"""
+
+    # Series reported as seconds, derived from each RequestMetrics
+    SERIES = {
+        "wall_time": lambda m: m.wall_time,
+        "ttft": lambda m: m.ttft,
+        "queue_wait": lambda m: m.queue_wait,
+        "load": lambda m: m.load_duration / NS_PER_SECOND if m.load_duration is not None else None,
+        "prompt_eval": lambda m: (m.prompt_eval_duration / NS_PER_SECOND
+                                  if m.prompt_eval_duration is not None else None),
+        "eval": lambda m: m.eval_duration / NS_PER_SECOND if m.eval_duration is not None else None,
+        "tokens_per_second": lambda m: m.tokens_per_second,
+        "prompt_tokens_per_second": lambda m: m.prompt_tokens_per_second,
+    }
+
+    def __init__(self, window: int = 1000):
+        self._window = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self._gauges: Dict[str, tuple] = {}
+
+    def record(self, metrics: RequestMetrics):
+        with self._lock:
+            self._window.append(metrics)
+            self.requests += 1
+            self.errors += int(metrics.error)
+            self.retries += metrics.retries
+            self.cache_hits += int(metrics.cached)
+            self.coalesced += int(metrics.coalesced)
+            self.cancelled += int(metrics.cancelled)
+
+    def add_gauge(self, name: str, read: Callable[[], float], kind: str = "gauge"):
+        """
+        Export a value owned by another component, read at scrape time
+
+        Args:
+            name (str): Metric name without the prefix
+            read (callable): Returns the current value
+            kind (str): Prometheus type, "gauge" or "counter"
+        """
+        with self._lock:
+            self._gauges[name] = (read, kind)
+
+    def recent(self) -> List[RequestMetrics]:
+        with self._lock:
+            return list(self._window)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the rolling window
+
+        Returns:
+            dict: Totals plus, for each series, its count and p50/p95/p99
+        """
+        recent = self.recent()
+        # Cache hits, shared results and failures would skew the latency of real generations
+        generated = [m for m in recent
+                     if not m.cached and not m.coalesced and not m.cancelled and not m.error]
+        result = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "window": len(recent),
+        }
+        for name, extract in self.SERIES.items():
+            values = sorted(v for v in (extract(m) for m in generated) if v is not None)
+            series = {"count": len(values)}
+            for q in QUANTILES:
+                series[f"p{int(q * 100)}"] = percentile(values, q)
+            result[name] = series
+        return result
+
+    def to_prometheus(self, prefix: str = "ollama_chat") -> str:
+        """Render the summary in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = []
+        for counter in ("requests", "errors", "retries", "cache_hits", "coalesced", "cancelled"):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {summary[counter]}")
+        for name in self.SERIES:
+            series = summary[name]
+            metric = f"{prefix}_{name}" if name.endswith("per_second") else f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{quantile="{q}"}} {series[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"{metric}_count {series['count']}")
+        with self._lock:
+            gauges = list(self._gauges.items())
+        for name, (read, kind) in gauges:
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.append(f"{prefix}_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        # Replace atomically so scrapers never read a half-written file
+        os.replace(tmp, path)
+
+    def start_file_export(self, path: str, interval: float = 15.0) -> threading.Thread:
+        """Rewrite ``path`` with the Prometheus text every ``interval`` seconds"""
+        logger = logging.getLogger(__name__)
+
+        def export():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_prometheus(path)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics to {path}: {str(e)}")
+
+        thread = threading.Thread(target=export, name="metrics-export", daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+        """Serve the Prometheus text on ``/metrics`` from a background thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Human-readable version of ``MetricsRegistry.summary()`` for the REPL"""
+    lines = [
+        f"requests={summary['requests']} errors={summary['errors']} "
+        f"retries={summary['retries']} cache_hits={summary['cache_hits']} "
+        f"coalesced={summary['coalesced']} cancelled={summary['cancelled']}"
+    ]
+    for name in MetricsRegistry.SERIES:
+        series = summary[name]
+        if not series["count"]:
+            continue
+        unit = "" if name.endswith("per_second") else "s"
+        lines.append(
+            f"{name:>24}: p50={series['p50']:.3f}{unit} p95={series['p95']:.3f}{unit} "
+            f"p99={series['p99']:.3f}{unit} (n={series['count']})"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+import pygame
+
+FontKey = Tuple[str, int]
+
+_fonts: Dict[FontKey, "pygame.font.Font"] = {}
+
+
+def get_font(name: str, size: int) -> "pygame.font.Font":
+    """Return the process-wide font for ``(name, size)``, loading it once"""
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.SysFont(name, size)
+        _fonts[key] = font
+    return font
+
+
+class SurfaceCache:
+    """
+    Memory-bounded LRU cache of rendered text surfaces
+
+    Surfaces are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[pygame.Surface, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font_key: FontKey, text: str, color: Tuple[int, int, int],
+               antialias: bool = True) -> pygame.Surface:
+        """Return ``text`` rendered in the given font and color"""
+        key = (font_key, text, color, antialias)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        surface = get_font(*font_key).render(text, antialias, color)
+        size = surface.get_pitch() * surface.get_height()
+        if size > self.max_bytes:
+            return surface
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (surface, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+        return surface
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+surface_cache = SurfaceCache()
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+from utils.metrics import percentile
+
+NS_PER_SECOND = 1e9
+# How long Ollama keeps a model loaded when a request does not say
+OLLAMA_DEFAULT_KEEP_ALIVE = 300
+
+
+class Resident:
+    """What is known about one model on one backend"""
+
+    def __init__(self, url: str, model: str):
+        self.url = url
+        self.model = model
+        self.loads = 0
+        self.last_used: Optional[float] = None
+        self.loaded_at = 0.0
+        self.expires_at = 0.0
+
+    def is_hot(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def idle_since(self) -> float:
+        # Preloaded models that were never used count as idle since they loaded
+        return self.last_used if self.last_used is not None else self.loaded_at
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "model": self.model,
+            "hot": self.is_hot(now),
+            "loads": self.loads,
+            "idle_seconds": now - self.last_used if self.last_used is not None else None,
+        }
+
+
+class ResidencyManager:
+    """
+    Keep the models in use loaded in Ollama, and only those
+
+    ``start()`` preloads the configured models on every backend in a
+    background thread, so the first turn does not pay the model load.
+    Every request carries ``keep_alive`` and every reply is passed to
+    ``observe()``, which tracks which (backend, model) pairs are hot and
+    counts cold starts: replies whose ``load_duration`` reaches
+    ``cold_threshold``. Pairs unused for ``idle_unload`` seconds are
+    unloaded so the memory goes back to the host.
+    """
+
+    def __init__(self, send: Callable[[str, str, float], Dict[str, Any]],
+                 backends: Callable[[], List[str]], models: Iterable[str],
+                 keep_alive: Optional[float] = None, idle_unload: float = 0,
+                 cold_threshold: float = 0.5, check_interval: float = 30.0,
+                 window: int = 1000):
+        """
+        Args:
+            send (callable): ``(url, model, keep_alive) -> reply`` issuing an empty
+                generate request, which loads (or with 0, unloads) the model
+            backends (callable): Base URLs of the backends to keep models on
+            models (iterable): Models to preload
+            keep_alive (float): Seconds Ollama keeps a model after a request,
+                negative for ever; None leaves Ollama's default
+            idle_unload (float): Unload models unused this long; 0 never does
+            cold_threshold (float): Load time in seconds that counts as a cold start
+            check_interval (float): Seconds between idle checks
+            window (int): Load times kept for the percentiles
+        """
+        self.send = send
+        self.backends = backends
+        self.models = list(dict.fromkeys(models))
+        self.keep_alive = keep_alive
+        self.idle_unload = idle_unload
+        self.cold_threshold = cold_threshold
+        self.check_interval = check_interval
+        self.logger = logging.getLogger(__name__)
+
+        self.preloads = 0
+        self.cold_starts = 0
+        self.unloads = 0
+        self._load_times = deque(maxlen=window)
+        self._residents: Dict[Tuple[str, str], Resident] = {}
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _resident(self, url: str, model: str) -> Resident:
+        resident = self._residents.get((url, model))
+        if resident is None:
+            resident = self._residents[(url, model)] = Resident(url, model)
+        return resident
+
+    def _expiry(self, now: float) -> float:
+        keep_alive = OLLAMA_DEFAULT_KEEP_ALIVE if self.keep_alive is None else self.keep_alive
+        return float("inf") if keep_alive < 0 else now + keep_alive
+
+    def observe(self, url: str, model: str, reply: Dict[str, Any], preload: bool = False):
+        """
+        Record a finished request (or preload) from its final reply
+
+        Args:
+            url (str): Backend that served it
+            model (str): Model it ran on
+            reply (dict): Non-streaming reply or final ``done`` chunk
+            preload (bool): Whether this was a warm-up rather than a user request
+        """
+        load = (reply.get("load_duration") or 0) / NS_PER_SECOND
+        now = time.monotonic()
+        with self._lock:
+            resident = self._resident(url, model)
+            if not resident.is_hot(now):
+                resident.loaded_at = now
+            if not preload:
+                resident.last_used = now
+            resident.expires_at = self._expiry(now)
+            if load < self.cold_threshold:
+                return
+            resident.loads += 1
+            self._load_times.append(load)
+            if preload:
+                self.preloads += 1
+            else:
+                self.cold_starts += 1
+        if not preload:
+            self.logger.info(f"Cold start: loading {model} on {url} took {load:.2f}s")
+
+    def is_hot(self, url: str, model: str) -> bool:
+        with self._lock:
+            resident = self._residents.get((url, model))
+            return resident is not None and resident.is_hot(time.monotonic())
+
+    def load(self, url: str, model: str) -> bool:
+        """Load a model on one backend now; returns False if that failed"""
+        began = time.perf_counter()
+        try:
+            reply = self.send(url, model, self.keep_alive)
+        except Exception as e:
+            self.logger.warning(f"Could not preload {model} on {url}: {str(e)}")
+            return False
+        self.observe(url, model, reply, preload=True)
+        self.logger.info(f"Preloaded {model} on {url} in {time.perf_counter() - began:.2f}s")
+        return True
+
+    def preload(self, models: Optional[Iterable[str]] = None):
+        """Load the given (default: configured) models on every backend that lacks them"""
+        for model in models if models is not None else self.models:
+            for url in self.backends():
+                with self._lock:
+                    if (url, model) in self._loading:
+                        continue
+                    self._loading.add((url, model))
+                try:
+                    if not self.is_hot(url, model):
+                        self.load(url, model)
+                finally:
+                    with self._lock:
+                        self._loading.discard((url, model))
+
+    def ensure_loaded(self, model: str):
+        """Preload one model in the background unless it is already hot everywhere"""
+        if all(self.is_hot(url, model) for url in self.backends()):
+            return
+        threading.Thread(target=self.preload, args=([model],), name="model-preload",
+                         daemon=True).start()
+
+    def unload_idle(self) -> int:
+        """
+        Unload hot models that have been idle for ``idle_unload`` seconds
+
+        Returns:
+            int: Number of models unloaded
+        """
+        if self.idle_unload <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            idle = [r for r in self._residents.values()
+                    if r.is_hot(now) and now - r.idle_since() >= self.idle_unload]
+        unloaded = 0
+        for resident in idle:
+            try:
+                self.send(resident.url, resident.model, 0)
+            except Exception as e:
+                self.logger.warning(f"Could not unload {resident.model} on {resident.url}: {str(e)}")
+                continue
+            with self._lock:
+                # A request may have used it while the unload was on its way
+                if now - resident.idle_since() < self.idle_unload:
+                    continue
+                resident.expires_at = 0.0
+                self.unloads += 1
+            unloaded += 1
+            self.logger.info(f"Unloaded {resident.model} on {resident.url} after "
+                             f"{self.idle_unload:.0f}s idle")
+        return unloaded
+
+    def start(self, preload: bool = True) -> Optional[threading.Thread]:
+        """Preload in the background, then unload idle models every ``check_interval`` seconds"""
+        if self._thread is not None:
+            return self._thread
+
+        def run():
+            if preload:
+                self.preload()
+            while self.idle_unload > 0:
+                time.sleep(self.check_interval)
+                try:
+                    self.unload_idle()
+                except Exception as e:
+                    self.logger.warning(f"Idle unload round failed: {str(e)}")
+
+        if not preload and self.idle_unload <= 0:
+            return None
+        self._thread = threading.Thread(target=run, name="model-residency", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def hot_count(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(r.is_hot(now) for r in self._residents.values())
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            load_times = sorted(self._load_times)
+            return {
+                "models": [r.stats(now) for r in self._residents.values()],
+                "preloads": self.preloads,
+                "cold_starts": self.cold_starts,
+                "unloads": self.unloads,
+                "load_p50": percentile(load_times, 0.5),
+                "load_p95": percentile(load_times, 0.95),
+            }
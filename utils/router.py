@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+# Weight of a backend at the moment it is re-admitted, before slow start ramps it up
+MIN_WEIGHT = 0.1
+MAX_STICKY_SESSIONS = 10000
+
+
+class Backend:
+    """One Ollama host and its routing state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.readmitted_at: Optional[float] = None
+        self.picked_at = 0.0
+
+    def weight(self, now: float, slow_start: float) -> float:
+        """Share of traffic relative to a fully warmed-up backend"""
+        if self.readmitted_at is None or slow_start <= 0:
+            return 1.0
+        ramp = (now - self.readmitted_at) / slow_start
+        if ramp >= 1:
+            self.readmitted_at = None
+            return 1.0
+        return max(MIN_WEIGHT, ramp)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class BackendRouter:
+    """
+    Spread requests over several Ollama hosts
+
+    Each request goes to the healthy backend with the fewest outstanding
+    requests, scaled by its weight. A request that fails to connect or gets
+    a 5xx is retried once on another healthy backend. A backend is ejected when a health probe
+    fails or after ``eject_after`` consecutive failed requests, and is
+    re-admitted once a probe succeeds, with its share of traffic ramping
+    up over ``slow_start`` seconds. Conversations stick to the backend that
+    served them, so the model and its KV cache stay warm there, unless that
+    backend is ejected, clearly busier than the others or at its
+    ``max_outstanding`` limit. A backend at its limit only gets more requests
+    when every healthy backend is; callers that cap their total in-flight
+    requests at ``max_outstanding`` times the number of backends never get there
+    while all backends are healthy.
+    """
+
+    def __init__(self, urls: List[str], probe: Callable[[str], bool],
+                 is_failure: Callable[[Exception], bool] = lambda e: True,
+                 probe_interval: float = 10.0, eject_after: int = 3,
+                 slow_start: float = 30.0, sticky_sessions: bool = True,
+                 max_outstanding: int = 0):
+        """
+        Args:
+            urls (list): Base URLs of the Ollama hosts
+            probe (callable): Returns True if the given base URL is healthy
+            is_failure (callable): Whether a request error counts against the backend
+            probe_interval (float): Seconds between background health probes
+            eject_after (int): Consecutive failures before a backend is ejected
+            slow_start (float): Seconds for a re-admitted backend to reach full weight
+            sticky_sessions (bool): Keep conversations on the same backend
+            max_outstanding (int): Requests a backend should have in flight at most; 0 means no limit
+        """
+        if not urls:
+            raise ValueError("At least one backend URL is required")
+        self.backends = [Backend(url) for url in urls]
+        self.probe = probe
+        self.is_failure = is_failure
+        self.probe_interval = probe_interval
+        self.eject_after = max(1, eject_after)
+        self.slow_start = slow_start
+        self.sticky_sessions = sticky_sessions
+        self.max_outstanding = max_outstanding
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._sticky: "OrderedDict[str, Backend]" = OrderedDict()
+        self._probe_thread: Optional[threading.Thread] = None
+
+    def _score(self, backend: Backend, now: float) -> tuple:
+        weight = backend.weight(now, self.slow_start)
+        # Ties go to the least recently picked backend, so idle backends take turns
+        return ((backend.outstanding + 1) / weight, backend.picked_at)
+
+    def _pick(self, affinity: Optional[str], exclude: List[Backend]) -> Backend:
+        now = time.monotonic()
+        backends = [b for b in self.backends if b not in exclude] or self.backends
+        # With every backend ejected, keep trying all of them rather than failing outright
+        candidates = [b for b in backends if b.healthy] or backends
+        if self.max_outstanding:
+            candidates = [b for b in candidates if b.outstanding < self.max_outstanding] or candidates
+        best = min(candidates, key=lambda b: self._score(b, now))
+        if affinity is None or not self.sticky_sessions:
+            return best
+
+        current = self._sticky.get(affinity)
+        # Stay put unless the sticky backend is gone or has two more requests queued
+        if current is not None and current in candidates and \
+                current.outstanding <= best.outstanding + 1:
+            self._sticky.move_to_end(affinity)
+            return current
+        self._sticky[affinity] = best
+        self._sticky.move_to_end(affinity)
+        if len(self._sticky) > MAX_STICKY_SESSIONS:
+            self._sticky.popitem(last=False)
+        return best
+
+    @contextmanager
+    def route(self, affinity: Optional[str] = None,
+              exclude: Optional[List[Backend]] = None) -> Iterator[Backend]:
+        """
+        Hold a backend for the duration of one request
+
+        Args:
+            affinity (str): Conversation key for sticky routing
+            exclude (list): Backends to avoid, e.g. those the request already failed on
+
+        Yields:
+            Backend: The backend to send the request to
+        """
+        with self._lock:
+            backend = self._pick(affinity, exclude or [])
+            backend.outstanding += 1
+            backend.requests += 1
+            backend.picked_at = time.monotonic()
+        try:
+            yield backend
+        except Exception as e:
+            with self._lock:
+                backend.outstanding -= 1
+                if self.is_failure(e):
+                    backend.errors += 1
+                    self._failed(backend, f"request failed: {str(e)}")
+            raise
+        except BaseException:
+            # Cancelled by the caller; says nothing about the backend
+            with self._lock:
+                backend.outstanding -= 1
+            raise
+        else:
+            with self._lock:
+                backend.outstanding -= 1
+                backend.failures = 0
+
+    def can_fail_over(self, tried: List[Backend]) -> bool:
+        """Whether a request sent to the backends in ``tried`` may still be sent to another one"""
+        # A request is retried on one other backend at most
+        if len(tried) != 1:
+            return False
+        with self._lock:
+            return any(b.healthy and b not in tried for b in self.backends)
+
+    def failover(self, error: Exception, tried: List[Backend]) -> bool:
+        """Whether to retry a request that failed with ``error`` on another backend"""
+        return self.is_failure(error) and self.can_fail_over(tried)
+
+    def _failed(self, backend: Backend, reason: str, eject: bool = False):
+        backend.failures += 1
+        if backend.healthy and (eject or backend.failures >= self.eject_after):
+            backend.healthy = False
+            backend.ejections += 1
+            self.logger.warning(f"Ejecting backend {backend.url} after {backend.failures} failures ({reason})")
+
+    def probe_all(self) -> int:
+        """
+        Health-check every backend once
+
+        Returns:
+            int: Number of healthy backends
+        """
+        for backend in self.backends:
+            ok = self.probe(backend.url)
+            with self._lock:
+                if ok:
+                    backend.failures = 0
+                    if not backend.healthy:
+                        backend.healthy = True
+                        backend.readmitted_at = time.monotonic()
+                        self.logger.info(f"Re-admitting backend {backend.url}")
+                else:
+                    # An unreachable host is ejected at once; request errors need a streak
+                    self._failed(backend, "health probe failed", eject=True)
+        return sum(b.healthy for b in self.backends)
+
+    def start_probes(self) -> Optional[threading.Thread]:
+        """Probe every backend in a background thread every ``probe_interval`` seconds"""
+        if self._probe_thread is not None or self.probe_interval <= 0:
+            return self._probe_thread
+
+        def run():
+            while True:
+                time.sleep(self.probe_interval)
+                try:
+                    self.probe_all()
+                except Exception as e:
+                    self.logger.warning(f"Health probe round failed: {str(e)}")
+
+        self._probe_thread = threading.Thread(target=run, name="backend-probes", daemon=True)
+        self._probe_thread.start()
+        return self._probe_thread
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backends": [b.stats() for b in self.backends],
+                "sticky_sessions": len(self._sticky),
+            }
@@ -0,0 +1,150 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Hashable, Optional
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler refuses a request; retry after ``retry_after`` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """
+    Admission control and per-user fair queuing in front of one backend
+
+    At most ``max_in_flight`` requests run at once. Requests beyond that wait
+    in one FIFO per user, and free slots are handed out round-robin across
+    users, so a user with a burst of requests cannot starve everyone else.
+    When the queue is full new requests are rejected straight away with
+    ``QueueFull`` instead of piling up latency.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 0, max_queue_per_user: int = 0):
+        """
+        Args:
+            max_in_flight (int): Requests allowed to run concurrently
+            max_queue (int): Waiting requests across all users; 0 means unbounded
+            max_queue_per_user (int): Waiting requests per user; 0 means unbounded
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Users with waiting requests, in round-robin order
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        # Moving average of how long a request holds its slot
+        self._service_time = 1.0
+
+    def for_user(self, user: Hashable) -> "_UserSlot":
+        """Async context manager that holds a slot on behalf of ``user``"""
+        return _UserSlot(self, user)
+
+    def retry_after(self) -> int:
+        """Whole seconds until the current queue is expected to have drained"""
+        seconds = self._service_time * (self.queue_depth + 1) / self.max_in_flight
+        return min(60, max(1, math.ceil(seconds)))
+
+    def check(self, user: Hashable):
+        """Raise ``QueueFull`` if a new request from ``user`` would have to be refused"""
+        if self.in_flight < self.max_in_flight and not self.queue_depth:
+            return
+        if self.max_queue and self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull("Server is busy", self.retry_after())
+        waiting = len(self._queues.get(user, ()))
+        if self.max_queue_per_user and waiting >= self.max_queue_per_user:
+            self.rejected += 1
+            raise QueueFull("Too many queued requests for this user", self.retry_after())
+
+    async def acquire(self, user: Hashable) -> float:
+        """
+        Wait for a slot
+
+        Returns:
+            float: Seconds spent queued
+        """
+        self.check(user)
+        self.admitted += 1
+        if self.in_flight < self.max_in_flight and not self.queue_depth:
+            self.in_flight += 1
+            return 0.0
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.queue_depth += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the caller gave up
+                self.release()
+            else:
+                self._remove(user, waiter)
+            raise
+        return time.perf_counter() - start
+
+    def release(self, held: Optional[float] = None):
+        """Free a slot; ``held`` is how long it was used, for the Retry-After estimate"""
+        if held is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _remove(self, user: Hashable, waiter: asyncio.Future):
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queue_depth -= 1
+            if not queue:
+                del self._queues[user]
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queue_depth -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "queued_users": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class _UserSlot:
+    """``async with`` adapter so a scheduler can stand in for an asyncio.Semaphore"""
+
+    def __init__(self, scheduler: FairScheduler, user: Hashable):
+        self.scheduler = scheduler
+        self.user = user
+        # Grant time per task, since one user may hold several slots at once
+        self._granted: Dict[asyncio.Task, float] = {}
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.user)
+        self._granted[asyncio.current_task()] = time.perf_counter()
+
+    async def __aexit__(self, *exc_info):
+        granted = self._granted.pop(asyncio.current_task(), None)
+        self.scheduler.release(None if granted is None else time.perf_counter() - granted)
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from utils.metrics import percentile
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Local embedder that needs no model: hashed word unigrams and bigrams
+
+    Catches paraphrases that mostly reuse the same words (reordering,
+    punctuation, filler) but not true rewordings; use an Ollama embedding
+    model for those.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _bucket(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dimensions
+
+    def __call__(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower())
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            vector[self._bucket(feature)] += 1.0
+        return vector
+
+
+class SemanticCache:
+    """
+    Cache of chat replies looked up by prompt meaning instead of exact text
+
+    Prompt embeddings live in one contiguous float32 matrix, memory-mapped
+    from ``<directory>/semantic/vectors.f32`` so it persists across runs;
+    the mapping is shared, so the OS writes rows back without an explicit flush.
+    Rows are L2-normalised, so a lookup is a single matrix-vector product
+    giving the cosine similarity to every stored prompt. Only entries with
+    the same scope (model, options, system prompt and preceding history)
+    can match. Replies are stored as one JSON file per slot; when all
+    ``capacity`` slots are taken the least recently used one is reused.
+    """
+
+    def __init__(self, embed: Callable[[str], Sequence[float]], directory: str = ".cache",
+                 capacity: int = 10000, threshold: float = 0.92, embed_id: str = "",
+                 window: int = 1000):
+        """
+        Args:
+            embed (callable): Maps a prompt to its embedding vector
+            directory (str): Cache root; the index goes in its ``semantic`` folder
+            capacity (int): Maximum number of cached prompts
+            threshold (float): Minimum cosine similarity for a hit
+            embed_id (str): Identifies the embedder; the index is rebuilt when it changes
+            window (int): Lookups kept for the similarity percentiles
+        """
+        self.embed = embed
+        self.directory = Path(directory) / "semantic"
+        self.slots_dir = self.directory / "slots"
+        self.slots_dir.mkdir(parents=True, exist_ok=True)
+        self.capacity = capacity
+        self.threshold = threshold
+        self.embed_id = embed_id
+        self.logger = logging.getLogger(__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self._similarities = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        self._vectors: Optional[np.memmap] = None
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        # Slots are filled from the front, so rows past this one have never been used
+        self._rows = 0
+        self._load_index()
+
+    @staticmethod
+    def scope_id(scope: str) -> int:
+        """Fold a scope key (e.g. a cache key hex digest) into an int64"""
+        return int(hashlib.sha256(scope.encode("utf-8")).hexdigest()[:15], 16)
+
+    def _index_path(self) -> Path:
+        return self.directory / "index.json"
+
+    def _vectors_path(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    def _slot_path(self, slot: int) -> Path:
+        return self.slots_dir / f"{slot}.json"
+
+    def _load_index(self):
+        """Reopen the vector matrix and rebuild slot state from the slot files"""
+        try:
+            index = json.loads(self._index_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if index.get("capacity") != self.capacity or index.get("embed_id") != self.embed_id:
+            self.logger.info("Semantic cache settings changed; starting with an empty index")
+            self._reset()
+            return
+        try:
+            # memmap would quietly zero-fill a short file, so check its size first
+            size = self._vectors_path().stat().st_size
+            if size < self.capacity * index["dimensions"] * np.dtype(np.float32).itemsize:
+                raise ValueError(f"vectors.f32 holds only {size} bytes")
+            self._open_vectors(index["dimensions"], "r+")
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Semantic cache vectors are unusable ({str(e)}); starting with an empty index")
+            self._reset()
+            return
+        for path in self.slots_dir.glob("*.json"):
+            try:
+                slot = int(path.stem)
+                entry = json.loads(path.read_text(encoding="utf-8"))
+                mtime = path.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            if 0 <= slot < self.capacity:
+                self._scopes[slot] = entry["scope"]
+                self._valid[slot] = True
+                self._last_used[slot] = mtime
+                self._rows = max(self._rows, slot + 1)
+
+    def _open_vectors(self, dimensions: int, mode: str):
+        self._vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode=mode,
+                                  shape=(self.capacity, dimensions))
+
+    def _reset(self):
+        for path in self.slots_dir.glob("*.json"):
+            path.unlink()
+        self._vectors = None
+        self._valid[:] = False
+        self._rows = 0
+        try:
+            self._index_path().unlink()
+        except FileNotFoundError:
+            pass
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embed(prompt), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, prompt: str, scope: int) -> Dict[str, Any]:
+        """
+        Find the most similar cached prompt in the same scope
+
+        Returns:
+            dict: ``vector`` (reusable for ``put``), ``similarity`` of the best
+            match and, on a hit, the cached ``response`` and ``prompt``
+        """
+        vector = self._embed(prompt)
+        with self._lock:
+            result = {"vector": vector, "similarity": 0.0}
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return result
+            rows = self._rows
+            if not rows:
+                self.misses += 1
+                return result
+            similarities = self._vectors[:rows] @ vector
+            similarities[~self._valid[:rows] | (self._scopes[:rows] != scope)] = -1.0
+            slot = int(np.argmax(similarities))
+            result["similarity"] = similarity = float(similarities[slot])
+            if similarity > -1.0:
+                self._similarities.append(similarity)
+            if similarity < self.threshold:
+                self.misses += 1
+                return result
+            try:
+                entry = json.loads(self._slot_path(slot).read_text(encoding="utf-8"))
+                os.utime(self._slot_path(slot))
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Dropping unreadable semantic cache slot {slot}: {str(e)}")
+                self._valid[slot] = False
+                self.misses += 1
+                return result
+            self._last_used[slot] = time.time()
+            self.hits += 1
+            result.update(prompt=entry["prompt"], response=entry["response"])
+            return result
+
+    def put(self, prompt: str, scope: int, response: str, vector: Optional[np.ndarray] = None):
+        """Cache a reply, reusing the least recently used slot when full"""
+        if vector is None:
+            vector = self._embed(prompt)
+        with self._lock:
+            if self._vectors is None:
+                self._open_vectors(vector.shape[0], "w+")
+                self._index_path().write_text(json.dumps({
+                    "capacity": self.capacity,
+                    "dimensions": int(vector.shape[0]),
+                    "embed_id": self.embed_id,
+                }), encoding="utf-8")
+            elif self._vectors.shape[1] != vector.shape[0]:
+                self.logger.warning("Embedding size changed; not caching this reply")
+                return
+
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            path = self._slot_path(slot)
+            tmp = path.with_suffix(".tmp")
+            try:
+                tmp.write_text(json.dumps({"scope": scope, "prompt": prompt, "response": response},
+                                          ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, path)
+            except OSError as e:
+                self.logger.warning(f"Could not write semantic cache slot {slot}: {str(e)}")
+                return
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._valid[slot] = True
+            self._last_used[slot] = time.time()
+            self._rows = max(self._rows, slot + 1)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            similarities = sorted(self._similarities)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": int(self._valid.sum()),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "similarity_p50": percentile(similarities, 0.5),
+                "similarity_p95": percentile(similarities, 0.95),
+            }
@@ -0,0 +1,158 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List
+
+from utils.history import estimate_tokens
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session, id);
+"""
+
+_STOP = object()
+
+
+class SessionStore:
+    """
+    SQLite-backed store of named conversations
+
+    Writes go through a background thread so recording a turn never blocks
+    the chat. Reads use their own connection; WAL mode lets them run while
+    the writer is busy.
+    """
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.executescript(SCHEMA)
+        self._read_lock = threading.Lock()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Commit everything that queued up meanwhile in one transaction
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(entry is _STOP for entry in batch)
+            rows = [entry for entry in batch if entry is not _STOP]
+            try:
+                if rows:
+                    self._write(connection, rows)
+            except sqlite3.Error as e:
+                self.logger.error(f"Failed to persist {len(rows)} session messages: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, rows: List[tuple]):
+        counts: Dict[str, List[float]] = {}
+        for session, _, _, created in rows:
+            count = counts.setdefault(session, [0, created])
+            count[0] += 1
+            count[1] = created
+        with connection:
+            connection.executemany(
+                "INSERT INTO messages (session, role, content, tokens, created) VALUES (?, ?, ?, ?, ?)",
+                [(session, role, content, estimate_tokens(content), created)
+                 for session, role, content, created in rows]
+            )
+            for session, (added, updated) in counts.items():
+                connection.execute(
+                    "INSERT INTO sessions (name, created, updated, messages) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET updated = excluded.updated, "
+                    "messages = messages + excluded.messages",
+                    (session, updated, updated, added)
+                )
+
+    def append(self, session: str, message: Dict[str, str]):
+        """Queue a message for writing; returns immediately"""
+        self._queue.put((session, message["role"], message["content"], time.time()))
+
+    def flush(self):
+        """Block until every queued message has been written"""
+        self._queue.join()
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """Return stored sessions, most recently updated first"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT name, created, updated, messages FROM sessions ORDER BY updated DESC"
+            ).fetchall()
+        return [{"name": name, "created": created, "updated": updated, "messages": messages}
+                for name, created, updated, messages in rows]
+
+    def load_recent(self, session: str, max_tokens: int) -> List[Dict[str, str]]:
+        """
+        Load the newest messages of a session that fit in ``max_tokens``
+
+        Rows are read newest-first through the (session, id) index and the
+        scan stops at the budget, so the cost does not depend on the length
+        of the full transcript.
+
+        Returns:
+            list: Messages in chronological order, starting with a user turn
+        """
+        messages = []
+        used = 0
+        with self._read_lock:
+            cursor = self._reader.execute(
+                "SELECT role, content, tokens FROM messages WHERE session = ? ORDER BY id DESC",
+                (session,)
+            )
+            for role, content, tokens in cursor:
+                if messages and used + tokens > max_tokens:
+                    break
+                messages.append({"role": role, "content": content})
+                used += tokens
+            cursor.close()
+        messages.reverse()
+        while messages and messages[0]["role"] != "user":
+            messages.pop(0)
+        return messages
+
+    def delete(self, session: str):
+        self.flush()
+        with self._read_lock, self._reader:
+            self._reader.execute("DELETE FROM messages WHERE session = ?", (session,))
+            self._reader.execute("DELETE FROM sessions WHERE name = ?", (session,))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
@@ -0,0 +1,313 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from utils.cache import make_cache_key
+
+# Seconds between checks of a waiting caller's cancel event
+CANCEL_POLL_INTERVAL = 0.05
+
+
+class Detached(Exception):
+    """Raised to a caller whose cancel event was set while it shared a request"""
+
+
+def flight_key(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Key under which identical requests are coalesced, or None if they must not be
+
+    Only greedy decoding (temperature 0) is coalesced: with sampling, two
+    identical requests are expected to produce different replies.
+    """
+    if payload["options"].get("temperature", 0.8) > 0:
+        return None
+    kind = "stream" if payload.get("stream") else "once"
+    return f"{kind}:{make_cache_key(payload['model'], payload['options'], payload['messages'])}"
+
+
+class _Call:
+    """One upstream request and what it has produced so far"""
+
+    def __init__(self):
+        self.items = []
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        # Callers still reading; the request is stopped when the last one leaves
+        self.subscribers = 1
+        # Stops the upstream request (thread flights)
+        self.stop: Optional[Callable[[], None]] = None
+        # asyncio.Event, replaced after every change, and the task making the request (async flights)
+        self.changed = None
+        self.task = None
+
+
+class _Counters:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced}
+
+
+def _shared_error(error: BaseException) -> BaseException:
+    # Whatever stopped the upstream worker itself must not reach the callers as such
+    if isinstance(error, Exception):
+        return error
+    return RuntimeError("The shared upstream request was cancelled")
+
+
+class SingleFlight(_Counters):
+    """
+    Coalesce concurrent identical requests onto one upstream call (threads)
+
+    The first caller for a key starts the request in a background thread;
+    callers that arrive while it is running wait for, and share, its result.
+    Streams are replayed to every caller chunk by chunk, from the beginning.
+    A caller that is cancelled or stops reading only leaves the flight: the
+    request carries on for the others and is stopped when the last one leaves.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._calls: Dict[str, _Call] = {}
+
+    def _join(self, key: str) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.subscribers += 1
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _leave(self, key: str, call: _Call):
+        with self._lock:
+            call.subscribers -= 1
+            abandoned = call.subscribers == 0 and not call.done
+            if abandoned and self._calls.get(key) is call:
+                del self._calls[key]
+        if abandoned and call.stop is not None:
+            call.stop()
+
+    def _finish(self, key: str, call: _Call, error: Optional[BaseException] = None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.error = None if error is None else _shared_error(error)
+            call.done = True
+            self._changed.notify_all()
+
+    def _start(self, key: str, call: _Call, work: Callable[[], None],
+               stop: Optional[Callable[[], None]]):
+        call.stop = stop
+
+        def run():
+            try:
+                work()
+            except BaseException as e:
+                self._finish(key, call, e)
+                return
+            self._finish(key, call)
+
+        threading.Thread(target=run, name=f"singleflight-{self.leaders}", daemon=True).start()
+
+    def _wait(self, call: _Call, ready: Callable[[], bool], cancelled: Optional[threading.Event]):
+        # The cancel flag is a plain Event, so wake up now and then to look at it
+        with self._lock:
+            while not ready():
+                if cancelled is not None and cancelled.is_set():
+                    raise Detached()
+                self._changed.wait(CANCEL_POLL_INTERVAL)
+
+    def do(self, key: str, fn: Callable[[], Any], cancelled: Optional[threading.Event] = None,
+           stop: Optional[Callable[[], None]] = None) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` once for all concurrent callers with the same key
+
+        Args:
+            key (str): Flight key, see ``flight_key``
+            fn (callable): Makes the request; runs in a background thread
+            cancelled (threading.Event): The caller's cancel flag; once set the
+                caller stops waiting and gets Detached
+            stop (callable): Stops the request started by ``fn``; called when
+                every caller has left before it finished
+
+        Returns:
+            tuple: The result and whether it was shared from another caller
+        """
+        call, leader = self._join(key)
+        if leader:
+            def work():
+                call.result = fn()
+            self._start(key, call, work, stop)
+        try:
+            self._wait(call, lambda: call.done, cancelled)
+        finally:
+            self._leave(key, call)
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def stream(self, key: str, open_stream: Callable[[], Iterator[Any]],
+               cancelled: Optional[threading.Event] = None,
+               stop: Optional[Callable[[], None]] = None) -> Tuple[Iterator[Any], bool]:
+        """
+        Share one upstream stream between concurrent callers with the same key
+
+        A caller whose ``cancelled`` flag is set gets Detached at its next
+        item, and closing the returned iterator leaves the flight; see ``do``.
+
+        Returns:
+            tuple: An iterator over the stream's items and whether it is shared
+        """
+        call, leader = self._join(key)
+        if leader:
+            def work():
+                for item in open_stream():
+                    with self._lock:
+                        call.items.append(item)
+                        self._changed.notify_all()
+            self._start(key, call, work, stop)
+        return self._follow(key, call, cancelled), not leader
+
+    def _follow(self, key: str, call: _Call, cancelled: Optional[threading.Event]) -> Iterator[Any]:
+        index = 0
+        try:
+            while True:
+                self._wait(call, lambda: index < len(call.items) or call.done, cancelled)
+                with self._lock:
+                    items = call.items[index:]
+                    done = call.done
+                for item in items:
+                    if cancelled is not None and cancelled.is_set():
+                        raise Detached()
+                    index += 1
+                    yield item
+                if done and index == len(call.items):
+                    if call.error is not None:
+                        raise call.error
+                    return
+        finally:
+            self._leave(key, call)
+
+
+class AsyncSingleFlight(_Counters):
+    """asyncio counterpart of SingleFlight; the request runs in a task"""
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[str, _Call] = {}
+        # Running tasks, referenced so they are not collected mid-request
+        self._tasks = set()
+
+    def _join(self, key: str) -> Tuple[_Call, bool]:
+        call = self._calls.get(key)
+        if call is not None:
+            call.subscribers += 1
+            self.coalesced += 1
+            return call, False
+        call = self._calls[key] = _Call()
+        call.changed = asyncio.Event()
+        self.leaders += 1
+        return call, True
+
+    def _leave(self, key: str, call: _Call):
+        call.subscribers -= 1
+        if call.subscribers == 0 and not call.done:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.task.cancel()
+
+    @staticmethod
+    def _notify(call: _Call):
+        # Wake current waiters and arm a fresh event for the next change
+        call.changed.set()
+        call.changed = asyncio.Event()
+
+    @staticmethod
+    async def _wait(call: _Call):
+        # Wake up now and then to notice the caller's cancel flag, which is a threading.Event
+        try:
+            await asyncio.wait_for(call.changed.wait(), CANCEL_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    def _finish(self, key: str, call: _Call, error: Optional[BaseException] = None):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        call.error = None if error is None else _shared_error(error)
+        call.done = True
+        self._notify(call)
+
+    def _start(self, key: str, call: _Call, work: Callable[[], Awaitable[None]]):
+        async def run():
+            try:
+                await work()
+            except BaseException as e:
+                self._finish(key, call, e)
+                return
+            self._finish(key, call)
+
+        call.task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(call.task)
+        call.task.add_done_callback(self._tasks.discard)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 cancelled: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """See ``SingleFlight.do``; the request task is cancelled when every caller has left"""
+        call, leader = self._join(key)
+        if leader:
+            async def work():
+                call.result = await fn()
+            self._start(key, call, work)
+        try:
+            while not call.done:
+                if cancelled is not None and cancelled.is_set():
+                    raise Detached()
+                await self._wait(call)
+        finally:
+            self._leave(key, call)
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def stream(self, key: str, open_stream: Callable[[], AsyncIterator[Any]],
+               cancelled: Optional[threading.Event] = None) -> Tuple[AsyncIterator[Any], bool]:
+        """See ``SingleFlight.stream``"""
+        call, leader = self._join(key)
+        if leader:
+            async def work():
+                async for item in open_stream():
+                    call.items.append(item)
+                    self._notify(call)
+            self._start(key, call, work)
+        return self._follow(key, call, cancelled), not leader
+
+    async def _follow(self, key: str, call: _Call,
+                      cancelled: Optional[threading.Event]) -> AsyncIterator[Any]:
+        index = 0
+        try:
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    raise Detached()
+                if index == len(call.items) and not call.done:
+                    await self._wait(call)
+                    continue
+                items = call.items[index:]
+                for item in items:
+                    if cancelled is not None and cancelled.is_set():
+                        raise Detached()
+                    index += 1
+                    yield item
+                if call.done and index == len(call.items):
+                    if call.error is not None:
+                        raise call.error
+                    return
+        finally:
+            self._leave(key, call)
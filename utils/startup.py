@@ -0,0 +1,62 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+
+class StartupProfiler:
+    """
+    Collect a timing breakdown of process startup for ``--profile-startup``
+
+    Phases may finish on other threads (e.g. the background server probe);
+    they are reported in the order they completed.
+    """
+
+    def __init__(self, started: Optional[float] = None, enabled: bool = True):
+        """
+        Args:
+            started (float): ``time.perf_counter()`` taken before the entry point's imports
+            enabled (bool): Record nothing when False
+        """
+        self.started = time.perf_counter() if started is None else started
+        self.enabled = enabled
+        self._phases: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, began: float, ended: Optional[float] = None):
+        """Record a phase that ran from ``began`` to ``ended`` (perf_counter values)"""
+        if not self.enabled:
+            return
+        ended = time.perf_counter() if ended is None else ended
+        with self._lock:
+            self._phases.append((name, began, ended))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, began)
+
+    def mark(self, name: str):
+        """Record a milestone, measured from process start"""
+        self.record(name, self.started)
+
+    def report(self) -> str:
+        with self._lock:
+            phases = sorted(self._phases, key=lambda phase: phase[2])
+        lines = [f"{'phase':<32} {'took':>9} {'done at':>9}"]
+        for name, began, ended in phases:
+            lines.append(f"{name:<32} {(ended - began) * 1000:>7.1f}ms "
+                         f"{(ended - self.started) * 1000:>7.1f}ms")
+        return "\n".join(lines)
+
+    def print_report(self, file=None):
+        if self.enabled:
+            print(f"\nStartup profile:\n{self.report()}", file=file or sys.stderr, flush=True)
+
+
+# Disabled until an entry point turns it on
+profiler = StartupProfiler(enabled=False)
@@ -0,0 +1,174 @@
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+# Bound on cached word widths per font; long sessions see an open vocabulary
+MAX_CACHED_WORDS = 20000
+
+_metrics: Dict[Hashable, "FontMetrics"] = {}
+
+
+class FontMetrics:
+    """Cached advance widths for one pygame font"""
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs: Dict[str, int] = {}
+        self._words: Dict[str, int] = {}
+        self.space_width = self.glyph_width(" ")
+        self.line_height = font.get_linesize()
+
+    def glyph_width(self, char: str) -> int:
+        width = self._glyphs.get(char)
+        if width is None:
+            metrics = self.font.metrics(char)
+            if metrics and metrics[0] is not None:
+                width = metrics[0][4]  # advance
+            else:
+                width = self.font.size(char)[0]
+            self._glyphs[char] = width
+        return width
+
+    def word_width(self, word: str) -> int:
+        width = self._words.get(word)
+        if width is None:
+            if len(self._words) >= MAX_CACHED_WORDS:
+                self._words.clear()
+            width = self.font.size(word)[0]
+            self._words[word] = width
+        return width
+
+    def text_width(self, text: str) -> int:
+        """Width of ``text`` summed from cached glyph advances"""
+        return sum(self.glyph_width(char) for char in text)
+
+
+def get_metrics(font, key: Hashable) -> FontMetrics:
+    """
+    Return the shared FontMetrics for a font
+
+    Args:
+        font: A pygame font
+        key: Identifies the typeface, e.g. ``("Arial", 16)``; fonts loaded
+            with the same key share one set of cached widths
+    """
+    metrics = _metrics.get(key)
+    if metrics is None:
+        metrics = FontMetrics(font)
+        _metrics[key] = metrics
+    return metrics
+
+
+class TextLayout:
+    """Wrapped lines of a piece of text and the width each one occupies"""
+
+    __slots__ = ("lines", "widths", "max_width", "line_height")
+
+    def __init__(self, lines: List[str], widths: List[int], max_width: int, line_height: int):
+        self.lines = lines
+        self.widths = widths
+        self.max_width = max_width
+        self.line_height = line_height
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        return iter(zip(self.lines, self.widths))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+def _break_token(token: str, metrics: FontMetrics, max_width: int,
+                 max_chars: Optional[int]) -> List[Tuple[str, int]]:
+    """Split a token that cannot fit on one line at glyph boundaries"""
+    pieces = []
+    start = 0
+    width = 0
+    for i, char in enumerate(token):
+        advance = metrics.glyph_width(char)
+        too_wide = width + advance > max_width
+        too_long = max_chars is not None and i - start >= max_chars
+        if i > start and (too_wide or too_long):
+            pieces.append((token[start:i], width))
+            start = i
+            width = 0
+        width += advance
+    pieces.append((token[start:], width))
+    return pieces
+
+
+def wrap_text(text: str, metrics: FontMetrics, max_width: int,
+              max_chars: Optional[int] = None) -> TextLayout:
+    """
+    Greedy word wrap in a single pass over the words
+
+    Each word is measured once (and usually served from the cache), so the
+    cost is linear in the length of the text. Words wider than a whole line,
+    such as URLs, are broken between glyphs.
+
+    Args:
+        text (str): Text to wrap; runs of whitespace collapse to one space
+        metrics (FontMetrics): Metrics of the font the text is drawn with
+        max_width (int): Line width limit in pixels
+        max_chars (int): Optional line length limit in characters
+
+    Returns:
+        TextLayout: The wrapped lines
+    """
+    lines: List[str] = []
+    widths: List[int] = []
+    line: List[str] = []
+    line_width = 0
+    line_chars = 0
+
+    def flush():
+        if line:
+            lines.append(" ".join(line))
+            widths.append(line_width)
+
+    for word in text.split():
+        word_width = metrics.word_width(word)
+        if word_width > max_width or (max_chars is not None and len(word) > max_chars):
+            flush()
+            pieces = _break_token(word, metrics, max_width, max_chars)
+            for piece, piece_width in pieces[:-1]:
+                lines.append(piece)
+                widths.append(piece_width)
+            last, line_width = pieces[-1]
+            line = [last]
+            line_chars = len(last)
+            continue
+
+        if not line:
+            line = [word]
+            line_width = word_width
+            line_chars = len(word)
+            continue
+
+        candidate_width = line_width + metrics.space_width + word_width
+        candidate_chars = line_chars + 1 + len(word)
+        if candidate_width > max_width or (max_chars is not None and candidate_chars > max_chars):
+            flush()
+            line = [word]
+            line_width = word_width
+            line_chars = len(word)
+        else:
+            line.append(word)
+            line_width = candidate_width
+            line_chars = candidate_chars
+
+    flush()
+    return TextLayout(lines, widths, max_width, metrics.line_height)
+
+
+def wrap_code(text: str, metrics: FontMetrics, max_width: int) -> TextLayout:
+    """
+    Hard-wrap preformatted lines at glyph boundaries
+
+    Whitespace is preserved; a source line wider than ``max_width`` continues
+    on the next layout line.
+    """
+    lines: List[str] = []
+    widths: List[int] = []
+    for source_line in text.split("\n"):
+        for piece, width in _break_token(source_line, metrics, max_width, None):
+            lines.append(piece)
+            widths.append(width)
+    return TextLayout(lines, widths, max_width, metrics.line_height)
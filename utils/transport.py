@@ -0,0 +1,159 @@
+import logging
+import random
+import socket
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: the server is overloaded or temporarily broken.
+# Every other 4xx means the request itself is wrong and will fail again.
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+_shared_transports: Dict[Tuple, "HttpTransport"] = {}
+_shared_lock = threading.Lock()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True if a failed request may succeed when sent again"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError))
+
+
+def abort(response: requests.Response):
+    """
+    Cut a streaming response off from another thread
+
+    Shutting the socket down wakes the thread blocked reading it, which then
+    fails and closes the response itself, and the server sees the client go
+    away. (Closing the response from here instead would not be thread-safe.)
+    """
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        # Already closed
+        pass
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """
+    Exponential backoff with full jitter
+
+    Args:
+        attempt (int): Zero-based index of the attempt that just failed
+        base (float): Delay in seconds for the first retry
+        maximum (float): Upper bound for any single delay
+
+    Returns:
+        float: Seconds to sleep before the next attempt
+    """
+    if base <= 0:
+        return 0.0
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class HttpTransport:
+    """Keep-alive HTTP session with a bounded connection pool and retries"""
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0, retry_attempts: int = 3,
+                 retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    def request(self, method: str, url: str, json: Optional[Dict[str, Any]] = None,
+                stream: bool = False, retry: bool = True,
+                timeout: Optional[float] = None) -> requests.Response:
+        """
+        Send a request, retrying transient failures with backoff
+
+        For streaming requests the retry loop ends as soon as the response
+        headers have arrived; errors while reading the body are the caller's.
+
+        Args:
+            method (str): HTTP method
+            url (str): Absolute URL
+            json (dict): Optional JSON body
+            stream (bool): Return before the body has been read
+            retry (bool): Allow retries at all
+            timeout (float): Connect and read timeout in seconds instead of the configured ones
+
+        Returns:
+            requests.Response: A response with a successful status code
+        """
+        attempts = self.retry_attempts if retry else 1
+        for attempt in range(attempts):
+            try:
+                response = self.session.request(method, url, json=json, stream=stream,
+                                                timeout=self.timeout if timeout is None else timeout)
+                if not response.ok:
+                    # A streamed error body is never read, so give the connection back now
+                    response.close()
+                response.raise_for_status()
+                response.retries = attempt
+                return response
+            except requests.exceptions.RequestException as e:
+                if attempt == attempts - 1 or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, self.retry_delay, self.max_retry_delay)
+                self.logger.warning(
+                    f"Request attempt {attempt + 1} failed: {str(e)}; retrying in {delay:.2f}s"
+                )
+                time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, json: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, json=json, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_transport(api_config: Dict[str, Any]) -> HttpTransport:
+    """
+    Return the process-wide transport for the given [api] settings
+
+    Clients configured identically share one connection pool, so opening
+    several chats does not multiply the number of sockets to Ollama.
+    """
+    settings = (
+        api_config.get("pool_size", 10),
+        api_config.get("connect_timeout", 5),
+        api_config.get("request_timeout", 60),
+        api_config.get("retry_attempts", 3),
+        api_config.get("retry_delay", 1),
+        api_config.get("max_retry_delay", 30),
+    )
+    with _shared_lock:
+        transport = _shared_transports.get(settings)
+        if transport is None:
+            transport = HttpTransport(*settings)
+            _shared_transports[settings] = transport
+        return transport